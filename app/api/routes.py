@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 
 from celery.result import AsyncResult
 
 from opendss_powerflow_service.app.core.celery_app import app as celery_app
+from opendss_powerflow_service.app.core.dispatch import dispatch_powerflow
+from opendss_powerflow_service.app.core import admission
 from opendss_powerflow_service.utils.log import get_logger
 from opendss_powerflow_service.database.engine import get_db
-from opendss_powerflow_service.app.tasks import circuit_tasks, powerflow_tasks
-from opendss_powerflow_service.models.params import SimulationParams
+from opendss_powerflow_service.app.tasks import circuit_tasks, powerflow_tasks, batch_tasks
+from opendss_powerflow_service.models.params import SimulationParams, BatchPowerflowParams, ProbabilisticParams
+from opendss_powerflow_service.models import spatial
+from opendss_powerflow_service.models.columnar import CircuitSchemaError
+from opendss_powerflow_service.utils.metrics import registry as metrics_registry
 
 router = APIRouter()
 logger = get_logger('api_routes')
@@ -18,38 +26,174 @@ def get_circuits_list(db: Session = Depends(get_db)):
     return {"circuit_list": circuit_list}
 
 @router.get("/circuit/{circuit_id}", tags=["Circuit"])
-def get_circuit(circuit_id: str, db: Session = Depends(get_db)):
-    circuit_model = circuit_tasks.read_circuit(circuit_id)
+def get_circuit(circuit_id: str, include: str = None, db: Session = Depends(get_db)):
+    include = [i.strip() for i in include.split(',') if i.strip()] if include else None
+    circuit_model = circuit_tasks.read_circuit(circuit_id, include)
     if circuit_model is None:
         raise HTTPException(status_code=404, detail="Circuit not found")
     return circuit_model
 
+def _circuit_geometry(db, circuit_id):
+    geometry = spatial.get_circuit_geometry(db, circuit_id)
+    if geometry is None:
+        raise HTTPException(status_code=404, detail="Circuit not found")
+    return geometry
+
+def _parse_bbox(bbox):
+    try:
+        minx, miny, maxx, maxy = (float(i) for i in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minx,miny,maxx,maxy")
+    return minx, miny, maxx, maxy
+
+@router.get("/circuit/{circuit_id}/geojson", tags=["Circuit"])
+def get_circuit_geojson(circuit_id: str, bbox: Optional[str] = None, results: bool = False, db: Session = Depends(get_db)):
+    geometry = _circuit_geometry(db, circuit_id)
+    ids = geometry.query(_parse_bbox(bbox) if bbox else None)
+    result_properties = spatial.latest_result_properties(db, circuit_id, geometry, ids) if results else None
+    return StreamingResponse(spatial.iter_geojson(geometry, ids, result_properties), media_type="application/geo+json")
+
+@router.get("/circuit/{circuit_id}/tiles/{z}/{x}/{y}", tags=["Circuit"])
+def get_circuit_tile(circuit_id: str, z: int, x: int, y: int, results: bool = False, db: Session = Depends(get_db)):
+    geometry = _circuit_geometry(db, circuit_id)
+    bbox = spatial.tile_bounds(z, x, y)
+    ids = geometry.query(bbox)
+    result_properties = spatial.latest_result_properties(db, circuit_id, geometry, ids) if results else None
+    tile = spatial.encode_vector_tile(geometry, ids, bbox, result_properties)
+    if tile is None:
+        # mapbox_vector_tile is optional, fall back to a GeoJSON tile
+        return StreamingResponse(spatial.iter_geojson(geometry, ids, result_properties), media_type="application/geo+json")
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
+
+def _validate(circuit_id, circuit_data):
+    try:
+        _, report = circuit_tasks.validate_circuit_data(circuit_id, circuit_data)
+    except CircuitSchemaError as e:
+        raise HTTPException(status_code=422, detail={'circuit': circuit_id, 'ok': False, 'schema_errors': e.errors})
+    if not report.ok:
+        raise HTTPException(status_code=422, detail=report.to_dict())
+
+@router.get("/circuit/{circuit_id}/validate", tags=["Circuit"])
+def validate_circuit(circuit_id: str, db: Session = Depends(get_db)):
+    report = circuit_tasks.validate_stored_circuit(circuit_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Circuit not found")
+    return report
+
 @router.post("/circuit/{circuit_id}", tags=["Circuit"])
 def create_circuit(circuit_id: str, circuit_data: dict, db: Session = Depends(get_db)):
+    _validate(circuit_id, circuit_data)
     message = circuit_tasks.create_circuit.delay(circuit_id, circuit_data)
     return message
 
 @router.put("/circuit/{circuit_id}", tags=["Circuit"])
 def update_circuit(circuit_id: str, circuit_data: dict, db: Session = Depends(get_db)):
+    _validate(circuit_id, circuit_data)
     result = circuit_tasks.update_circuit.delay(circuit_id, circuit_data)
     return {"message": "Circuit Updated Initiated", "result": result}
     
+def _admit(priority_class, n_tasks=1):
+    try:
+        admission.admit(priority_class, n_tasks)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@router.get("/powerflow/queues", tags=["Powerflow"])
+def get_queue_status():
+    return admission.queue_status()
+
+@router.post("/powerflow/batch", tags=["Powerflow"])
+def batch_powerflow(batch_params: BatchPowerflowParams, db:Session = Depends(get_db)):
+    circuit_ids = batch_tasks.resolve_batch_circuits(batch_params.substation, batch_params.circuits)
+    if not circuit_ids:
+        raise HTTPException(status_code=404, detail="No circuits found for batch")
+    _admit('batch', len(circuit_ids))
+    return batch_tasks.submit_batch(circuit_ids, batch_params.simulation_params.model_dump_json())
+
+@router.get("/powerflow/batch/{batch_id}", tags=["Powerflow"])
+def get_batch_status(batch_id: str, db:Session = Depends(get_db)):
+    progress = batch_tasks.batch_progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress
+
+@router.post("/powerflow/faultstudy/{circuit_id}", tags=["Powerflow"])
+def run_fault_study(circuit_id: str, db:Session = Depends(get_db)):
+    _admit('interactive')
+    task = powerflow_tasks.run_fault_study.delay(circuit_id)
+    return {"task_id": str(task.id)}
+
+@router.get("/powerflow/faultstudy/result/{run_id}", tags=["Powerflow"])
+def get_fault_results(run_id: int, db:Session = Depends(get_db)):
+    return powerflow_tasks.get_fault_results(run_id)
+
+@router.post("/powerflow/probabilistic/{circuit_id}", tags=["Powerflow"])
+def run_probabilistic_powerflow(circuit_id: str, params: ProbabilisticParams, db:Session = Depends(get_db)):
+    _admit('timeseries')
+    task = powerflow_tasks.run_probabilistic_powerflow.delay(circuit_id, params.model_dump_json())
+    return {"task_id": str(task.id)}
+
+@router.get("/powerflow/probabilistic/result/{run_id}", tags=["Powerflow"])
+def get_probabilistic_results(run_id: int, db:Session = Depends(get_db)):
+    return powerflow_tasks.get_probabilistic_results(run_id)
+
 @router.post("/powerflow/{circuit_id}", tags=["Powerflow"])
 def powerflow(circuit_id: str, simulation_params: SimulationParams, db:Session = Depends(get_db)):
-    task = powerflow_tasks.run_powerflow.delay(circuit_id, simulation_params.model_dump_json())
-    return {"task_id": str(task.id)}
+    return dispatch_powerflow(db, powerflow_tasks.run_powerflow, circuit_id, simulation_params.model_dump_json(),
+                              before_enqueue=lambda: _admit('interactive'))
 
 @router.post("/powerflow/timeseres_powerflow/{circuit_id}", tags=["Powerflow"])
 def run_timeseres_powerflow(circuit_id: str, simulation_params: dict, db:Session = Depends(get_db)):
-    task = powerflow_tasks.run_powerflow.delay(circuit_id, simulation_params)
+    _admit('timeseries')
+    task = powerflow_tasks.run_timeseres_powerflow.delay(circuit_id, simulation_params)
     return {"task_id": str(task.id)}
 
+@router.get("/powerflow/timeseries/{run_id}/{quantity}", tags=["Powerflow"])
+def get_timeseries_window(run_id: int, quantity: str, start: int = 0, stop: Optional[int] = None, elements: Optional[str] = None, db:Session = Depends(get_db)):
+    elements = [i.strip() for i in elements.split(',') if i.strip()] if elements else None
+    try:
+        window = powerflow_tasks.get_timeseries_window(run_id, quantity, start, stop, elements)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if window is None:
+        raise HTTPException(status_code=404, detail="Time-series run not found")
+    return window
+
 @router.get("/powerflow/status/{task_id}", tags=["Powerflow"])
 async def get_status(task_id: str, db:Session = Depends(get_db)):
     result = AsyncResult(task_id, app=celery_app)
     return {"task_id": task_id, "status": result.status, "result": result.result}
 
 @router.get("/powerflow/result/{circuit_id}", tags=["Powerflow"])
-def get_powerflow_results(circuit_id: str, db:Session = Depends(get_db)):
-    results = powerflow_tasks.get_powerflow_results(circuit_id)
-    return results
\ No newline at end of file
+def get_powerflow_results(circuit_id: str, run_id: Optional[int] = None, db:Session = Depends(get_db)):
+    results = powerflow_tasks.get_powerflow_results(circuit_id, run_id)
+    return results
+
+@router.get("/powerflow/runs/{circuit_id}", tags=["Powerflow"])
+def get_powerflow_runs(circuit_id: str, limit: int = 100, before_run_id: Optional[int] = None, db:Session = Depends(get_db)):
+    return powerflow_tasks.get_powerflow_runs(circuit_id, limit, before_run_id)
+
+@router.get("/powerflow/summary", tags=["Powerflow"])
+def get_run_summaries(circuits: Optional[str] = None, substation: Optional[str] = None, db:Session = Depends(get_db)):
+    circuits = [i.strip() for i in circuits.split(',') if i.strip()] if circuits else None
+    if not circuits and substation is None:
+        raise HTTPException(status_code=400, detail="Pass circuits or a substation")
+    return powerflow_tasks.get_run_summaries(circuits, substation)
+
+@router.get("/powerflow/losses/{run_id}", tags=["Powerflow"])
+def get_loss_report(run_id: int, top_n: int = Query(default=20, ge=0), db:Session = Depends(get_db)):
+    report = powerflow_tasks.get_loss_report(run_id, top_n)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return report
+
+@router.get("/powerflow/compare/{run_a}/{run_b}", tags=["Powerflow"])
+def compare_powerflow_runs(run_a: int, run_b: int, top_n: int = Query(default=20, ge=0), db:Session = Depends(get_db)):
+    diff = powerflow_tasks.compare_powerflow_runs(run_a, run_b, top_n)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return diff
+
+@router.get("/metrics", tags=["Monitoring"], response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics_registry.expose(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
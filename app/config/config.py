@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import PostgresDsn, field_validator
 from pydantic_settings  import BaseSettings
 
@@ -13,6 +13,28 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
     OPENDSS_INSTALL_DIR: str = 'C:\\Program Files\\OpenDSS\\'
+    POWERFLOW_WORKER_METRICS_PORT: int = 9101
+    CIRCUIT_WORKER_METRICS_PORT: int = 9110
+    POWERFLOW_CHILD_METRICS_PORT: int = 9200
+    RESULT_RETENTION_DAYS: Optional[int] = 90
+    RESULT_RETENTION_RUNS: Optional[int] = None
+    INFLIGHT_REGISTRY: str = 'db'
+    INFLIGHT_TTL_SECONDS: int = 900
+    INFLIGHT_PENDING_GRACE_SECONDS: int = 120
+    WARM_ENGINES: int = 4
+    PRELOAD_CIRCUITS: List[str] = []
+    PRELOAD_BUDGET_SECONDS: int = 60
+    WORKER_PROC_ALIVE_TIMEOUT: int = 180
+    COLUMNAR_CIRCUITS: int = 32
+    TIMESERIES_STORE_DIR: str = './tmp/timeseries/'
+    QSTS_MAX_PROCESSES: Optional[int] = None
+    LOADSHAPE_STORE_DIR: str = './tmp/loadshapes/'
+    EXPORT_DIR: str = './tmp/exports/'
+    LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: str = 'json'
+    LOG_SAMPLE_RATE: float = 0.01
+    AFFINITY_MEMBERSHIP_TTL_SECONDS: int = 30
+    AFFINITY_MESSAGE_TTL_SECONDS: int = 60
 
     @field_validator("SQLALCHEMY_DATABASE_URI", mode='before')
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
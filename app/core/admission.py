@@ -0,0 +1,106 @@
+import math
+import time
+
+from amqp.exceptions import ChannelError
+from celery.signals import before_task_publish, task_prerun
+
+from opendss_powerflow_service.app.core import affinity
+from opendss_powerflow_service.app.core.celery_app import app, PRIORITY_CLASSES
+from opendss_powerflow_service.utils.metrics import registry
+
+_queue_classes = {c['queue']: name for name, c in PRIORITY_CLASSES.items()}
+
+queue_wait_seconds = registry.histogram(
+    'powerflow_queue_wait_seconds', 'Time a powerflow task waited in its queue before a worker started it',
+    labelnames=('priority_class',))
+
+admission_rejections = registry.counter(
+    'powerflow_admission_rejections_total', 'Powerflow submissions rejected because the class backlog was full',
+    labelnames=('priority_class',))
+
+
+class AdmissionRejected(Exception):
+
+    def __init__(self, priority_class, depth, retry_after):
+        super().__init__(f"{priority_class} backlog is full ({depth} queued)")
+        self.priority_class = priority_class
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def priority_class_of(queue):
+    """
+    Priority class of the queue a task was delivered from, affinity queues are named <class queue>.<worker>
+    """
+    if not queue:
+        return None
+    return _queue_classes.get(queue.partition('.')[0])
+
+def queue_depth(queue):
+    """
+    Messages waiting in a queue, a queue that was not declared yet (fresh broker, departed worker) holds none
+    """
+    with app.connection_for_read() as conn:
+        try:
+            return conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+        except ChannelError:
+            return 0
+
+def class_queue_depth(priority_class):
+    """
+    Backlog of a priority class: its shared queue plus the affinity queues of its workers
+    """
+    class_queue = PRIORITY_CLASSES[priority_class]['queue']
+    depth = queue_depth(class_queue)
+    ring = affinity.router.ring(app, class_queue)
+    for worker in (ring.members if ring is not None else ()):
+        depth += queue_depth(affinity.affinity_queue_name(class_queue, worker))
+    return depth
+
+def class_depths():
+    return {name: class_queue_depth(name) for name in PRIORITY_CLASSES}
+
+def admit(priority_class, n_tasks=1):
+    """
+    Raise AdmissionRejected with a retry hint when queueing n_tasks would push the class backlog over its limit
+    """
+    config = PRIORITY_CLASSES[priority_class]
+    if app.conf.task_always_eager:
+        return
+    depth = class_queue_depth(priority_class)
+    if depth + n_tasks > config['max_backlog']:
+        admission_rejections.inc(priority_class=priority_class)
+        overflow = (depth + n_tasks) / config['max_backlog']
+        raise AdmissionRejected(priority_class, depth, int(math.ceil(config['retry_after'] * overflow)))
+
+def queue_status():
+    ret = {}
+    for name, config in PRIORITY_CLASSES.items():
+        ret[name] = {
+            'queue': config['queue'],
+            'depth': class_queue_depth(name),
+            'max_backlog': config['max_backlog'],
+            'concurrency': config['concurrency'],
+        }
+    return ret
+
+registry.gauge(
+    'powerflow_queue_depth', 'Messages waiting in each powerflow priority class queue',
+    labelnames=('priority_class',),
+    collect=lambda: {(name,): depth for name, depth in class_depths().items()})
+
+@before_task_publish.connect
+def _stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None and str(headers.get('task', '')).startswith('tasks.powerflow.'):
+        headers.setdefault('enqueued_at', time.time())
+
+@task_prerun.connect
+def _observe_queue_wait(task=None, **kwargs):
+    if task is None:
+        return
+    enqueued_at = getattr(task.request, 'enqueued_at', None) or (getattr(task.request, 'headers', None) or {}).get('enqueued_at')
+    if enqueued_at is None:
+        return
+    delivery_info = task.request.delivery_info or {}
+    priority_class = priority_class_of(delivery_info.get('routing_key')) or 'unknown'
+    queue_wait_seconds.observe(max(0.0, time.time() - float(enqueued_at)), priority_class=priority_class)
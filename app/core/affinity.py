@@ -0,0 +1,137 @@
+import os
+import time
+import bisect
+import hashlib
+import threading
+
+from kombu import Queue
+
+from opendss_powerflow_service.app.config.config import settings
+
+# Tasks whose first argument is a circuit id and which benefit from a worker that already has the circuit loaded
+AFFINITY_TASKS = {
+    'tasks.powerflow.powerflow': 'interactive',
+    'tasks.powerflow.fault_study': 'interactive',
+    'tasks.powerflow.batch_member': 'batch',
+    'tasks.powerflow.timeseries_powerflow': 'timeseries',
+    'tasks.powerflow.probabilistic': 'timeseries',
+}
+
+VIRTUAL_NODES = 64
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+def affinity_queue_name(class_queue, worker):
+    return f"{class_queue}.{worker}"
+
+def affinity_queue(class_queue, worker):
+    """
+    Per-worker queue, messages a worker does not start within the TTL are dead-lettered back to the shared class queue
+    """
+    name = affinity_queue_name(class_queue, worker)
+    return Queue(name, routing_key=name, queue_arguments={
+        'x-message-ttl': settings.AFFINITY_MESSAGE_TTL_SECONDS * 1000,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': class_queue,
+    })
+
+
+class HashRing:
+    """
+    Consistent hash ring, adding or removing a worker only moves the circuits that hashed next to it
+    """
+
+    def __init__(self, members=(), virtual_nodes=VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self.members = tuple(sorted(members))
+        points = sorted((_hash(f"{m}#{i}"), m) for m in self.members for i in range(virtual_nodes))
+        self._keys = [p[0] for p in points]
+        self._members = [p[1] for p in points]
+
+    def lookup(self, key):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._members[i]
+
+
+class AffinityRouter:
+    """
+    Routes circuit tasks to the affinity queue of the worker owning the circuit on the hash ring.
+    Membership is read from the live workers' consumed queues by a background thread every few seconds, routing
+    only reads the last snapshot and never waits on the broadcast. The ring is rebuilt when a worker joins or leaves.
+    """
+
+    def __init__(self, membership_ttl=None):
+        self.membership_ttl = membership_ttl or settings.AFFINITY_MEMBERSHIP_TTL_SECONDS
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+
+    def _discover(self, app):
+        members = {}
+        replies = app.control.inspect(timeout=1.0).active_queues() or {}
+        for queues in replies.values():
+            for queue in queues:
+                class_queue, _, worker = queue['name'].partition('.')
+                if worker:
+                    members.setdefault(class_queue, set()).add(worker)
+        return members
+
+    def refresh(self, app):
+        try:
+            members = self._discover(app)
+        except Exception:
+            # keep the last snapshot while the broker or the workers do not answer
+            return
+        rings = dict(self._rings)
+        for queue, workers in members.items():
+            if queue not in rings or rings[queue].members != tuple(sorted(workers)):
+                rings[queue] = HashRing(workers)
+        for queue in set(rings) - set(members):
+            del rings[queue]
+        self._rings = rings
+
+    def _refresh_loop(self, app):
+        while True:
+            self.refresh(app)
+            time.sleep(self.membership_ttl)
+
+    def _ensure_refresher(self, app):
+        # the thread does not survive a fork, a forked process starts its own
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid != os.getpid():
+                self._refresher_pid = os.getpid()
+                threading.Thread(target=self._refresh_loop, args=(app,), name='affinity-membership', daemon=True).start()
+
+    def ring(self, app, class_queue):
+        self._ensure_refresher(app)
+        return self._rings.get(class_queue)
+
+    def route(self, name, args, app):
+        from opendss_powerflow_service.app.core.celery_app import PRIORITY_CLASSES
+        priority_class = AFFINITY_TASKS.get(name)
+        if priority_class is None or not args:
+            return None
+        class_queue = PRIORITY_CLASSES[priority_class]['queue']
+        ring = self.ring(app, class_queue)
+        worker = ring.lookup(str(args[0])) if ring is not None else None
+        if worker is None:
+            # no affinity workers known, fall back to the shared class queue
+            return None
+        return {'queue': affinity_queue(class_queue, worker)}
+
+
+router = AffinityRouter()
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router entry point, returns None to fall through to the pattern routes
+    """
+    if task is None:
+        return None
+    return router.route(name, args, task.app)
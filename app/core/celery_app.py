@@ -1,8 +1,12 @@
 from opendss_powerflow_service.app.config.config import settings
 
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import task_prerun, task_postrun
 from kombu import Queue
 
+from opendss_powerflow_service.utils.log import set_context, reset_context
+
 
 # Initialize Celery
 app = Celery(
@@ -16,17 +20,74 @@ app.conf.task_default_queue = 'default'
 ## Using the database to store task state and results.
 result_persistent = True
 
+# Powerflow priority classes: each class has its own queue, worker concurrency and admission backlog limit
+PRIORITY_CLASSES = {
+    'interactive': {'queue': 'powerflow_interactive', 'concurrency': 2, 'max_backlog': 50, 'retry_after': 5},
+    'batch': {'queue': 'powerflow_batch', 'concurrency': 4, 'max_backlog': 20000, 'retry_after': 60},
+    'timeseries': {'queue': 'powerflow_timeseries', 'concurrency': 1, 'max_backlog': 20, 'retry_after': 300},
+}
+
 app.conf.task_queues = (
     Queue('default'),
     Queue('circuit_queue'),
-    Queue('powerflow_queue')
+    *(Queue(c['queue']) for c in PRIORITY_CLASSES.values()),
 )
 
-# Celery configurations
-app.conf.task_routes = {
-    'tasks.circuit.*': {'queue': 'circuit_queue'},
-    'tasks.powerflow.*': {'queue': 'powerflow_queue'}
+# Celery configurations, circuit tasks go to the worker owning the circuit when there is one,
+# otherwise the first matching pattern wins
+app.conf.task_routes = ('opendss_powerflow_service.app.core.affinity.route_task', [
+    ('tasks.circuit.*', {'queue': 'circuit_queue'}),
+    ('tasks.powerflow.batch_*', {'queue': PRIORITY_CLASSES['batch']['queue']}),
+    ('tasks.powerflow.timeseries_*', {'queue': PRIORITY_CLASSES['timeseries']['queue']}),
+    # long sampling runs with their own process pool, the timeseries workers run a thread pool that can spawn one
+    ('tasks.powerflow.probabilistic', {'queue': PRIORITY_CLASSES['timeseries']['queue']}),
+    ('tasks.powerflow.*', {'queue': PRIORITY_CLASSES['interactive']['queue']}),
+])
+
+# Let the interactive workers pick up one message at a time so a long solve does not hold queued work
+app.conf.worker_prefetch_multiplier = 1
+
+# Record STARTED in the result backend when a worker begins a task, the in-flight registry tells running solves from
+# lost ones by it
+app.conf.task_track_started = True
+
+
+class PowerflowAcksLate:
+    """
+    Acknowledge powerflow tasks after they ran, so a crashed worker's solve is redelivered. They only read the
+    circuit and write new result rows, circuit create/update/delete and exports are not safe to run twice.
+    """
+
+    def annotate(self, task):
+        if task.name.startswith('tasks.powerflow.'):
+            return {'acks_late': True}
+        return None
+
+app.conf.task_annotations = (PowerflowAcksLate(),)
+
+# Drop expired powerflow result partitions once a day
+app.conf.beat_schedule = {
+    'powerflow-result-retention': {
+        'task': 'tasks.powerflow.apply_result_retention',
+        'schedule': crontab(hour=3, minute=0),
+    }
 }
 
 # List of modules to import when the Celery worker starts.
-imports = ('opendss_powerflow_service.app.tasks.circuit_tasks', 'opendss_powerflow_service.app.tasks.circuit_tasks')
\ No newline at end of file
+imports = ('opendss_powerflow_service.app.tasks.circuit_tasks', 'opendss_powerflow_service.app.tasks.circuit_tasks')
+
+# Log context of the running task, tokens by task id so the postrun handler can restore the previous context
+_log_tokens = {}
+
+@task_prerun.connect
+def _bind_log_context(task_id=None, task=None, args=None, kwargs=None, **_):
+    circuit_id = (kwargs or {}).get('circuit_id')
+    if circuit_id is None and args and isinstance(args[0], str):
+        circuit_id = args[0]
+    _log_tokens[task_id] = set_context(task_id=task_id, circuit_id=circuit_id, run_id=None)
+
+@task_postrun.connect
+def _unbind_log_context(task_id=None, **_):
+    tokens = _log_tokens.pop(task_id, None)
+    if tokens is not None:
+        reset_context(tokens)
@@ -0,0 +1,146 @@
+import time
+import uuid
+import threading
+
+from celery import states
+from celery.result import AsyncResult
+from celery.signals import task_postrun
+from sqlmodel import Session, select, delete, update
+from sqlalchemy.dialects.postgresql import insert
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.app.core.celery_app import app
+from opendss_powerflow_service.database.engine import engine
+from opendss_powerflow_service.models.modelCRUD import SqlCircuitModelCRUD
+from opendss_powerflow_service.models.params import params_hash
+from opendss_powerflow_service.models.result import PfInFlight
+from opendss_powerflow_service.utils.metrics import registry
+
+COALESCED_TASKS = ('tasks.powerflow.powerflow',)
+
+LIVE_STATES = (states.RECEIVED, states.STARTED, states.RETRY)
+
+dispatch_requests = registry.counter(
+    'powerflow_dispatch_requests_total', 'Powerflow submissions by outcome, coalesced requests reuse a running task',
+    labelnames=('outcome',))
+
+
+def inflight_key(circuit_id, version, simulation_params):
+    return f"{circuit_id}:{version}:{params_hash(simulation_params)}"
+
+def _is_live(task_id, created, ttl):
+    """
+    Celery also reports PENDING for unknown, lost or purged task ids, so PENDING only counts as live while the
+    entry is younger than the grace window. Workers record STARTED when they begin a task (task_track_started), a
+    task still waiting in its queue is PENDING, so the window should cover the usual interactive queue wait.
+    """
+    age = time.time() - created
+    if age > ttl:
+        return False
+    state = AsyncResult(task_id, app=app).state
+    return state in LIVE_STATES or (state == states.PENDING and age <= settings.INFLIGHT_PENDING_GRACE_SECONDS)
+
+
+class LocalInFlightRegistry:
+    """
+    In-process registry, enough when the API and the workers share a process (eager mode, tests)
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or settings.INFLIGHT_TTL_SECONDS
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key, task_id):
+        """
+        Register task_id for key, returns the task id of a live task already registered for it instead
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and _is_live(entry[0], entry[1], self.ttl):
+                return entry[0]
+            self._entries[key] = (task_id, time.time())
+            return None
+
+    def release(self, task_id):
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] == task_id]:
+                del self._entries[key]
+
+
+class DbInFlightRegistry:
+    """
+    Registry table shared by the API processes, the unique key makes the claim atomic
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or settings.INFLIGHT_TTL_SECONDS
+
+    def claim(self, key, task_id):
+        now = time.time()
+        with Session(engine) as db:
+            statement = (insert(PfInFlight.__table__)
+                         .values(key=key, task_id=task_id, created=now)
+                         .on_conflict_do_nothing(index_elements=['key'])
+                         .returning(PfInFlight.task_id))
+            if db.execute(statement).scalar_one_or_none() is not None:
+                db.commit()
+                return None
+            existing = db.execute(select(PfInFlight).where(PfInFlight.key == key)).scalar_one_or_none()
+            if existing is None:
+                # released between the insert and the select
+                db.rollback()
+                return self.claim(key, task_id)
+            if _is_live(existing.task_id, existing.created, self.ttl):
+                return existing.task_id
+            # stale entry, take it over unless another request replaced it first
+            statement = (update(PfInFlight)
+                         .where(PfInFlight.key == key, PfInFlight.task_id == existing.task_id)
+                         .values(task_id=task_id, created=now))
+            taken = db.execute(statement).rowcount
+            db.commit()
+            if taken:
+                return None
+            current = db.execute(select(PfInFlight.task_id).where(PfInFlight.key == key)).scalar_one_or_none()
+            return current
+
+    def release(self, task_id):
+        with Session(engine) as db:
+            db.execute(delete(PfInFlight).where(PfInFlight.task_id == task_id))
+            db.commit()
+
+
+_registry = None
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = LocalInFlightRegistry() if settings.INFLIGHT_REGISTRY == 'local' else DbInFlightRegistry()
+    return _registry
+
+def dispatch_powerflow(db, task, circuit_id, simulation_params, before_enqueue=None, **options):
+    """
+    Enqueue task for the circuit unless an identical request (circuit, version, params) is already pending or running.
+    before_enqueue runs only when a new task is about to be queued, e.g. admission control.
+    """
+    version = SqlCircuitModelCRUD(db = db).read_version(circuit_id)
+    key = inflight_key(circuit_id, version, simulation_params)
+    task_id = str(uuid.uuid4())
+    existing = get_registry().claim(key, task_id)
+    if existing is not None:
+        dispatch_requests.inc(outcome='coalesced')
+        return {'task_id': existing, 'coalesced': True}
+    try:
+        if before_enqueue is not None:
+            before_enqueue()
+        task.apply_async(args=(circuit_id, simulation_params), task_id=task_id, **options)
+    except Exception:
+        get_registry().release(task_id)
+        raise
+    dispatch_requests.inc(outcome='enqueued')
+    return {'task_id': task_id, 'coalesced': False}
+
+@task_postrun.connect
+def _release_finished_task(sender=None, task_id=None, **kwargs):
+    if sender is not None and sender.name in COALESCED_TASKS:
+        get_registry().release(task_id)
@@ -0,0 +1,50 @@
+import datetime
+
+from sqlmodel import select, delete
+from sqlalchemy.exc import IntegrityError
+
+from opendss_powerflow_service.models.params import params_hash
+from opendss_powerflow_service.models.result import PfRunCache, PfResult
+from opendss_powerflow_service.utils.metrics import registry
+
+cache_requests = registry.counter(
+    'powerflow_result_cache_requests_total', 'Powerflow result cache lookups by outcome',
+    labelnames=('outcome',))
+
+
+class ResultCache:
+    """
+    Memoizes powerflow runs keyed by (circuit id, circuit version, canonical simulation params)
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def lookup(self, circuit_id, version, simulation_params):
+        statement = (select(PfRunCache.run_id)
+                     .join(PfResult, PfResult.id == PfRunCache.run_id)
+                     .where(PfRunCache.circuit == circuit_id,
+                            PfRunCache.version == version,
+                            PfRunCache.params_hash == params_hash(simulation_params)))
+        run_id = self.db.execute(statement).scalar_one_or_none()
+        cache_requests.inc(outcome='hit' if run_id is not None else 'miss')
+        return run_id
+
+    def store(self, circuit_id, version, simulation_params, run_id, converged=True):
+        """
+        Remember a run for identical requests, runs that did not converge are not reused
+        """
+        if not converged or str(converged).lower() in ('false', '0'):
+            return
+        entry = PfRunCache(circuit=circuit_id, version=version, params_hash=params_hash(simulation_params),
+                           run_id=run_id, created=str(datetime.datetime.now()))
+        try:
+            with self.db.begin_nested():
+                self.db.add(entry)
+        except IntegrityError:
+            # a concurrent run of the same request already stored its run
+            pass
+
+    def invalidate(self, circuit_id):
+        self.db.execute(delete(PfRunCache).where(PfRunCache.circuit == circuit_id))
+
@@ -0,0 +1,87 @@
+import time
+
+from celery.signals import worker_init, worker_process_init
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.utils.lazy import load_modules
+from opendss_powerflow_service.utils.log import get_logger
+from opendss_powerflow_service.utils.metrics import registry
+
+logger = get_logger('warmup')
+
+# Imported before a powerflow worker takes tasks, the API leaves them to the first request that needs them
+WORKER_MODULES = (
+    'opendssdirect',
+    'opendss_powerflow_service.simulation.simulation_manager',
+    'opendss_powerflow_service.app.tasks.powerflow_tasks',
+    'opendss_powerflow_service.app.tasks.batch_tasks',
+)
+
+worker_startup_seconds = registry.histogram(
+    'worker_startup_duration_seconds', 'Duration of the powerflow worker startup phases',
+    labelnames=('phase', 'target'))
+
+# Timings of the last warm up in this process
+startup_report = {}
+
+
+def preload_circuits(circuit_ids, budget=None):
+    """
+    Compile the hot circuits and load as many as the engine pool holds, the rest stay compiled for a quick load.
+    No circuit is started once budget seconds have passed, those are left to the first request that needs them.
+    """
+    from opendss_powerflow_service.app.tasks.powerflow_tasks import db, acquire_engine, _compiled_commands
+    from opendss_powerflow_service.models.modelCRUD import SqlCircuitModelCRUD
+    from opendss_powerflow_service.simulation.engine_pool import engine_pool
+    timings = {}
+    began = time.perf_counter()
+    for i, circuit_id in enumerate(circuit_ids):
+        start = time.perf_counter()
+        if budget is not None and start - began > budget:
+            logger.warning(f"Preload budget of {budget}s spent, {len(circuit_ids) - i} circuits left to load on use")
+            break
+        try:
+            if i < engine_pool.maxsize:
+                acquire_engine(circuit_id, SqlCircuitModelCRUD(db = db).read_version(circuit_id))
+            else:
+                _compiled_commands(circuit_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Preloading {circuit_id} failed: {e}")
+            continue
+        timings[circuit_id] = time.perf_counter() - start
+    return timings
+
+def warm_up(circuit_ids=None):
+    """
+    Eager imports and circuit preloading of a powerflow worker process, returns the timings of both phases
+    """
+    start = time.perf_counter()
+    imports = load_modules(WORKER_MODULES)
+    for name, seconds in imports.items():
+        worker_startup_seconds.observe(seconds, phase='import', target=name)
+    circuits = preload_circuits(settings.PRELOAD_CIRCUITS if circuit_ids is None else circuit_ids,
+                                settings.PRELOAD_BUDGET_SECONDS)
+    for circuit_id, seconds in circuits.items():
+        worker_startup_seconds.observe(seconds, phase='preload', target=circuit_id)
+    total = time.perf_counter() - start
+    worker_startup_seconds.observe(total, phase='total', target='')
+    startup_report.update({'imports': imports, 'circuits': circuits, 'total': total})
+    logger.info(f"Worker warm up took {total:.2f}s: imports {sum(imports.values()):.2f}s, "
+                f"{len(circuits)} circuits preloaded in {sum(circuits.values()):.2f}s")
+    return startup_report
+
+def install(pool):
+    """
+    Run the warm up in every process that executes tasks, before it consumes from its queues. Engines are process
+    local, so prefork children each warm up after the fork while thread and solo pools warm up in the main process.
+
+    A prefork child runs the warm up before it reports up to the parent, which kills children that take longer than
+    worker_proc_alive_timeout (4s by default). The timeout is raised to WORKER_PROC_ALIVE_TIMEOUT, the preload
+    stops starting circuits after PRELOAD_BUDGET_SECONDS and the difference must cover the largest circuit.
+    """
+    if pool == 'prefork':
+        from opendss_powerflow_service.app.core.celery_app import app
+        app.conf.worker_proc_alive_timeout = settings.WORKER_PROC_ALIVE_TIMEOUT
+    signal = worker_process_init if pool == 'prefork' else worker_init
+    signal.connect(lambda **kwargs: warm_up(), weak=False)
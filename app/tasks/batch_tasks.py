@@ -0,0 +1,161 @@
+import os
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from celery import chord, group, states
+from celery.result import GroupResult
+
+from opendss_powerflow_service.utils.log import get_logger
+from opendss_powerflow_service.app.core.celery_app import app
+from opendss_powerflow_service.database.engine import get_db
+from opendss_powerflow_service.models.modelCRUD import SqlCircuitModelCRUD
+
+db = next(get_db())
+
+logger = get_logger('batch_tasks')
+
+
+def _run_member(circuit_id, simulation_params):
+    # imported here so that spawned local pool processes open their own database session
+    from opendss_powerflow_service.app.tasks import powerflow_tasks
+    try:
+        return powerflow_tasks.execute_powerflow(circuit_id, simulation_params)
+    except Exception as e:
+        # the session is shared by every task of the process, a failed transaction would fail all that follow
+        powerflow_tasks.db.rollback()
+        logger.error(f"Batch powerflow failed for {circuit_id}: {e}")
+        return {'status': 'failed', 'circuit': circuit_id, 'error': str(e)}
+
+@app.task(bind=True, send_events=True, name='tasks.powerflow.batch_member')
+def run_batch_member(self, circuit_id:str, simulation_params: dict):
+    self.update_state(state=states.STARTED, meta={'circuit': circuit_id})
+    return _run_member(circuit_id, simulation_params)
+
+@app.task(name='tasks.powerflow.batch_aggregate')
+def aggregate_batch(results, circuits):
+    """
+    Final chord step, folds the member summaries into one batch summary
+    """
+    succeeded = [r for r in results if r.get('status') == 'success']
+    failed = [r for r in results if r.get('status') != 'success']
+    return {
+        'status': 'success' if not failed else 'partial',
+        'circuits': circuits,
+        'succeeded': len(succeeded),
+        'failed': len(failed),
+        'not_converged': [r['circuit'] for r in succeeded if str(r.get('converged')) in ('False', 'false', '0')],
+        'total_kw': sum(float(r.get('total_kw') or 0.0) for r in succeeded),
+        'total_kvar': sum(float(r.get('total_kvar') or 0.0) for r in succeeded),
+        # iterations actually spent against the flat start baseline, cached members did not solve
+        'total_iterations': sum(int(r.get('total_iterations') or 0) for r in succeeded if not r.get('cached')),
+        'baseline_iterations': sum(int(r.get('baseline_iterations') or 0) for r in succeeded if not r.get('cached')),
+        'runs': {r['circuit']: r.get('run_id') for r in succeeded},
+        'errors': {r['circuit']: r.get('error') for r in failed},
+    }
+
+def resolve_batch_circuits(substation=None, circuits=None):
+    """
+    Circuits of the batch ordered largest first, so the longest solves start first and the last result arrives sooner
+    """
+    modelcrud = SqlCircuitModelCRUD(db = db)
+    circuit_ids = list(circuits or [])
+    if substation is not None:
+        circuit_ids += [i for i in modelcrud.list_substation_circuits(substation) if i not in circuit_ids]
+    counts = modelcrud.count_components(circuit_ids)
+    return sorted(circuit_ids, key=lambda i: counts.get(i, 0), reverse=True)
+
+# Batches run through the local process pool in eager mode, by synthetic batch id, the oldest are forgotten first
+LOCAL_BATCHES_KEPT = 100
+_local_batches = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _run_local_batch(circuit_ids, simulation_params, max_workers=None, on_result=None):
+    max_workers = max_workers or min(len(circuit_ids), os.cpu_count() or 1)
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = [pool.submit(_run_member, i, simulation_params) for i in circuit_ids]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_result is not None:
+                on_result(results[-1])
+    return results
+
+def _submit_local_batch(circuit_ids, simulation_params):
+    """
+    Run the batch on a local process pool from a background thread, progress is kept in this process under a
+    synthetic batch id so batch_progress works as for a chord
+    """
+    batch_id = f"local-{uuid.uuid4()}"
+    batch = {'members': {i: states.PENDING for i in circuit_ids}, 'result': None}
+    with _local_lock:
+        _local_batches[batch_id] = batch
+        while len(_local_batches) > LOCAL_BATCHES_KEPT:
+            _local_batches.popitem(last=False)
+
+    def on_result(result):
+        with _local_lock:
+            batch['members'][result['circuit']] = states.SUCCESS if result.get('status') == 'success' else states.FAILURE
+
+    def run():
+        try:
+            results = _run_local_batch(circuit_ids, simulation_params, on_result=on_result)
+        except Exception as e:
+            logger.error(f"Local batch {batch_id} failed: {e}")
+            results = [{'status': 'failed', 'circuit': i, 'error': str(e)}
+                       for i, status in batch['members'].items() if status == states.PENDING]
+            for result in results:
+                on_result(result)
+        with _local_lock:
+            batch['result'] = aggregate_batch(results, circuit_ids)
+
+    threading.Thread(target=run, name=batch_id, daemon=True).start()
+    return batch_id
+
+def submit_batch(circuit_ids, simulation_params):
+    """
+    Fan the batch out as a celery chord, or through a local process pool when celery runs tasks eagerly
+    """
+    if not circuit_ids:
+        return {'batch_id': None, 'task_id': None, 'circuits': [], 'result': aggregate_batch([], [])}
+    if app.conf.task_always_eager:
+        return {'batch_id': _submit_local_batch(circuit_ids, simulation_params), 'task_id': None, 'circuits': circuit_ids}
+    header = group(run_batch_member.s(i, simulation_params) for i in circuit_ids)
+    result = chord(header)(aggregate_batch.s(circuit_ids))
+    result.parent.save()
+    return {'batch_id': result.parent.id, 'task_id': result.id, 'circuits': circuit_ids}
+
+def _local_batch_progress(batch_id):
+    with _local_lock:
+        batch = _local_batches.get(batch_id)
+        if batch is None:
+            return None
+        members = [{'task_id': None, 'circuit': i, 'status': status} for i, status in batch['members'].items()]
+        return {
+            'batch_id': batch_id,
+            'total': len(members),
+            'completed': sum(1 for m in members if m['status'] != states.PENDING),
+            'members': members,
+            'result': batch['result'],
+        }
+
+def batch_progress(batch_id):
+    if batch_id.startswith('local-'):
+        return _local_batch_progress(batch_id)
+    group_result = GroupResult.restore(batch_id, app=app)
+    if group_result is None:
+        return None
+    members = []
+    for member in group_result.results:
+        info = member.info if isinstance(member.info, dict) else {}
+        members.append({'task_id': member.id, 'circuit': info.get('circuit'), 'status': member.status})
+    return {
+        'batch_id': batch_id,
+        'total': len(group_result.results),
+        'completed': group_result.completed_count(),
+        'members': members,
+    }
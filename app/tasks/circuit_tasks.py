@@ -1,15 +1,19 @@
 import json
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, NoResultFound
 
 from opendss_powerflow_service.utils.log import get_logger
 from opendss_powerflow_service.database.engine import get_db
 from opendss_powerflow_service.app.core.celery_app import app
+from opendss_powerflow_service.app.core.result_cache import ResultCache
 
 from opendss_powerflow_service.models.circuit import Circuit as CircuitDBModel
 from opendss_powerflow_service.models.circuit import Circuits
 
 from opendss_powerflow_service.models.modelCRUD import SqlModelCRUD, SqlCircuitModelCRUD
+from opendss_powerflow_service.models.columnar import ColumnarCircuit
+from opendss_powerflow_service.models.validation import validate_circuit, check_valid
+from opendss_powerflow_service.simulation import dss_export
 
 db_session = next(get_db())
 
@@ -38,35 +42,74 @@ def get_circuits():
         circuit_list_serializable.append([_serialize(i) for i in row])
     return json.dumps({"circuit_list": circuit_list_serializable}, indent=4, default=str)
 
+def validate_circuit_data(circuit_id, circuit_data):
+    """
+    Columnar parse and validation report of a circuit submitted as JSON, cheap enough to run in the API before
+    queueing. Payloads that do not fit the component tables raise CircuitSchemaError. Linecodes and loadshapes may
+    be referenced from the stored shared tables without being repeated in the payload.
+    """
+    circuit = ColumnarCircuit.from_json(circuit_id, circuit_data)
+    return circuit, validate_circuit(circuit, db=db_session)
+
+@app.task(name='tasks.circuit.validate')
+def validate_stored_circuit(circuit_id):
+    """
+    Validation report of a stored circuit, None when the circuit does not exist
+    """
+    try:
+        circuit = ColumnarCircuit.from_db(db_session, circuit_id)
+    except NoResultFound:
+        return None
+    return validate_circuit(circuit).to_dict()
+
 @app.task(name='tasks.circuit.create')
 def create_circuit(circuit_id, circuit_data):
-    circuit_model = CircuitDBModel()
-    circuit_model.from_json(circuit_data)
+    circuit, report = validate_circuit_data(circuit_id, circuit_data)
+    check_valid(report)
     modelcrud = SqlCircuitModelCRUD(db = db_session)
-    circuit_model = modelcrud.create(circuit_model, circuit_id)
+    written = modelcrud.create_bulk(circuit, circuit_id)
     _commit(modelcrud.db)
-    return {"message": "Circuit Created"}
+    return {"message": "Circuit Created", "components": written}
 
 @app.task(name='tasks.circuit.read')
-def read_circuit(circuit_id):
+def read_circuit(circuit_id, include=None):
     circuit_model = CircuitDBModel()
     modelcrud = SqlCircuitModelCRUD(db = db_session)
-    circuit_model = modelcrud.read(circuit_id)
-    return {"circuit_model": circuit_model.model_dump_json()}
+    circuit_model = modelcrud.read(circuit_id, include=include)
+    dump_include = None if include is None else {'fields', *include}
+    return {"circuit_model": circuit_model.model_dump_json(include=dump_include)}
 
 @app.task(name='tasks.circuit.update')
 def update_circuit(circuit_id, circuit_data):
-    circuit_model = CircuitDBModel()
-    circuit_model.from_json(circuit_data)
+    circuit, report = validate_circuit_data(circuit_id, circuit_data)
+    check_valid(report)
     modelcrud = SqlCircuitModelCRUD(db = db_session)
-    circuit_model = modelcrud.update(circuit_model, circuit_id)
+    written = modelcrud.update_bulk(circuit, circuit_id)
+    ResultCache(modelcrud.db).invalidate(circuit_id)
     modelcrud.db.commit()
-    return {"message": "Circuit Updated"}
+    return {"message": "Circuit Updated", "components": written}
+
+@app.task(name='tasks.circuit.export')
+def export_circuits(circuits:list=None, substation:str=None, source:str='db', force:bool=False, processes:int=None):
+    """
+    Write stored circuits as OpenDSS files without the engine, circuits whose version was already exported are skipped
+    """
+    circuit_ids = list(circuits or [])
+    if substation is not None:
+        modelcrud = SqlCircuitModelCRUD(db = db_session)
+        circuit_ids += [i for i in modelcrud.list_substation_circuits(substation) if i not in circuit_ids]
+    results = dss_export.export_circuits(circuit_ids, source=source, force=force, processes=processes)
+    return {
+        'exported': [r for r in results if 'error' not in r and not r['skipped']],
+        'skipped': [r['circuit'] for r in results if r.get('skipped')],
+        'errors': {r['circuit']: r['error'] for r in results if 'error' in r},
+    }
 
 @app.task(name='tasks.circuit.delete')
 def delete_circuit(circuit_id):
     circuit_model = CircuitDBModel()
     modelcrud = SqlCircuitModelCRUD(db = db_session)
     circuit_model = modelcrud.delete(circuit_model, circuit_id)
+    ResultCache(modelcrud.db).invalidate(circuit_id)
     modelcrud.db.commit()
     return {"message": "Circuit Deleted"}
\ No newline at end of file
@@ -1,45 +1,325 @@
+import json
+import datetime
+
 from celery import states
+from sqlmodel import select, func
 
+from opendss_powerflow_service.app.config.config import settings
 from opendss_powerflow_service.app.core.celery_app import app
+from opendss_powerflow_service.app.core.result_cache import ResultCache
 from opendss_powerflow_service.database.engine import get_db
+from opendss_powerflow_service.database.partitions import ensure_partitions, drop_expired_partitions
 from opendss_powerflow_service.simulation.simulation_manager import SimulationManager
+from opendss_powerflow_service.simulation.engine_pool import engine_pool, compiled_models
+from opendss_powerflow_service.simulation.result_compare import compare_runs
+from opendss_powerflow_service.simulation.timeseries_store import timeseries_store
+from opendss_powerflow_service.simulation.parallel_qsts import run_parallel_qsts
+from opendss_powerflow_service.simulation.probabilistic import run_monte_carlo
+from opendss_powerflow_service.simulation.result_summary import summarize_run
+from opendss_powerflow_service.simulation.loss_report import loss_totals, loss_report
 from opendss_powerflow_service.models.modelCRUD import SqlModelCRUD, SqlCircuitModelCRUD
-from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfResultLine
+from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfResultLine, PfResultLoss, PfStatResult, PfFaultResult
+from opendss_powerflow_service.models.params import ProbabilisticParams
+from opendss_powerflow_service.models.columnar import get_columnar_circuit
+from opendss_powerflow_service.models.topology import get_topology
+from opendss_powerflow_service.models.validation import get_validation, check_valid
+from opendss_powerflow_service.utils.metrics import StageTimer, size_class
+from opendss_powerflow_service.utils.log import get_logger, set_context, log_context
+
+logger = get_logger('powerflow_tasks')
 
 db = next(get_db())
 
 @app.task(bind=True, send_events=True, name='tasks.powerflow.powerflow')
 def run_powerflow(self, circuit_id:str, simulation_params: dict):
     self.update_state(state=states.STARTED, meta={'progress': 'file loaded'})
-    modelcrud = SqlCircuitModelCRUD(db = db)
-    circuit_model = modelcrud.read(circuit_id)
-    simulation = SimulationManager(circuit_id, simulation_params)
-    simulation.load_circuit_model(circuit_id, circuit_model)
-    pf_fields = simulation.run_powerflow()
-    modelcrud = SqlModelCRUD(db)
-    nresults = simulation.get_node_results()
-    lresults = simulation.get_line_results()
-    test_result = PfResult(**pf_fields)
-    modelcrud.create([test_result])
-    modelcrud.update([circuit_id], nresults)
-    modelcrud.update([circuit_id], lresults)
-    modelcrud.db.commit()
-    return {'status': 'success'}
+    return execute_powerflow(circuit_id, simulation_params)
+
+def execute_powerflow(circuit_id:str, simulation_params: dict):
+    """
+    Read, solve and persist a snapshot powerflow for one circuit, returns a short run summary
+    """
+    # reset on return, batch members run one after the other on the same thread outside of the task signals
+    with log_context(circuit_id=circuit_id, run_id=None):
+        return _execute_powerflow(circuit_id, simulation_params)
+
+def _execute_powerflow(circuit_id, simulation_params):
+    timer = StageTimer()
+    with timer.stage('cache_lookup'):
+        version = SqlCircuitModelCRUD(db = db).read_version(circuit_id)
+        cached_run_id = ResultCache(db).lookup(circuit_id, version, simulation_params)
+    if cached_run_id is not None:
+        return {'status': 'success', 'circuit': circuit_id, 'run_id': cached_run_id, 'cached': True}
+    warm = acquire_engine(circuit_id, version, timer)
+    n_components = warm.n_components
+    simulation = SimulationManager(circuit_id, simulation_params, engine=warm.engine)
+    with timer.stage('solve'):
+        # a freshly loaded engine has no previous solution to start from
+        warm_start = bool(simulation.simulation_params.get('warm_start')) and warm.solves > 0
+        pf_fields = simulation.run_powerflow(warm_start=warm_start)
+        warm.solves += 1
+        if not warm_start:
+            warm.cold_iterations = int(pf_fields['total_iterations'])
+        pf_fields['baseline_iterations'] = warm.cold_iterations
+    with timer.stage('extract'):
+        nresults = simulation.get_bus_results()
+        lresults = simulation.get_line_results()
+        losses = simulation.get_losses()
+        classes, elements, kw_losses, kvar_losses = simulation.get_element_losses()
+        _record_loss_totals(pf_fields, losses, loss_totals(classes, kw_losses, kvar_losses))
+    with timer.stage('persist'):
+        modelcrud = SqlModelCRUD(db)
+        pf_result = PfResult(**pf_fields)
+        run_id = modelcrud.create_run(pf_result)
+        set_context(run_id=run_id)
+        ensure_partitions(modelcrud.db, run_id)
+        modelcrud.bulk_insert(PfResultNode, nresults, run_id)
+        modelcrud.bulk_insert(PfResultLine, lresults, run_id)
+        modelcrud.copy_columns(PfResultLoss, {
+            'name': elements.tolist(), 'circuit': [circuit_id] * len(elements), 'element_class': classes.tolist(),
+            'kw_losses': kw_losses.tolist(), 'kvar_losses': kvar_losses.tolist()}, run_id)
+    with timer.stage('summary'):
+        params = simulation.simulation_params
+        modelcrud.db.add(summarize_run(run_id, pf_fields, simulation.node_names, simulation.node_voltages, lresults, losses,
+                                       params.get('vmin', 0.95), params.get('vmax', 1.05)))
+        ResultCache(modelcrud.db).store(circuit_id, version, simulation_params, run_id, pf_fields['converged'])
+    _record_stage_times(pf_result, timer, n_components)
+    with timer.stage('commit'):
+        modelcrud.db.commit()
+    timer.observe(n_components)
+    logger.info("Powerflow run %s converged=%s in %.3fs", run_id, pf_fields['converged'], sum(timer.durations.values()))
+    return {
+        'status': 'success',
+        'circuit': circuit_id,
+        'run_id': run_id,
+        'converged': pf_fields['converged'],
+        'total_kw': pf_fields['total_kw'],
+        'total_kvar': pf_fields['total_kvar'],
+        'losses_kw': pf_fields['losses_kw'],
+        'total_iterations': pf_fields['total_iterations'],
+        'baseline_iterations': pf_fields['baseline_iterations'],
+        'warm_start': pf_fields['warm_start'],
+        'cached': False,
+        }
+
+def acquire_engine(circuit_id, version, timer=None):
+    """
+    Warm engine with the circuit version loaded, the model is read, checked and compiled only on a miss
+    """
+    timer = timer or StageTimer()
+    warm = engine_pool.get(circuit_id, version)
+    if warm is not None:
+        return warm
+    with timer.stage('db_read'):
+        circuit_model = get_columnar_circuit(db, circuit_id, version)
+    version = circuit_model.fields.version
+    with timer.stage('topology'):
+        topology = get_topology(circuit_id, version, circuit_model)
+    with timer.stage('validate'):
+        check_valid(get_validation(circuit_id, version, circuit_model, topology))
+    with timer.stage('model_load'):
+        commands = compiled_models.get(circuit_id, version, lambda: SimulationManager.compile_circuit_model(circuit_id, circuit_model))
+        warm = engine_pool.load(circuit_id, version, commands, circuit_model.count_components())
+    return warm
+
+def _record_loss_totals(pf_fields, losses, totals):
+    by_class = {k.lower(): v for k, v in totals['by_class'].items()}
+    pf_fields['losses_kw'], pf_fields['losses_kvar'] = losses
+    pf_fields['line_losses_kw'] = by_class.get('line', {}).get('kw', 0.0)
+    pf_fields['transformer_losses_kw'] = by_class.get('transformer', {}).get('kw', 0.0)
+
+# Stages stored on the PfResult row, commit runs after the row is written and only reaches the metrics
+PERSISTED_STAGES = ('cache_lookup', 'db_read', 'topology', 'validate', 'model_load', 'solve', 'extract', 'persist', 'summary')
+
+def _record_stage_times(pf_result, timer, n_components):
+    pf_result.size_class = size_class(n_components)
+    for stage in PERSISTED_STAGES:
+        if stage in timer.durations:
+            setattr(pf_result, f'{stage}_time', timer.durations[stage])
 
 @app.task(bind=True, send_events=True, name='tasks.powerflow.timeseries_powerflow')
 def run_timeseres_powerflow(self, circuit_id:str, simulation_params: dict):
-    self.update_state(state=states.STARTED, meta={'progress': 'file loaded'})
+    """
+    Step a time-series run and stream every step into the time-series store, the header row carries the run id
+    """
     simulation = SimulationManager(circuit_id, simulation_params)
-    simulation.load_file()
-    simulation.run_powerflow()
-    self.update_state(state=states.SUCCESS, meta={'progress': 'timeseries powerflow run completed'})
-    return {'status': 'success'}
+    if int(simulation.simulation_params.get('chunks') or 1) > 1:
+        return _run_parallel_timeseries(self, circuit_id, simulation)
+    if simulation.simulation_params.get('modelpath'):
+        simulation.load_file()
+    else:
+        version = SqlCircuitModelCRUD(db = db).read_version(circuit_id)
+        simulation = SimulationManager(circuit_id, simulation_params, engine=acquire_engine(circuit_id, version).engine)
+    self.update_state(state=states.STARTED, meta={'progress': 'model loaded'})
+    start, timestep, steps = simulation.timeseries_steps()
+    run_id = SqlModelCRUD(db).create_run(PfResult(circuit=circuit_id, run_timestamp=str(datetime.datetime.now()), mode='timeseries'))
+    db.commit()
+    writer = timeseries_store.writer(run_id, simulation.timeseries_quantities(), circuit=circuit_id,
+                                     start=str(start), timestep=timestep)
+    with writer:
+        for step, values in simulation.iter_timeseries(start, timestep, steps):
+            writer.append(values)
+            if (step + 1) % writer.flush_every == 0:
+                self.update_state(state=states.STARTED, meta={'progress': f'{step + 1}/{steps} steps', 'run_id': run_id})
+    return {'status': 'success', 'circuit': circuit_id, 'run_id': run_id, 'steps': steps}
+
+def _compiled_commands(circuit_id):
+    """
+    Compiled circuit for engines in other processes, which replay it instead of reading the database
+    """
+    version = SqlCircuitModelCRUD(db = db).read_version(circuit_id)
+    circuit_model = get_columnar_circuit(db, circuit_id, version)
+    return compiled_models.get(circuit_id, version, lambda: SimulationManager.compile_circuit_model(circuit_id, circuit_model))
+
+def _run_parallel_timeseries(task, circuit_id, simulation):
+    params = simulation.simulation_params
+    commands = None if params.get('modelpath') else _compiled_commands(circuit_id)
+    run_id = SqlModelCRUD(db).create_run(PfResult(circuit=circuit_id, run_timestamp=str(datetime.datetime.now()), mode='timeseries'))
+    db.commit()
+    report = run_parallel_qsts(
+        circuit_id, params, commands, timeseries_store.run_path(run_id), int(params['chunks']),
+        warmup_steps=int(params.get('warmup_steps') or 0),
+        progress=lambda done, total: task.update_state(state=states.STARTED, meta={'progress': f'{done}/{total} chunks', 'run_id': run_id}),
+        run_id=run_id, circuit=circuit_id)
+    return {'status': 'success', 'circuit': circuit_id, 'run_id': run_id, **report}
+
+@app.task(bind=True, send_events=True, name='tasks.powerflow.fault_study')
+def run_fault_study(self, circuit_id:str):
+    """
+    Fault currents at every bus from a single fault-study solve on the warm engine
+    """
+    timer = StageTimer()
+    version = SqlCircuitModelCRUD(db = db).read_version(circuit_id)
+    warm = acquire_engine(circuit_id, version, timer)
+    simulation = SimulationManager(circuit_id, {}, engine=warm.engine)
+    with timer.stage('solve'):
+        pf_fields = simulation.run_fault_study()
+        warm.solves += 1
+    with timer.stage('extract'):
+        fresults = simulation.get_fault_results()
+    with timer.stage('persist'):
+        modelcrud = SqlModelCRUD(db)
+        pf_result = PfResult(**pf_fields)
+        run_id = modelcrud.create_run(pf_result)
+        ensure_partitions(modelcrud.db, run_id)
+        modelcrud.bulk_insert(PfFaultResult, fresults, run_id)
+    _record_stage_times(pf_result, timer, warm.n_components)
+    modelcrud.db.commit()
+    return {'status': 'success', 'circuit': circuit_id, 'run_id': run_id, 'buses': len(fresults)}
+
+@app.task(name='tasks.powerflow.get_fault_results')
+def get_fault_results(run_id:int):
+    rows = SqlModelCRUD(db).read_run(PfFaultResult, run_id)
+    return {'run_id': run_id, 'buses': [i.model_dump_json() for i in rows]}
+
+@app.task(bind=True, send_events=True, name='tasks.powerflow.probabilistic')
+def run_probabilistic_powerflow(self, circuit_id:str, params: dict):
+    """
+    Monte Carlo load flow, only the per-node statistics over all samples are stored
+    """
+    params = ProbabilisticParams(**(json.loads(params) if isinstance(params, str) else params))
+    commands = _compiled_commands(circuit_id)
+    self.update_state(state=states.STARTED, meta={'progress': 'model compiled'})
+    nodes, stats, failed = run_monte_carlo(
+        commands, params.samples, params.load_std, params.seed, params.vmin, params.vmax, params.processes,
+        progress=lambda done, total: self.update_state(state=states.STARTED, meta={'progress': f'{done}/{total} sampling processes'}))
+    modelcrud = SqlModelCRUD(db)
+    run_id = modelcrud.create_run(PfResult(circuit=circuit_id, run_timestamp=str(datetime.datetime.now()), mode='probabilistic'))
+    ensure_partitions(modelcrud.db, run_id)
+    columns = {
+        'mean': stats.mean, 'std': stats.std(), 'min': stats.min, 'max': stats.max,
+        'p05': stats.quantile(0.05), 'p50': stats.quantile(0.5), 'p95': stats.quantile(0.95),
+        'violation_probability': stats.violation_probability(),
+    }
+    rows = [PfStatResult(name=name, circuit=circuit_id, samples=stats.count, **{k: float(v[i]) for k, v in columns.items()})
+            for i, name in enumerate(nodes)]
+    modelcrud.bulk_insert(PfStatResult, rows, run_id)
+    modelcrud.db.commit()
+    return {
+        'status': 'success',
+        'circuit': circuit_id,
+        'run_id': run_id,
+        'samples': stats.count,
+        'failed_samples': failed,
+        'max_violation_probability': float(columns['violation_probability'].max()) if len(nodes) else 0.0,
+    }
+
+@app.task(name='tasks.powerflow.get_probabilistic_results')
+def get_probabilistic_results(run_id:int):
+    rows = SqlModelCRUD(db).read_run(PfStatResult, run_id)
+    return {'run_id': run_id, 'nodes': [i.model_dump_json() for i in rows]}
+
+@app.task(name='tasks.powerflow.get_timeseries_window')
+def get_timeseries_window(run_id:int, quantity:str, start:int=0, stop:int=None, elements:list=None):
+    reader = timeseries_store.reader(run_id)
+    if reader is None:
+        return None
+    if quantity not in reader.quantities:
+        raise KeyError(f"Unknown quantity {quantity}, stored: {', '.join(reader.quantities)}")
+    start, stop, _ = slice(start, stop).indices(reader.steps)
+    values = reader.window(quantity, start, stop, elements)
+    return {
+        'run_id': run_id,
+        'quantity': quantity,
+        'start': start,
+        'stop': stop,
+        'steps': reader.steps,
+        'complete': reader.meta['complete'],
+        'starttime': reader.meta.get('start'),
+        'timestep': reader.meta.get('timestep'),
+        'elements': elements if elements is not None else reader.elements(quantity),
+        'values': values.tolist(),
+    }
 
 @app.task(name='tasks.powerflow.get_powerflow_results')
-def get_powerflow_results(circuit_id:str):
+def get_powerflow_results(circuit_id:str, run_id:int=None):
     modelcrud = SqlModelCRUD(db)
-    nresults = modelcrud.read(PfResultNode, [circuit_id])
-    lresults =  modelcrud.read(PfResultLine, [circuit_id])
+    if run_id is None:
+        run_id = modelcrud.latest_run_id(circuit_id)
+    if run_id is None:
+        return {'run_id': None, 'nodes': [], 'lines': []}
+    nresults = modelcrud.read_run(PfResultNode, run_id)
+    lresults = modelcrud.read_run(PfResultLine, run_id)
     nresultslist = [i.model_dump_json() for i in nresults]
     lresultslist = [i.model_dump_json() for i in lresults]
-    return {'nodes': nresultslist, 'lines': lresultslist}
+    return {'run_id': run_id, 'nodes': nresultslist, 'lines': lresultslist}
+
+@app.task(name='tasks.powerflow.get_powerflow_runs')
+def get_powerflow_runs(circuit_id:str, limit:int=100, before_run_id:int=None):
+    modelcrud = SqlModelCRUD(db)
+    runs = modelcrud.list_runs(circuit_id, limit, before_run_id)
+    return {'circuit': circuit_id, 'runs': [i.model_dump() for i in runs]}
+
+@app.task(name='tasks.powerflow.get_run_summaries')
+def get_run_summaries(circuits:list=None, substation:str=None):
+    modelcrud = SqlCircuitModelCRUD(db = db)
+    circuit_ids = list(circuits or [])
+    if substation is not None:
+        circuit_ids += [i for i in modelcrud.list_substation_circuits(substation) if i not in circuit_ids]
+    summaries = SqlModelCRUD(db).latest_summaries(circuit_ids)
+    return {'summaries': [i.model_dump() for i in summaries],
+            'missing': sorted(set(circuit_ids) - {i.circuit for i in summaries})}
+
+@app.task(name='tasks.powerflow.get_loss_report')
+def get_loss_report(run_id:int, top_n:int=20):
+    if db.get(PfResult, run_id) is None:
+        return None
+    return loss_report(db, run_id, top_n)
+
+@app.task(name='tasks.powerflow.compare_runs')
+def compare_powerflow_runs(run_a:int, run_b:int, top_n:int=20):
+    for run_id in (run_a, run_b):
+        if db.get(PfResult, run_id) is None:
+            return None
+    return compare_runs(db, run_a, run_b, top_n)
+
+@app.task(name='tasks.powerflow.apply_result_retention')
+def apply_result_retention(keep_days:int=None, keep_runs:int=None):
+    if keep_days is None and keep_runs is None:
+        keep_days = settings.RESULT_RETENTION_DAYS
+        keep_runs = settings.RESULT_RETENTION_RUNS
+    dropped = drop_expired_partitions(db, keep_days, keep_runs)
+    db.commit()
+    oldest_run = db.execute(select(func.min(PfResult.id))).scalar()
+    dropped_timeseries = timeseries_store.drop_before(oldest_run) if oldest_run is not None else []
+    return {'dropped_partitions': dropped, 'dropped_timeseries_runs': dropped_timeseries}
@@ -1,11 +1,46 @@
-from opendss_powerflow_service.app.core.celery_app import app
+import sys
+import socket
+
+from billiard.process import current_process
+from celery.signals import worker_process_init
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.app.core.celery_app import app, PRIORITY_CLASSES
+from opendss_powerflow_service.app.core import admission, affinity, warmup
+from opendss_powerflow_service.app.core import dispatch
+from opendss_powerflow_service.utils.metrics import start_metrics_server
 from opendss_powerflow_service.app.tasks.powerflow_tasks import run_powerflow, run_timeseres_powerflow, get_powerflow_results
+from opendss_powerflow_service.app.tasks.batch_tasks import run_batch_member, aggregate_batch
+
+
+# Metrics ports reserved per priority class for the prefork children
+CHILD_PORTS_PER_CLASS = 10
+
 
+def start_child_metrics_server(base_port):
+    # billiard numbers the pool children 0..concurrency-1 and a replacement child reuses the index
+    index = getattr(current_process(), 'index', 0) or 0
+    start_metrics_server(base_port + index)
 
-def start_worker():
-    # logic to start the Celery worker
-    app.worker_main(['-A', 'opendss_powerflow_service.app.core.celery_app','worker', '--loglevel=INFO', '-Q', 'default,powerflow_queue', '-n', 'powerflow_worker@%h', '-E', '--pool=threads', '--concurrency=1'])
+def start_worker(priority_class='interactive'):
+    # logic to start the Celery worker, one worker per priority class so each class gets its own concurrency
+    config = PRIORITY_CLASSES[priority_class]
+    node = f'powerflow_{priority_class}_worker@{socket.gethostname()}'
+    # consume the shared class queue and this worker's circuit affinity queue
+    own_queue = affinity.affinity_queue(config['queue'], node)
+    app.conf.task_queues = (*app.conf.task_queues, own_queue)
+    queues = ','.join([config['queue'], own_queue.name] + (['default'] if priority_class == 'interactive' else []))
+    # the OpenDSS engine is process global, so concurrent solves need separate processes
+    pool = 'threads' if config['concurrency'] == 1 else 'prefork'
+    warmup.install(pool)
+    class_index = list(PRIORITY_CLASSES).index(priority_class)
+    start_metrics_server(settings.POWERFLOW_WORKER_METRICS_PORT + class_index)
+    if pool == 'prefork':
+        # tasks run and observe their metrics in the pool children, each child serves its own registry
+        child_ports = settings.POWERFLOW_CHILD_METRICS_PORT + class_index * CHILD_PORTS_PER_CLASS
+        worker_process_init.connect(lambda **kwargs: start_child_metrics_server(child_ports), weak=False)
+    app.worker_main(['-A', 'opendss_powerflow_service.app.core.celery_app','worker', '--loglevel=INFO', '-Q', queues, '-n', node, '-E', f'--pool={pool}', f"--concurrency={config['concurrency']}"])
 
 
 if __name__ == '__main__':
-    start_worker()
\ No newline at end of file
+    start_worker(*sys.argv[1:2])
\ No newline at end of file
@@ -0,0 +1,92 @@
+import re
+import datetime
+
+from sqlalchemy.sql import text
+
+from opendss_powerflow_service.utils.log import get_logger
+
+logger = get_logger('partitions')
+
+# Result detail tables are range partitioned on run_id in blocks of this many runs
+RUNS_PER_PARTITION = 1000
+
+PARTITIONED_TABLES = ['pfresultnode', 'pfresultline', 'pfresultloss', 'pfstatresult', 'pffaultresult']
+
+_known_partitions = set()
+
+
+def partition_block(run_id):
+    return run_id // RUNS_PER_PARTITION
+
+def partition_name(table, run_id):
+    return f"{table}_p{partition_block(run_id)}"
+
+def ensure_partitions(db, run_id, tables=None):
+    """
+    Create the partitions holding run_id for each result table if they do not exist yet
+    """
+    for table in tables or PARTITIONED_TABLES:
+        name = partition_name(table, run_id)
+        if name in _known_partitions:
+            continue
+        lo = partition_block(run_id) * RUNS_PER_PARTITION
+        hi = lo + RUNS_PER_PARTITION
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ({lo}) TO ({hi})"))
+        _known_partitions.add(name)
+
+def list_partitions(db, table):
+    statement = text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """)
+    ret = {}
+    for (relname,) in db.execute(statement, {'table': table}).all():
+        match = re.fullmatch(rf"{table}_p(\d+)", relname)
+        if match:
+            ret[int(match.group(1))] = relname
+    return ret
+
+def _retention_cutoff_run(db, keep_days=None, keep_runs=None):
+    """
+    Smallest run id that must be kept, run ids increase with run_timestamp so everything below it can go
+    """
+    cutoffs = []
+    if keep_days is not None:
+        oldest = (datetime.datetime.now() - datetime.timedelta(days=keep_days)).strftime('%Y-%m-%d %H:%M:%S')
+        statement = text("""
+            SELECT coalesce((SELECT min(id) FROM pfresult WHERE run_timestamp >= :oldest), (SELECT max(id) + 1 FROM pfresult))
+        """)
+        row = db.execute(statement, {'oldest': oldest}).one()
+        cutoffs.append(row[0])
+    if keep_runs is not None:
+        row = db.execute(text("SELECT max(id) FROM pfresult")).one()
+        cutoffs.append(None if row[0] is None else row[0] - keep_runs + 1)
+    cutoffs = [c for c in cutoffs if c is not None]
+    return min(cutoffs) if cutoffs else None
+
+def drop_expired_partitions(db, keep_days=None, keep_runs=None):
+    """
+    Drop every result partition whose runs are all older than the retention policy, then remove their header rows
+    """
+    cutoff = _retention_cutoff_run(db, keep_days, keep_runs)
+    if cutoff is None:
+        return []
+    dropped = []
+    max_block = None
+    for table in PARTITIONED_TABLES:
+        for block, name in sorted(list_partitions(db, table).items()):
+            if (block + 1) * RUNS_PER_PARTITION > cutoff:
+                continue
+            db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            _known_partitions.discard(name)
+            dropped.append(name)
+            max_block = block if max_block is None else max(max_block, block)
+    if max_block is not None:
+        hi = (max_block + 1) * RUNS_PER_PARTITION
+        db.execute(text("DELETE FROM pfruncache WHERE run_id < :hi"), {'hi': hi})
+        db.execute(text("DELETE FROM pfrunsummary WHERE run_id < :hi"), {'hi': hi})
+        db.execute(text("DELETE FROM pfresult WHERE id < :hi"), {'hi': hi})
+    logger.info(f"Retention dropped {len(dropped)} result partitions below run {cutoff}")
+    return dropped
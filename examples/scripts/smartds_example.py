@@ -12,7 +12,7 @@ def main():
 
     circuit = "p10uhs0_1247--p10udt2190"
     s3_path = "https://oedi-data-lake.s3.amazonaws.com/SMART-DS/v1.0/2018/SFO/P10U/scenarios/base_timeseries/opendss/p10uhs0_1247/p10uhs0_1247--p10udt2190/"
-    s3_filenames = ['Master.dss', 'Transformers.dss', 'Loads.dss', 'Lines.dss', 'Capacitors.dss', 'LineCodes.dss']
+    s3_filenames = ['Master.dss', 'Transformers.dss', 'Loads.dss', 'Lines.dss', 'Capacitors.dss', 'LineCodes.dss', 'LoadShapes.dss', 'Buscoords.dss']
 
     # Import Circuit Model
     smartds_importer.import_circuit(circuit, s3_path, s3_filenames)
@@ -1,8 +1,10 @@
-import psycopg2
 import re
+import psycopg2
 import requests
 from urllib.parse import urljoin
 
+from opendss_powerflow_service.simulation.loadshape_store import loadshape_store, shape_name
+
 # Database connection settings
 db_config = {
     'host': 'localhost',
@@ -12,6 +14,7 @@ db_config = {
     'password': 'PGPASSWORD'
 }
 
+
 def connect_db():
     return psycopg2.connect(**db_config)
 
@@ -22,6 +25,7 @@ def parse_opendss_text(text, circuit):
         'buses': set(),
         'lines': [],
         'loads': [],
+        'loadshapes': [],
         'transformers': [],
         'capacitors': [],
         'linecodes': [],
@@ -124,9 +128,20 @@ def parse_opendss_text(text, circuit):
             )
             if match:
                 name, conn, bus, kv, kw, kvar, phases = match.groups()
-                data['loads'].append((name, bus, float(kw), float(kvar), float(kv), conn, int(phases), circuit))
+                yearly = re.search(r'yearly=(\S+)', line, re.I)
+                data['loads'].append((name, bus, float(kw), float(kvar), float(kv), conn, int(phases), circuit, yearly.group(1) if yearly else None))
                 data['buses'].add((bus, circuit))
 
+        elif line.lower().startswith('new loadshape.'):
+            match = re.search(r'new loadshape\.(\S+).*?npts=(\d+)', line, re.I)
+            mult = re.search(r'mult=\((?:file|sngfile)=([^)\s]+)\)', line, re.I)
+            if match and mult:
+                name, npts = match.groups()
+                minterval = re.search(r'minterval=([\d\.]+)', line, re.I)
+                interval = re.search(r'\binterval=([\d\.]+)', line, re.I)
+                hours = float(minterval.group(1)) / 60 if minterval else float(interval.group(1)) if interval else 1.0
+                data['loadshapes'].append((name, int(npts), hours, mult.group(1)))
+
         elif line.lower().startswith('new transformer.'):
             match = re.search(
                 r'new transformer\.(\S+).*?phases=(\d+).*?wdg=1.*?bus=(\S+).*?Kv=([\d\.]+).*?wdg=2.*?bus=(\S+).*?Kv=([\d\.]+).*?kva=([\d\.]+)',
@@ -158,12 +173,55 @@ def parse_opendss_text(text, circuit):
 
     return data
 
+# Parse a load shape csv, the multiplier is the first column
+def parse_loadshape_text(text):
+    values = []
+    for line in text.splitlines():
+        parts = line.replace(',', ' ').split()
+        if parts:
+            try:
+                values.append(float(parts[0]))
+            except ValueError:
+                continue
+    return values
+
+# Fetch the shape files and replace every shape by its content-hash name, loads are re-pointed accordingly
+def resolve_loadshapes(data, base_url):
+    renamed = {}
+    shapes = {}
+    for name, npts, interval, file in data['loadshapes']:
+        url = urljoin(base_url, file)
+        print(f"Fetching: {url}")
+        response = requests.get(url)
+        response.raise_for_status()
+        # the service's store under LOADSHAPE_STORE_DIR, files are written to a temporary name and moved in place
+        values = parse_loadshape_text(response.text)[:npts]
+        digest = loadshape_store.put(values)
+        renamed[name.lower()] = shape_name(digest)
+        shapes[digest] = (shape_name(digest), digest, len(values), interval)
+    data['loadshapes'] = list(shapes.values())
+    data['loads'] = [l[:8] + (renamed.get((l[8] or '').lower()),) for l in data['loads']]
+    return data
+
+# Parse a Buscoords file, one "bus x y" row per line
+def parse_buscoords_text(text):
+    coords = {}
+    for line in text.splitlines():
+        parts = line.replace(',', ' ').split()
+        if len(parts) >= 3 and not parts[0].startswith('!'):
+            try:
+                coords[parts[0].lower()] = (float(parts[1]), float(parts[2]))
+            except ValueError:
+                continue
+    return coords
+
 def merge_data_sets(datasets):
     merged = {
         'sources': [],
         'buses': set(),
         'lines': [],
         'loads': [],
+        'loadshapes': [],
         'transformers': [],
         'capacitors': [],
         'linecodes': [],
@@ -172,8 +230,12 @@ def merge_data_sets(datasets):
         'linespacing': [],
         'capcontrols': []
     }
+    merged['buscoords'] = {}
     for ds in datasets:
+        merged['buscoords'].update(ds.get('buscoords', {}))
         for key in merged:
+            if key == 'buscoords':
+                continue
             if key == 'buses':
                 merged[key].update(ds[key])
             else:
@@ -191,6 +253,11 @@ def insert_data(circuit, data):
     cur.execute("DELETE FROM transformer WHERE circuit = %s;", (circuit,))
     cur.execute("DELETE FROM capacitor WHERE circuit = %s;", (circuit,))
 
+    # Bump the circuit version so caches keyed on it are rebuilt, the other columns (substation, url, ...) are kept
+    cur.execute("UPDATE circuits SET version = coalesce(version, 0) + 1, last_updated = now()::text WHERE circuit = %s;", (circuit,))
+    if cur.rowcount == 0:
+        cur.execute("INSERT INTO circuits (circuit, version, last_updated) VALUES (%s, 1, now()::text);", (circuit,))
+
     for src in data['sources']:
         cur.execute("""
             INSERT INTO source (name, bus1, pu, basekv, r1, x1, r0, x0, circuit)
@@ -198,13 +265,17 @@ def insert_data(circuit, data):
         """, src)
 
     for bus, circuit in data['buses']:
-        cur.execute("INSERT INTO bus (name, circuit) VALUES (%s, %s);", (bus, circuit))
+        x, y = data.get('buscoords', {}).get(bus.split('.')[0].lower(), (None, None))
+        cur.execute("INSERT INTO bus (name, circuit, x, y) VALUES (%s, %s, %s, %s);", (bus, circuit, x, y))
 
     for line in data['lines']:
         cur.execute("INSERT INTO line (name, bus1, bus2, length, units, linecode, switch, enabled, phases, circuit) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);", line)
 
     for load in data['loads']:
-        cur.execute("INSERT INTO load (name, bus, kw, kvar, kv, conn, phases, circuit) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);", load)
+        cur.execute("INSERT INTO load (name, bus, kw, kvar, kv, conn, phases, circuit, yearly) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);", load)
+
+    for loadshape in data['loadshapes']:
+        cur.execute("INSERT INTO loadshape (name, hash, npts, interval) VALUES (%s, %s, %s, %s) ON CONFLICT (hash) DO NOTHING;", loadshape)
 
     for transformer in data['transformers']:
         cur.execute("INSERT INTO transformer (name, bus_primary, bus_secondary, kva, kv_primary, kv_secondary, phases, circuit) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);", transformer)
@@ -212,8 +283,9 @@ def insert_data(circuit, data):
     for capacitor in data['capacitors']:
         cur.execute("INSERT INTO capacitor (name, bus, kv, kvar, conn, phases, circuit) VALUES (%s, %s, %s, %s, %s, %s, %s);", capacitor)
 
+    # linecodes are a library shared by all circuits, feeders re-imported or reusing a code keep the stored row
     for linecode in data['linecodes']:
-        cur.execute("INSERT INTO linecode (name, units, nphases, faultrate, rmatrix, xmatrix, cmatrix, normamps) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);", linecode)
+        cur.execute("INSERT INTO linecode (name, units, nphases, faultrate, rmatrix, xmatrix, cmatrix, normamps) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (name) DO NOTHING;", linecode)
 
     for x in data['xfmrcodes']:
         try:
@@ -242,9 +314,13 @@ def import_circuit(circuit, s3_path, s3_filenames):
         print(f"Fetching: {url}")
         response = requests.get(url)
         response.raise_for_status()
-        parsed = parse_opendss_text(response.text, circuit)
+        if 'buscoords' in fn.lower():
+            parsed = parse_opendss_text('', circuit)
+            parsed['buscoords'] = parse_buscoords_text(response.text)
+        else:
+            parsed = parse_opendss_text(response.text, circuit)
         all_data.append(parsed)
 
-    merged = merge_data_sets(all_data)
+    merged = resolve_loadshapes(merge_data_sets(all_data), s3_path)
     insert_data(circuit, merged)
 
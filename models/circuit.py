@@ -4,7 +4,8 @@ from sqlmodel import Field, SQLModel
 from operator import attrgetter
 from bisect import bisect_left, insort
 
-from opendss_powerflow_service.models.components import Source, Bus, Capacitor, Generator, Line, LineCode, Load, Regulator, Transformer, Cable, Switch
+from opendss_powerflow_service.models.topology import TopologyGraph
+from opendss_powerflow_service.models.components import Source, Bus, Capacitor, Generator, Line, LineCode, Load, Regulator, Transformer, Cable, Switch, LoadShape
 
 
 class Circuits(SQLModel, table=True):
@@ -15,21 +16,90 @@ class Circuits(SQLModel, table=True):
     test: Optional[str] = None
     filenames: Optional[str] = None
     import_flag: Optional[str] = None
+    version: Optional[int] = None
+    last_updated: Optional[str] = None
+
+# Circuit JSON keys: (Circuit attribute, component model)
+COMPONENT_ROUTES = {
+    'sources': ('sources', Source),
+    'linecodes': ('linecodes', LineCode),
+    'lines': ('lines', Line),
+    'cables': ('cables', Cable),
+    'switches': ('switches', Switch),
+    'transformers': ('transformers', Transformer),
+    'capacitors': ('capacitors', Capacitor),
+    'loads': ('loads', Load),
+    'buses': ('buses', Bus),
+}
+
+class LazyComponentList(list):
+    """
+    Component list that queries its table on first access, untouched classes never leave the database
+    """
+
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def load(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            super().extend(loader())
+        return self
+
+    def __repr__(self):
+        return super().__repr__() if self.loaded else f"<{self.__class__.__name__} not loaded>"
+
+def _loading(name):
+    method = getattr(list, name)
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ('__iter__', '__len__', '__getitem__', '__setitem__', '__delitem__', '__contains__', '__reversed__',
+              '__eq__', '__iadd__', 'append', 'extend', 'insert', 'remove', 'pop', 'index', 'count', 'sort', 'copy'):
+    setattr(LazyComponentList, _name, _loading(_name))
+
 
 class Circuit(BaseModel):
     fields: Circuits
     transformers: List[Transformer] = []
     lines: Optional[List[Line]] = []
+    cables: Optional[List[Cable]] = []
+    switches: Optional[List[Switch]] = []
     linecodes: Optional[List[LineCode]] = []
     loads: Optional[List[Load]] = []
     buses: Optional[List[Bus]] = []
     sources: Optional[List[Source]] = []
     capacitors: Optional[List[Capacitor]] = []
+    loadshapes: Optional[List[LoadShape]] = []
     _name_index: Optional[dict] = PrivateAttr(default={})
 
+    def materialize(self, include=None, exclude=None):
+        """
+        Load the lazy component lists that are about to be serialized
+        """
+        for attr, value in vars(self).items():
+            if isinstance(value, LazyComponentList) and (include is None or attr in include) and (exclude is None or attr not in exclude):
+                value.load()
+
+    def model_dump(self, **kwargs):
+        self.materialize(kwargs.get('include'), kwargs.get('exclude'))
+        return super().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs):
+        self.materialize(kwargs.get('include'), kwargs.get('exclude'))
+        return super().model_dump_json(**kwargs)
+
     def get_models(self):
         models = [Line, Load, Capacitor, Generator,  Load, Regulator, Transformer,
-                    ]
+                  Source, Bus, Cable, Switch]
         return models
         
     def get_models_w_attrib(self, attribut):
@@ -46,6 +116,9 @@ class Circuit(BaseModel):
             if isinstance(value, list):
                 yield from value
 
+    def count_components(self):
+        return sum(len(value) for value in vars(self).values() if isinstance(value, list))
+
     def iter_lines(self):
         for attr, value in vars(self).items():
             if isinstance(value, list) and attr in ['lines', 'cables', 'transformers', 'transformerbanks', 'switches']:
@@ -137,42 +210,19 @@ class Circuit(BaseModel):
                 cap_control.capacitorid = None
 
     def build_connectivity_relationships(self):
-        # associate connectivity nodes with locations
-        for n in self.nodes:
-            location_name = n.name.split('.')[0]
-            location = self.circuit_model.get_component_by_name('location', location_name)
-            if location is not None:
-                n.locationId = location.id
-                n.location = location
-                
-        # associate point components with connectivity nodes
-        for n in self.iter_nodes():
-            if n.terminalId is not None:
-                n.terminal = self.get_component_by_id('nodes', n.terminalId)
-        # associate line components with connectivity nodes
-        for l in self.iter_lines():
-            if l.terminalId1 is not None:
-                l.terminal1 = self.get_component_by_id('nodes', l.terminalId1)
-            if l.terminalId2 is not None:
-                l.terminal2 = self.get_component_by_id('nodes', l.terminalId2)
+        """
+        Bus/branch topology graph built from the line and transformer terminals
+        """
+        return TopologyGraph.from_circuit(self)
 
     def from_json(self, json_data):
         for key in json_data:
             if key == 'fields':
                 self.fields = Circuits(**json_data[key])
                 continue
-            elif key == 'transformers':
-                for c in json_data[key]:
-                    self.transformers.append(Transformer(**c))  
-            elif key == 'lines':
-                for c in json_data[key]:
-                    self.transformers.append(Line(**c))  
-            elif key == 'cables':
-                for c in json_data[key]:
-                    self.transformers.append(Cable(**c))  
-            elif key == 'switches':
-                for c in json_data[key]:
-                    self.transformers.append(Switch(**c))
+            elif key in COMPONENT_ROUTES:
+                attr, model = COMPONENT_ROUTES[key]
+                getattr(self, attr).extend(model(**c) for c in json_data[key])
             else:
                 raise Exception("Invalid key in Circuit: " + key)
   
@@ -0,0 +1,326 @@
+import typing
+from collections.abc import Sequence
+
+import numpy as np
+from sqlmodel import select, func
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.models.circuit import Circuit, Circuits, COMPONENT_ROUTES
+from opendss_powerflow_service.models.components import Source, LineCode, Line, Cable, Switch, Transformer, Capacitor, Load, Bus, LoadShape
+from opendss_powerflow_service.utils.cache import VersionedCache
+
+# Component lists of a Circuit and the table model backing each of them
+COMPONENTS = {
+    'sources': Source,
+    'linecodes': LineCode,
+    'lines': Line,
+    'cables': Cable,
+    'switches': Switch,
+    'transformers': Transformer,
+    'capacitors': Capacitor,
+    'loads': Load,
+    'buses': Bus,
+    'loadshapes': LoadShape,
+}
+
+# Column order of the tuples produced by examples/scripts/smartds_importer.parse_opendss_text
+IMPORTER_COLUMNS = {
+    'sources': ('name', 'bus1', 'pu', 'basekv', 'r1', 'x1', 'r0', 'x0', 'circuit'),
+    'linecodes': ('name', 'units', 'nphases', 'faultrate', 'rmatrix', 'xmatrix', 'cmatrix', 'normamps'),
+    'lines': ('name', 'bus1', 'bus2', 'length', 'units', 'linecode', 'switch', 'enabled', 'phases', 'circuit'),
+    'transformers': ('name', 'bus_primary', 'bus_secondary', 'kva', 'kv_primary', 'kv_secondary', 'phases', 'circuit'),
+    'capacitors': ('name', 'bus', 'kv', 'kvar', 'conn', 'phases', 'circuit'),
+    'loads': ('name', 'bus', 'kw', 'kvar', 'kv', 'conn', 'phases', 'circuit', 'yearly'),
+    'buses': ('name', 'circuit'),
+    'loadshapes': ('name', 'hash', 'npts', 'interval'),
+}
+
+MISSING_INT = np.iinfo(np.int32).min
+
+
+class CircuitSchemaError(ValueError):
+    """
+    A circuit payload that does not fit the component tables, carries every problem found
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors[:20]))
+        self.errors = errors
+
+
+def _base_type(annotation):
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    return args[0] if args else annotation
+
+def column_types(model):
+    """
+    (column, python type) for every stored attribute of a component model, the surrogate id is not kept
+    """
+    return [(name, _base_type(field.annotation)) for name, field in model.model_fields.items() if name != 'id']
+
+def _dtype(model):
+    fields = []
+    for name, kind in column_types(model):
+        if kind is float:
+            fields.append((name, np.float64))
+        else:
+            # ints are stored as int32 and strings as codes into the circuit string table
+            fields.append((name, np.int32))
+    return np.dtype(fields)
+
+
+def component_query(attr, circuit_id, names=None):
+    """
+    Select of the columns of one component class that belong to a circuit
+    """
+    model = COMPONENTS[attr]
+    names = names or [name for name, _ in column_types(model)]
+    statement = select(*[getattr(model, name) for name in names])
+    if attr == 'loadshapes':
+        # shapes are shared between circuits, only the ones referenced by this circuit's loads
+        used = select(Load.yearly).where(Load.circuit == circuit_id, Load.yearly.is_not(None)).distinct()
+        return statement.where(LoadShape.name.in_(used))
+    if attr == 'linecodes':
+        # linecodes are a shared library, only the codes referenced by this circuit's lines
+        used = select(func.lower(Line.linecode)).where(Line.circuit == circuit_id, Line.linecode.is_not(None)).distinct()
+        return statement.where(func.lower(LineCode.name).in_(used)).order_by(LineCode.name)
+    return statement.where(model.circuit == circuit_id)
+
+
+class StringTable:
+    """
+    Interned strings shared by all string columns of a circuit, bus names repeat across many components
+    """
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        value = str(value)
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, code):
+        return None if code < 0 else self.values[code]
+
+    def decode(self, codes):
+        values = np.array(self.values + [None], dtype=object)
+        return values[np.where(codes < 0, len(self.values), codes)]
+
+    def nbytes(self):
+        return sum(len(v) for v in self.values) + 8 * len(self.values)
+
+
+class LazyModelList(Sequence):
+    """
+    Read-only sequence of SQLModel objects built on access from a columnar table, nothing is materialized up front
+    """
+
+    def __init__(self, circuit, attr):
+        self._circuit = circuit
+        self._attr = attr
+
+    def __len__(self):
+        return len(self._circuit.tables[self._attr])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._circuit.model_at(self._attr, i)
+
+
+class ColumnarCircuit:
+    """
+    Circuit held as one structured NumPy array per component class. Strings are interned, so a component costs
+    a few bytes per attribute instead of a full Pydantic object. Attribute access (circuit.lines, ...) yields
+    SQLModel objects lazily for code written against Circuit.
+    """
+
+    def __init__(self, circuit_id, fields=None):
+        self.circuit_id = circuit_id
+        self.fields = fields if fields is not None else Circuits(circuit=circuit_id)
+        self.strings = StringTable()
+        self.tables = {attr: np.zeros(0, dtype=_dtype(model)) for attr, model in COMPONENTS.items()}
+
+    def __getattr__(self, attr):
+        if attr in COMPONENTS:
+            return LazyModelList(self, attr)
+        raise AttributeError(attr)
+
+    def _encode(self, attr, rows, columns):
+        """
+        Build the structured array of a component class from row tuples in the given column order
+        """
+        model = COMPONENTS[attr]
+        dtype = _dtype(model)
+        table = np.zeros(len(rows), dtype=dtype)
+        position = {c: i for i, c in enumerate(columns)}
+        for name, kind in column_types(model):
+            if name not in position:
+                table[name] = np.nan if kind is float else (MISSING_INT if kind is int else -1)
+                continue
+            values = [row[position[name]] for row in rows]
+            try:
+                if kind is float:
+                    table[name] = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+                elif kind is int:
+                    table[name] = np.array([MISSING_INT if v is None else int(v) for v in values], dtype=np.int32)
+                else:
+                    table[name] = np.fromiter((self.strings.intern(v) for v in values), dtype=np.int32, count=len(values))
+            except (TypeError, ValueError) as e:
+                raise CircuitSchemaError([f"{attr}.{name}: {e}"])
+        self.tables[attr] = table
+
+    def model_at(self, attr, i):
+        model = COMPONENTS[attr]
+        row = self.tables[attr][i]
+        values = {}
+        for name, kind in column_types(model):
+            value = row[name]
+            if kind is float:
+                values[name] = None if np.isnan(value) else float(value)
+            elif kind is int:
+                values[name] = None if value == MISSING_INT else int(value)
+            else:
+                values[name] = self.strings.lookup(int(value))
+        # table models skip validation on init, so this stays cheap
+        return model(**values)
+
+    def column(self, attr, name):
+        """
+        One attribute of a component class as an array, string columns are decoded
+        """
+        kind = dict(column_types(COMPONENTS[attr]))[name]
+        values = self.tables[attr][name]
+        if kind is float:
+            return values
+        if kind is int:
+            return np.where(values == MISSING_INT, -1, values)
+        return self.strings.decode(values)
+
+    def records(self, attr, names=None):
+        """
+        Rows of a component class as tuples of plain Python values, missing values are None
+        """
+        types = dict(column_types(COMPONENTS[attr]))
+        names = names or list(types)
+        columns = []
+        for name in names:
+            values = self.tables[attr][name]
+            if types[name] is float:
+                column = values.astype(object)
+                column[np.isnan(values)] = None
+            elif types[name] is int:
+                column = values.astype(object)
+                column[values == MISSING_INT] = None
+            else:
+                column = self.strings.decode(values)
+            columns.append(column.tolist())
+        return zip(*columns)
+
+    def codes(self, attr, name):
+        """
+        Raw string table codes of a string column, cheap to compare without decoding
+        """
+        return self.tables[attr][name]
+
+    def count_components(self):
+        return sum(len(t) for t in self.tables.values())
+
+    def nbytes(self):
+        return sum(t.nbytes for t in self.tables.values()) + self.strings.nbytes()
+
+    def to_circuit(self):
+        """
+        Full Circuit of SQLModel objects for API responses
+        """
+        circuit_model = Circuit(fields=self.fields)
+        for attr in COMPONENTS:
+            setattr(circuit_model, attr, list(LazyModelList(self, attr)))
+        return circuit_model
+
+    @classmethod
+    def from_db(cls, db, circuit_id):
+        fields = db.execute(select(Circuits).where(Circuits.circuit == circuit_id)).scalar_one()
+        ret = cls(circuit_id, fields)
+        for attr, model in COMPONENTS.items():
+            names = [name for name, _ in column_types(model)]
+            ret._encode(attr, db.execute(component_query(attr, circuit_id, names)).all(), names)
+        return ret
+
+    @classmethod
+    def from_json(cls, circuit_id, json_data):
+        """
+        Parse a circuit payload straight into columns without building component objects. Records are checked
+        against the table schema and every problem is reported at once as a CircuitSchemaError.
+        """
+        errors = []
+        try:
+            fields = Circuits(**(json_data.get('fields') or {}))
+        except Exception as e:
+            fields = Circuits()
+            errors.append(f"fields: {e}")
+        fields.circuit = circuit_id
+        ret = cls(circuit_id, fields)
+        for key, records in json_data.items():
+            if key == 'fields':
+                continue
+            route = COMPONENT_ROUTES.get(key)
+            if route is None or route[0] not in COMPONENTS:
+                errors.append(f"{key}: not a component class")
+                continue
+            attr = route[0]
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                errors.append(f"{key}: expected a list of objects")
+                continue
+            names = [name for name, _ in column_types(COMPONENTS[attr])]
+            unknown = set().union(*(r.keys() for r in records)) - set(names) - {'id'}
+            if unknown:
+                errors.append(f"{key}: unknown attributes {', '.join(sorted(unknown))}")
+            try:
+                ret._encode(attr, [tuple(r.get(n) for n in names) for r in records], names)
+            except CircuitSchemaError as e:
+                errors.extend(e.errors)
+                continue
+            if 'circuit' in ret.tables[attr].dtype.names:
+                ret.tables[attr]['circuit'] = ret.strings.intern(circuit_id)
+        if errors:
+            raise CircuitSchemaError(errors)
+        return ret
+
+    @classmethod
+    def from_importer(cls, circuit_id, data):
+        """
+        Build from the parse result of the SMART-DS importer without going through the database
+        """
+        ret = cls(circuit_id)
+        for attr, columns in IMPORTER_COLUMNS.items():
+            rows = data.get(attr, [])
+            if attr == 'buses':
+                coords = data.get('buscoords', {})
+                rows = [(bus, circuit) + coords.get(bus.split('.')[0].lower(), (None, None)) for bus, circuit in sorted(rows)]
+                columns = columns + ('x', 'y')
+            ret._encode(attr, list(rows), columns)
+        return ret
+
+    @classmethod
+    def from_circuit(cls, circuit_model):
+        ret = cls(circuit_model.fields.circuit, circuit_model.fields)
+        for attr, model in COMPONENTS.items():
+            names = [name for name, _ in column_types(model)]
+            rows = [tuple(getattr(c, name, None) for name in names) for c in getattr(circuit_model, attr) or []]
+            ret._encode(attr, rows, names)
+        return ret
+
+
+# Columnar circuits held by a worker, small enough per feeder to keep many of them
+circuit_store = VersionedCache(maxsize=settings.COLUMNAR_CIRCUITS)
+
+def get_columnar_circuit(db, circuit_id, version):
+    return circuit_store.get(circuit_id, version, lambda: ColumnarCircuit.from_db(db, circuit_id))
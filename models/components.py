@@ -48,7 +48,7 @@ class BaseLineComponent(BaseEquipComponent):
                     "coordinates": coords
                 }
             }
-        except:
+        except AttributeError:
             return None
 
 class BasePointComponent(BaseEquipComponent):
@@ -69,7 +69,7 @@ class BasePointComponent(BaseEquipComponent):
                 "coordinates": coords
             }
         }
-        except:
+        except AttributeError:
             return None
 
 class ComponentField:
@@ -86,6 +86,8 @@ class ComponentField:
 class Bus(BasePointComponent, table=True):
     name: Optional[str] = None
     circuit: Optional[str] = None
+    x: Optional[float] = None
+    y: Optional[float] = None
 
 class Source(BasePointComponent, table=True):
     name: Optional[str] = None
@@ -198,7 +200,8 @@ class LineCode(BaseComponent, table=True):
     """
     An instance of a power line
     """
-    name: Optional[str] = None
+    # shared library data, one row per code name across all circuits
+    name: Optional[str] = Field(default=None, unique=True)
     units: Optional[str] = None
     nphases: Optional[str] = None
     faultrate: Optional[str] = None
@@ -207,6 +210,15 @@ class LineCode(BaseComponent, table=True):
     xmatrix: Optional[str] = None
     normamps: Optional[str] = None
 
+class LoadShape(BaseComponent, table=True):
+    """
+    Multiplier series shared by loads, the values live in the load-shape store under their content hash
+    """
+    name: Optional[str] = Field(default=None, index=True)
+    hash: str = Field(unique=True, index=True)
+    npts: Optional[int] = None
+    interval: Optional[float] = Field(default=None, description='Hours between points')
+
 class Load(BasePointComponent, table=True):
     name: Optional[str] = None
     bus: Optional[str] = None
@@ -215,6 +227,7 @@ class Load(BasePointComponent, table=True):
     kv: Optional[float] = None
     conn: Optional[str] = None
     phases: Optional[int] = None
+    yearly: Optional[str] = Field(default=None, description='Name of the LoadShape applied in yearly mode')
 
 
 class Regulator(BaseLineComponent, table=True):
@@ -2,13 +2,32 @@ import datetime
 
 from pydantic import TypeAdapter
 from typing import List
-from sqlmodel import select, delete
-from sqlalchemy.sql import text
+from sqlmodel import select, delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import text, func, exists
 from sqlalchemy.exc import NoResultFound, IntegrityError
 from psycopg2.errors import UniqueViolation
 
-from opendss_powerflow_service.models.circuit import Circuit, Circuits
-from opendss_powerflow_service.models.components import Transformer, Line, LineCode, Capacitor, Bus, Source, Load
+from opendss_powerflow_service.models.circuit import Circuit, Circuits, LazyComponentList
+from opendss_powerflow_service.models.columnar import COMPONENTS, column_types
+from opendss_powerflow_service.models.components import Transformer, Line, LineCode, Capacitor, Bus, Source, Load, LoadShape
+from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfRunSummary
+from opendss_powerflow_service.utils.metrics import timed
+
+
+class LineCodeConflictError(ValueError):
+    """
+    Linecodes submitted with parameters other than those of the stored code of the same name
+    """
+
+    def __init__(self, names):
+        super().__init__(f"Linecodes already stored with other parameters: {', '.join(sorted(names)[:20])}")
+        self.names = names
+
+
+def _text(value):
+    # linecode parameters are stored as text
+    return None if value is None else str(value)
 
 
 class SqlModelCRUD:
@@ -19,10 +38,12 @@ class SqlModelCRUD:
     def __init__(self, db):
         self.db = db
 
+    @timed('results.create')
     def create(self, sql_model):
         for sql_table_model in sql_model:
             self.db.add(sql_table_model)
 
+    @timed('results.read')
     def read(self, sql_model, circuit_ids=None):
         adapter = TypeAdapter(sql_model)
         result = []
@@ -36,11 +57,81 @@ class SqlModelCRUD:
                 result.append(adapter.validate_python(item))
         return result
 
+    @timed('results.create_run')
+    def create_run(self, pf_result):
+        self.db.add(pf_result)
+        self.db.flush()
+        return pf_result.id
+
+    @timed('results.bulk_insert')
+    def bulk_insert(self, sql_model, sql_table_models, run_id=None):
+        rows = []
+        for sql_table_model in sql_table_models:
+            row = sql_table_model.model_dump(exclude={'id'})
+            if run_id is not None:
+                row['run_id'] = run_id
+            rows.append(row)
+        if rows:
+            self.db.execute(insert(sql_model), rows)
+
+    @timed('results.copy_columns')
+    def copy_columns(self, sql_model, columns, run_id=None):
+        """
+        COPY equally long result columns, a dict of column name to sequence, into the table of sql_model without
+        building a model object per row
+        """
+        if run_id is not None:
+            columns = dict(columns, run_id=[run_id] * len(next(iter(columns.values()))))
+        names = ', '.join(f'"{n}"' for n in columns)
+        connection = self.db.connection().connection.driver_connection
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY "{sql_model.__tablename__}" ({names}) FROM STDIN') as copy:
+                for row in zip(*columns.values()):
+                    copy.write_row(row)
+
+    @timed('results.read_run')
+    def read_run(self, sql_model, run_id):
+        rows = self.db.execute(select(sql_model).where(sql_model.run_id == run_id)).scalars().all()
+        return list(rows)
+
+    @timed('results.latest_run')
+    def latest_run_id(self, circuit_id):
+        """
+        Newest snapshot run of the circuit, time-series, fault-study and probabilistic headers have no node rows
+        """
+        has_nodes = exists().where(PfResultNode.run_id == PfResult.id)
+        statement = (select(PfResult.id).where(PfResult.circuit == circuit_id, has_nodes)
+                     .order_by(PfResult.id.desc()).limit(1))
+        return self.db.execute(statement).scalar_one_or_none()
+
+    @timed('results.list_runs')
+    def list_runs(self, circuit_id, limit=100, before_run_id=None):
+        statement = select(PfResult).where(PfResult.circuit == circuit_id)
+        if before_run_id is not None:
+            statement = statement.where(PfResult.id < before_run_id)
+        statement = statement.order_by(PfResult.id.desc()).limit(limit)
+        return list(self.db.execute(statement).scalars().all())
+
+    @timed('results.latest_summaries')
+    def latest_summaries(self, circuit_ids):
+        """
+        Latest run summary of every circuit in one query on the (circuit, run_id) index
+        """
+        if not circuit_ids:
+            return []
+        statement = (select(PfRunSummary)
+                     .where(PfRunSummary.circuit.in_(circuit_ids))
+                     .order_by(PfRunSummary.circuit, PfRunSummary.run_id.desc())
+                     .distinct(PfRunSummary.circuit))
+        return list(self.db.execute(statement).scalars().all())
+
+    @timed('results.update')
     def update(self, circuit_ids, sql_table_models):
         self.delete(circuit_ids, sql_table_models)
         for sql_table_model in sql_table_models:
             self.db.add(sql_table_model)
 
+    @timed('results.delete')
     def delete(self, circuit_ids:str, sql_table_models):
         if sql_table_models:
             m = sql_table_models[0]
@@ -58,20 +149,38 @@ class SqlCircuitModelCRUD:
     def __init__(self, db):
         self.db = db
 
+    @timed('circuit.create')
     def create(self, circuit_model, circuit_id):
         try:
-            circuit_model.fields.CircuitId = circuit_id
-            circuit_model.fields.LastUpdated = str(datetime.datetime.now())
+            circuit_model.fields.circuit = circuit_id
+            circuit_model.fields.version = 1
+            circuit_model.fields.last_updated = str(datetime.datetime.now())
             self.db.add(circuit_model.fields)
             for component in circuit_model:
-                self.db.add(component)
+                if not isinstance(component, LineCode):
+                    self.db.add(component)
+            self.upsert_linecodes([c.model_dump(exclude={'id'}) for c in circuit_model.linecodes])
         except IntegrityError as e:
             if isinstance(e.orig, UniqueViolation):
                 raise Exception('Circuit already exists')
             else:
                 raise e
             
-    def _read_model(self, model, circuit_id):
+    # Component list of a Circuit, its table model and whether the table is scoped by circuit
+    COMPONENT_MODELS = {
+        'linecodes': (LineCode, False),
+        'sources': (Source, True),
+        'transformers': (Transformer, True),
+        'capacitors': (Capacitor, True),
+        'lines': (Line, True),
+        'buses': (Bus, True),
+        'loads': (Load, True),
+        'loadshapes': (LoadShape, False),
+    }
+
+    def _read_model(self, model, circuit_id, columns=None):
+        if columns is not None:
+            return self._read_columns(model, circuit_id, columns)
         ret = []
         rows = self.db.execute(select(model).where(model.circuit == circuit_id)).all()
         for row in rows:
@@ -80,44 +189,169 @@ class SqlCircuitModelCRUD:
                     ret.append(item)
         return ret
     
-    def _read_equip(self, model):
-        ret = []
-        rows = self.db.execute(select(model)).all()
-        for row in rows:
-            for item in row:
-                if item:
-                    ret.append(item)
-        return ret
-    
-    def read(self, circuit_id):
+    # Shared component tables, with the column of the circuit's components that references them by name
+    SHARED_REFERENCES = {
+        LineCode: (Line, 'linecode'),
+        LoadShape: (Load, 'yearly'),
+    }
+
+    def _read_shared(self, model, circuit_id, columns=None):
+        """
+        Shared components (linecodes, load shapes) referenced by the circuit, names match case insensitively as
+        in OpenDSS
+        """
+        names = ['id'] + [c for c in (columns or [f for f in model.model_fields]) if c != 'id']
+        referencing, column = self.SHARED_REFERENCES[model]
+        reference = getattr(referencing, column)
+        used = select(func.lower(reference)).where(referencing.circuit == circuit_id, reference.is_not(None)).distinct()
+        statement = select(*[getattr(model, c) for c in names]).where(func.lower(model.name).in_(used))
+        return [model(**dict(zip(names, row))) for row in self.db.execute(statement).all()]
+
+    def _read_columns(self, model, circuit_id, columns):
+        """
+        Components holding only the selected columns (and the id), the rest stay at their defaults
+        """
+        names = ['id'] + [c for c in columns if c != 'id']
+        statement = select(*[getattr(model, c) for c in names])
+        if circuit_id is not None:
+            statement = statement.where(model.circuit == circuit_id)
+        return [model(**dict(zip(names, row))) for row in self.db.execute(statement).all()]
+
+    def _loader(self, attr, circuit_id, columns=None):
+        model, per_circuit = self.COMPONENT_MODELS[attr]
+        if per_circuit:
+            return lambda: self._read_model(model, circuit_id, columns)
+        return lambda: self._read_shared(model, circuit_id, columns)
+
+    @timed('circuit.read')
+    def read(self, circuit_id, include=None, columns=None, lazy=True):
+        """
+        Circuit with the component classes in include (all when None) read now. The remaining classes are queried
+        on first access, or left empty when lazy is False. columns maps a component list to the columns to
+        read, e.g. {'lines': ['name', 'bus1', 'bus2']}.
+        """
+        columns = columns or {}
         try:
             statement = select(Circuits).where(Circuits.circuit == circuit_id)
             circuit_info_rows = self.db.execute(statement).one()
             Circuitss = TypeAdapter(List[Circuits]).validate_python(circuit_info_rows)
             circuit_model = Circuit(fields=Circuitss[0])
-            circuit_model.linecodes = self._read_equip(LineCode)
-            circuit_model.sources = self._read_model(Source, circuit_id)
-            circuit_model.transformers = self._read_model(Transformer, circuit_id)
-            circuit_model.capacitors = self._read_model(Capacitor, circuit_id)
-            circuit_model.lines = self._read_model(Line, circuit_id)
-            circuit_model.buses = self._read_model(Bus, circuit_id)
-            circuit_model.loads = self._read_model(Load, circuit_id)
+            for attr in self.COMPONENT_MODELS:
+                loader = self._loader(attr, circuit_id, columns.get(attr))
+                if include is None or attr in include:
+                    setattr(circuit_model, attr, loader())
+                elif lazy:
+                    setattr(circuit_model, attr, LazyComponentList(loader))
             return circuit_model
         except NoResultFound as e:
             raise Exception('Circuit not found')
         except Exception as e:
             raise Exception(e)
 
+    @timed('circuit.read_version')
+    def read_version(self, circuit_id):
+        """
+        Version counter of a circuit, bumped on every update and used to key caches built from the model
+        """
+        statement = select(Circuits.version).where(Circuits.circuit == circuit_id)
+        return self.db.execute(statement).scalar_one_or_none()
+
+    @timed('circuit.list_substation')
+    def list_substation_circuits(self, substation):
+        statement = select(Circuits.circuit).where(Circuits.substation == substation)
+        return list(self.db.execute(statement).scalars().all())
+
+    @timed('circuit.count_components')
+    def count_components(self, circuit_ids, models=(Line, Load, Transformer, Capacitor)):
+        """
+        Number of components per circuit, counted in the database without loading the model
+        """
+        counts = {i: 0 for i in circuit_ids}
+        for model in models:
+            statement = select(model.circuit, func.count()).where(model.circuit.in_(circuit_ids)).group_by(model.circuit)
+            for circuit_id, count in self.db.execute(statement).all():
+                counts[circuit_id] += count
+        return counts
+
+    @timed('circuit.update')
     def update(self, circuit_model:Circuit, circuit_id:str):
+        version = self.read_version(circuit_id)
         self.delete(circuit_model, circuit_id)
-        circuit_model.fields.CircuitId = circuit_id
-        circuit_model.fields.LastUpdated = str(datetime.datetime.now())
+        circuit_model.fields.circuit = circuit_id
+        circuit_model.fields.version = (version or 0) + 1
+        circuit_model.fields.last_updated = str(datetime.datetime.now())
         self.db.add(circuit_model.fields)
         for component in circuit_model.get_components_w_attribute('circuit'):
             self.db.add(component)
         
+    # Per-circuit component lists COPY'd by the bulk path. Linecodes are a shared library upserted by name and
+    # load shapes are registered through the load-shape store, delete() removes neither
+    BULK_TABLES = ('sources', 'lines', 'cables', 'switches', 'transformers', 'capacitors', 'loads', 'buses')
+
+    @timed('circuit.upsert_linecodes')
+    def upsert_linecodes(self, rows):
+        """
+        Add linecodes not in the library yet. Codes are shared by every circuit using them, so a row whose parameters
+        differ from the stored code of the same name raises LineCodeConflictError instead of changing other circuits.
+        """
+        # batches keep the statement below the bind parameter limit
+        for i in range(0, len(rows), 1000):
+            statement = pg_insert(LineCode.__table__).values(rows[i:i + 1000]).on_conflict_do_nothing(index_elements=['name'])
+            self.db.execute(statement)
+        names = [name for name, _ in column_types(LineCode)]
+        submitted = {row['name']: row for row in rows}
+        codes = list(submitted)
+        conflicts = []
+        for i in range(0, len(codes), 1000):
+            for stored in self.db.execute(select(LineCode).where(LineCode.name.in_(codes[i:i + 1000]))).scalars():
+                row = submitted[stored.name]
+                if any(_text(row.get(n)) != _text(getattr(stored, n)) for n in names):
+                    conflicts.append(stored.name)
+        if conflicts:
+            raise LineCodeConflictError(conflicts)
+
+    @timed('circuit.create_bulk')
+    def create_bulk(self, circuit, circuit_id, version=1):
+        """
+        Write a ColumnarCircuit with one COPY per component table inside the session transaction, returns the
+        number of components written
+        """
+        circuit.fields.circuit = circuit_id
+        circuit.fields.version = version
+        circuit.fields.last_updated = str(datetime.datetime.now())
+        try:
+            self.db.add(circuit.fields)
+            self.db.flush()
+        except IntegrityError as e:
+            if isinstance(e.orig, UniqueViolation):
+                raise Exception('Circuit already exists')
+            raise e
+        connection = self.db.connection().connection.driver_connection
+        written = 0
+        with connection.cursor() as cursor:
+            for attr in self.BULK_TABLES:
+                if not len(circuit.tables[attr]):
+                    continue
+                model = COMPONENTS[attr]
+                names = [name for name, _ in column_types(model)]
+                columns = ', '.join(f'"{n}"' for n in names)
+                with cursor.copy(f'COPY "{model.__tablename__}" ({columns}) FROM STDIN') as copy:
+                    for row in circuit.records(attr, names):
+                        copy.write_row(row)
+                written += len(circuit.tables[attr])
+        names = [name for name, _ in column_types(LineCode)]
+        self.upsert_linecodes([dict(zip(names, row)) for row in circuit.records('linecodes', names)])
+        return written + len(circuit.tables['linecodes'])
+
+    @timed('circuit.update_bulk')
+    def update_bulk(self, circuit, circuit_id):
+        version = self.read_version(circuit_id)
+        self.delete(Circuit.model_construct(), circuit_id)
+        return self.create_bulk(circuit, circuit_id, (version or 0) + 1)
+
+    @timed('circuit.delete')
     def delete(self, circuit_model, circuit_id:str):
-        self.db.execute(delete(Circuits).where(Circuits.CircuitId == circuit_id))
+        self.db.execute(delete(Circuits).where(Circuits.circuit == circuit_id))
         models_f = circuit_model.get_models_w_attrib('circuit')
         for model in models_f:
             result = self.db.execute(delete(model).where(model.circuit == circuit_id))
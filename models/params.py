@@ -1,3 +1,5 @@
+import json
+import hashlib
 from pydantic import BaseModel, Field
 from enum import Enum
 from typing import List, Optional
@@ -27,6 +29,8 @@ class SimulationParamsTimeSeries(BaseModel):
     endtime: Optional[str] = "2009-07-21 00:00:00"
     timestep: Optional[int] = 60
     modelpath: Optional[str] = None
+    chunks: Optional[int] = Field(default=None, description='Split the horizon into this many chunks solved in parallel')
+    warmup_steps: Optional[int] = Field(default=24, description='Steps solved ahead of each chunk so control states settle')
     setup: ModelCreationParams
     outputs: Optional[List[SimulationOutputs]] = Field(
         default=["voltage", "current", "violations"], description='')
@@ -34,4 +38,36 @@ class SimulationParamsTimeSeries(BaseModel):
 class SimulationParams(BaseModel):
     outputs: Optional[List[SimulationOutputs]] = Field(
         default=["voltage", "current", "violations"], description='')
-    
\ No newline at end of file
+    warm_start: bool = Field(default=False, description='Start from the previous solution of the warm engine instead of a flat start')
+    vmin: float = Field(default=0.95, description='Lower voltage limit in pu counted as a violation in the run summary')
+    vmax: float = Field(default=1.05, description='Upper voltage limit in pu counted as a violation in the run summary')
+
+class ProbabilisticParams(BaseModel):
+    samples: int = Field(default=1000, gt=0, description='Number of sampled load levels to solve')
+    load_std: float = Field(default=0.1, ge=0, description='Standard deviation of the per-load multiplier around 1.0')
+    seed: Optional[int] = Field(default=None, description='Seed for reproducible samples')
+    vmin: float = Field(default=0.95, description='Lower voltage limit in pu for the violation probability')
+    vmax: float = Field(default=1.05, description='Upper voltage limit in pu for the violation probability')
+    processes: Optional[int] = Field(default=None, gt=0, description='Sampling processes, defaults to and is capped at QSTS_MAX_PROCESSES or the cpu count')
+
+class BatchPowerflowParams(BaseModel):
+    substation: Optional[str] = Field(default=None, description='Run every circuit under this substation')
+    circuits: Optional[List[str]] = Field(default=None, description='Explicit list of circuits, combined with the substation circuits')
+    simulation_params: SimulationParams = SimulationParams()
+
+def canonical_params(simulation_params):
+    """
+    Canonical JSON form of simulation parameters, key order and the order of the requested outputs do not matter
+    """
+    if isinstance(simulation_params, BaseModel):
+        params = simulation_params.model_dump(mode='json')
+    elif isinstance(simulation_params, str):
+        params = json.loads(simulation_params)
+    else:
+        params = dict(simulation_params or {})
+    if isinstance(params.get('outputs'), list):
+        params['outputs'] = sorted(params['outputs'])
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+def params_hash(simulation_params):
+    return hashlib.sha256(canonical_params(simulation_params).encode()).hexdigest()
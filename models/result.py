@@ -1,9 +1,12 @@
 from typing import Optional
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, SQLModel, UniqueConstraint, Index
 
 class PfResult(SQLModel, table=True):
+    """
+    Header row for a single powerflow run, the id doubles as the run id of the detail rows
+    """
     id: int | None = Field(default=None, primary_key=True)
-    circuit: Optional[str] = None
+    circuit: Optional[str] = Field(default=None, index=True)
     run_timestamp: Optional[str] = None
     converged: Optional[str] = None
     mode: Optional[str] = None
@@ -14,9 +17,28 @@ class PfResult(SQLModel, table=True):
     algorithm: Optional[str] = None
     control_mode: Optional[str] = None
     convergence: Optional[str] = None
+    warm_start: Optional[bool] = None
+    losses_kw: Optional[float] = None
+    losses_kvar: Optional[float] = None
+    line_losses_kw: Optional[float] = None
+    transformer_losses_kw: Optional[float] = None
+    baseline_iterations: Optional[int] = Field(default=None, description='Iterations of a flat start on the same circuit version')
+    size_class: Optional[str] = None
+    # seconds per stage, the commit stage writes this row and is only exported as a metric
+    cache_lookup_time: Optional[float] = None
+    db_read_time: Optional[float] = None
+    topology_time: Optional[float] = None
+    validate_time: Optional[float] = None
+    model_load_time: Optional[float] = None
+    solve_time: Optional[float] = None
+    extract_time: Optional[float] = None
+    persist_time: Optional[float] = None
+    summary_time: Optional[float] = None
 
 class PfResultNode(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
+    __table_args__ = {'postgresql_partition_by': 'RANGE (run_id)'}
+    id: int | None = Field(default=None, primary_key=True, sa_column_kwargs={'autoincrement': True})
+    run_id: int | None = Field(default=None, primary_key=True, foreign_key='pfresult.id', index=True)
     name: Optional[str] = None
     circuit: Optional[str] = Field(index=True)
     volta: Optional[float] = None
@@ -26,7 +48,9 @@ class PfResultNode(SQLModel, table=True):
     pu_voltage: Optional[float] = None
 
 class PfResultLine(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
+    __table_args__ = {'postgresql_partition_by': 'RANGE (run_id)'}
+    id: int | None = Field(default=None, primary_key=True, sa_column_kwargs={'autoincrement': True})
+    run_id: int | None = Field(default=None, primary_key=True, foreign_key='pfresult.id', index=True)
     name: Optional[str] = None
     circuit: Optional[str] = Field(index=True)
     imax: Optional[float] = None
@@ -36,4 +60,94 @@ class PfResultLine(SQLModel, table=True):
     pf: Optional[float] = None
     loading_percent: Optional[float] = None
     normal_rating: Optional[float] = None
-    emergency_rating: Optional[float] = None
\ No newline at end of file
+    emergency_rating: Optional[float] = None
+
+class PfResultLoss(SQLModel, table=True):
+    """
+    Losses of every power delivery element of a run in kW and kvar, element_class is the OpenDSS class (Line, Transformer, ...)
+    """
+    __table_args__ = {'postgresql_partition_by': 'RANGE (run_id)'}
+    id: int | None = Field(default=None, primary_key=True, sa_column_kwargs={'autoincrement': True})
+    run_id: int | None = Field(default=None, primary_key=True, foreign_key='pfresult.id', index=True)
+    name: Optional[str] = None
+    circuit: Optional[str] = Field(index=True)
+    element_class: Optional[str] = None
+    kw_losses: Optional[float] = None
+    kvar_losses: Optional[float] = None
+
+class PfFaultResult(SQLModel, table=True):
+    """
+    Fault currents per bus from a fault study run, in amps
+    """
+    __table_args__ = {'postgresql_partition_by': 'RANGE (run_id)'}
+    id: int | None = Field(default=None, primary_key=True, sa_column_kwargs={'autoincrement': True})
+    run_id: int | None = Field(default=None, primary_key=True, foreign_key='pfresult.id', index=True)
+    name: Optional[str] = None
+    circuit: Optional[str] = Field(index=True)
+    i3ph: Optional[float] = None
+    islg: Optional[float] = None
+    ill: Optional[float] = None
+
+class PfStatResult(SQLModel, table=True):
+    """
+    Per-node voltage statistics of a probabilistic run, the samples themselves are not kept
+    """
+    __table_args__ = {'postgresql_partition_by': 'RANGE (run_id)'}
+    id: int | None = Field(default=None, primary_key=True, sa_column_kwargs={'autoincrement': True})
+    run_id: int | None = Field(default=None, primary_key=True, foreign_key='pfresult.id', index=True)
+    name: Optional[str] = None
+    circuit: Optional[str] = Field(index=True)
+    samples: Optional[int] = None
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    p05: Optional[float] = None
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    violation_probability: Optional[float] = None
+
+class PfRunSummary(SQLModel, table=True):
+    """
+    Dashboard aggregates of one snapshot run, computed from the result arrays before they are persisted
+    """
+    __table_args__ = (Index('ix_pfrunsummary_circuit_run', 'circuit', 'run_id'),)
+    id: int | None = Field(default=None, primary_key=True)
+    run_id: int = Field(foreign_key='pfresult.id', unique=True)
+    circuit: Optional[str] = None
+    run_timestamp: Optional[str] = None
+    converged: Optional[bool] = None
+    nodes: Optional[int] = None
+    min_pu_voltage: Optional[float] = None
+    min_pu_node: Optional[str] = None
+    max_pu_voltage: Optional[float] = None
+    max_pu_node: Optional[str] = None
+    worst_line: Optional[str] = None
+    worst_line_loading: Optional[float] = None
+    total_losses_kw: Optional[float] = None
+    total_losses_kvar: Optional[float] = None
+    vmin: Optional[float] = None
+    vmax: Optional[float] = None
+    undervoltage_nodes: Optional[int] = None
+    overvoltage_nodes: Optional[int] = None
+    overloaded_lines: Optional[int] = None
+
+class PfRunCache(SQLModel, table=True):
+    """
+    Maps a circuit version and canonical simulation parameters onto the run that already solved them
+    """
+    __table_args__ = (UniqueConstraint('circuit', 'version', 'params_hash'),)
+    id: int | None = Field(default=None, primary_key=True)
+    circuit: str = Field(index=True)
+    version: Optional[int] = None
+    params_hash: str
+    run_id: int = Field(foreign_key='pfresult.id')
+    created: Optional[str] = None
+
+class PfInFlight(SQLModel, table=True):
+    """
+    Pending or running powerflow task per request identity, used to coalesce identical submissions
+    """
+    key: str = Field(primary_key=True)
+    task_id: str = Field(index=True)
+    created: float
@@ -0,0 +1,233 @@
+import json
+import math
+
+import numpy as np
+from sqlmodel import select
+
+from opendss_powerflow_service.models.circuit import Circuits
+from opendss_powerflow_service.models.components import Bus, Line, Transformer, Load, Capacitor
+from opendss_powerflow_service.models.result import PfResultNode, PfResultLine
+from opendss_powerflow_service.models.modelCRUD import SqlModelCRUD
+from opendss_powerflow_service.models.topology import bus_key
+from opendss_powerflow_service.utils.cache import VersionedCache
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+
+class GridIndex:
+    """
+    Uniform grid spatial index over feature bounding boxes stored in CSR form: cell -> feature ids
+    """
+
+    def __init__(self, bounds, features_per_cell=16):
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        n = len(self.bounds)
+        if n == 0:
+            self.extent = np.zeros(4)
+            self.nx = self.ny = 1
+            self.cell_offsets = np.zeros(2, dtype=np.int64)
+            self.cell_features = np.zeros(0, dtype=np.int64)
+            return
+        self.extent = np.array([self.bounds[:, 0].min(), self.bounds[:, 1].min(),
+                                self.bounds[:, 2].max(), self.bounds[:, 3].max()])
+        side = max(1, int(math.ceil(math.sqrt(n / features_per_cell))))
+        self.nx = self.ny = side
+        self.cell_w = max((self.extent[2] - self.extent[0]) / side, 1e-12)
+        self.cell_h = max((self.extent[3] - self.extent[1]) / side, 1e-12)
+
+        ix0, iy0 = self._cell(self.bounds[:, 0], self.bounds[:, 1])
+        ix1, iy1 = self._cell(self.bounds[:, 2], self.bounds[:, 3])
+        single = (ix0 == ix1) & (iy0 == iy1)
+        cells = [iy0[single] * self.nx + ix0[single]]
+        ids = [np.flatnonzero(single)]
+        # features spanning several cells are rare (long lines), expand them one at a time
+        for i in np.flatnonzero(~single):
+            gx, gy = np.meshgrid(np.arange(ix0[i], ix1[i] + 1), np.arange(iy0[i], iy1[i] + 1))
+            cells.append((gy * self.nx + gx).ravel())
+            ids.append(np.full(gx.size, i))
+        cells = np.concatenate(cells)
+        ids = np.concatenate(ids)
+        order = np.argsort(cells, kind='stable')
+        self.cell_features = ids[order]
+        counts = np.bincount(cells, minlength=self.nx * self.ny)
+        self.cell_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _cell(self, x, y):
+        ix = np.clip(((x - self.extent[0]) / self.cell_w).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((y - self.extent[1]) / self.cell_h).astype(np.int64), 0, self.ny - 1)
+        return ix, iy
+
+    def query(self, bbox):
+        """
+        Ids of the features whose bounding box intersects bbox = (minx, miny, maxx, maxy)
+        """
+        if len(self.bounds) == 0:
+            return np.zeros(0, dtype=np.int64)
+        minx, miny, maxx, maxy = bbox
+        if maxx < self.extent[0] or minx > self.extent[2] or maxy < self.extent[1] or miny > self.extent[3]:
+            return np.zeros(0, dtype=np.int64)
+        ix0, iy0 = self._cell(np.array([minx]), np.array([miny]))
+        ix1, iy1 = self._cell(np.array([maxx]), np.array([maxy]))
+        chunks = []
+        for iy in range(int(iy0[0]), int(iy1[0]) + 1):
+            start = self.cell_offsets[iy * self.nx + int(ix0[0])]
+            end = self.cell_offsets[iy * self.nx + int(ix1[0]) + 1]
+            chunks.append(self.cell_features[start:end])
+        candidates = np.unique(np.concatenate(chunks)) if chunks else np.zeros(0, dtype=np.int64)
+        b = self.bounds[candidates]
+        hit = (b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny)
+        return candidates[hit]
+
+
+class CircuitGeometry:
+    """
+    Feature geometries of a circuit resolved from bus coordinates, with a spatial index over them
+    """
+
+    def __init__(self, circuit_id, kinds, names, coordinates, properties):
+        self.circuit_id = circuit_id
+        self.kinds = kinds
+        self.names = names
+        self.coordinates = coordinates
+        self.properties = properties
+        bounds = [(min(c[0] for c in coords), min(c[1] for c in coords),
+                   max(c[0] for c in coords), max(c[1] for c in coords)) for coords in coordinates]
+        self.index = GridIndex(bounds)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_db(cls, db, circuit_id):
+        coords = {}
+        for name, x, y in db.execute(select(Bus.name, Bus.x, Bus.y).where(Bus.circuit == circuit_id)).all():
+            if x is not None and y is not None:
+                coords[bus_key(name)] = (x, y)
+
+        kinds, names, coordinates, properties = [], [], [], []
+
+        def add(kind, name, buses, props):
+            points = [coords.get(bus_key(b)) for b in buses]
+            if name is None or any(p is None for p in points):
+                return
+            kinds.append(kind)
+            names.append(name)
+            coordinates.append(points)
+            properties.append(props)
+
+        for name, in db.execute(select(Bus.name).where(Bus.circuit == circuit_id)).all():
+            add('bus', name, [name], {})
+        for name, bus1, bus2, phases, length in db.execute(
+                select(Line.name, Line.bus1, Line.bus2, Line.phases, Line.length).where(Line.circuit == circuit_id)).all():
+            add('line', name, [bus1, bus2], {'bus1': bus1, 'bus2': bus2, 'phases': phases, 'length': length})
+        for name, bus1, bus2, kva in db.execute(
+                select(Transformer.name, Transformer.bus_primary, Transformer.bus_secondary, Transformer.kva).where(Transformer.circuit == circuit_id)).all():
+            add('transformer', name, [bus1, bus2], {'bus1': bus1, 'bus2': bus2, 'kva': kva})
+        for name, bus, kw, kvar in db.execute(
+                select(Load.name, Load.bus, Load.kw, Load.kvar).where(Load.circuit == circuit_id)).all():
+            add('load', name, [bus], {'bus': bus, 'kw': kw, 'kvar': kvar})
+        for name, bus, kvar in db.execute(
+                select(Capacitor.name, Capacitor.bus, Capacitor.kvar).where(Capacitor.circuit == circuit_id)).all():
+            add('capacitor', name, [bus], {'bus': bus, 'kvar': kvar})
+        return cls(circuit_id, kinds, names, coordinates, properties)
+
+    def query(self, bbox=None):
+        if bbox is None:
+            return np.arange(len(self.names))
+        return self.index.query(bbox)
+
+    def feature(self, i, extra_properties=None):
+        coords = self.coordinates[i]
+        if len(coords) == 1:
+            geometry = {'type': 'Point', 'coordinates': list(coords[0])}
+        else:
+            geometry = {'type': 'LineString', 'coordinates': [list(c) for c in coords]}
+        properties = {'name': self.names[i], 'kind': self.kinds[i], **self.properties[i]}
+        if extra_properties:
+            properties.update(extra_properties)
+        return {'type': 'Feature', 'properties': properties, 'geometry': geometry}
+
+
+_geometry_cache = VersionedCache(maxsize=16)
+
+def get_circuit_geometry(db, circuit_id):
+    """
+    Circuit geometry and spatial index, built once per circuit version, None for an unknown circuit
+    """
+    row = db.execute(select(Circuits.version).where(Circuits.circuit == circuit_id)).first()
+    if row is None:
+        return None
+    version = row[0]
+    return _geometry_cache.get(circuit_id, version, lambda: CircuitGeometry.from_db(db, circuit_id))
+
+def latest_result_properties(db, circuit_id, geometry, ids):
+    """
+    Result properties of the latest run for the given features: bus voltages for point features, loading for branches
+    """
+    run_id = SqlModelCRUD(db).latest_run_id(circuit_id)
+    if run_id is None:
+        return {}
+    node_rows = db.execute(select(PfResultNode.name, PfResultNode.volta, PfResultNode.voltb, PfResultNode.voltc)
+                           .where(PfResultNode.run_id == run_id)).all()
+    nodes = {bus_key(name): {'volta': a, 'voltb': b, 'voltc': c} for name, a, b, c in node_rows}
+    line_rows = db.execute(select(PfResultLine.name, PfResultLine.imax, PfResultLine.loading_percent)
+                           .where(PfResultLine.run_id == run_id)).all()
+    lines = {name.lower(): {'imax': imax, 'loading_percent': loading} for name, imax, loading in line_rows if name}
+    ret = {}
+    for i in ids:
+        if geometry.kinds[i] == 'line':
+            props = lines.get(geometry.names[i].lower())
+        elif geometry.kinds[i] == 'bus':
+            props = nodes.get(bus_key(geometry.names[i]))
+        else:
+            props = nodes.get(bus_key(geometry.properties[i].get('bus')))
+        if props:
+            ret[i] = dict(props, run_id=run_id)
+    return ret
+
+def iter_geojson(geometry, ids, results=None):
+    """
+    Stream a FeatureCollection one feature at a time instead of building it in memory
+    """
+    results = results or {}
+    yield '{"type": "FeatureCollection", "features": ['
+    first = True
+    for i in ids:
+        chunk = json.dumps(geometry.feature(i, results.get(i)))
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']}'
+
+def tile_bounds(z, x, y):
+    """
+    lon/lat bounding box of a web mercator z/x/y tile
+    """
+    n = 2 ** z
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lon_min, lat_min, lon_max, lat_max
+
+def encode_vector_tile(geometry, ids, bbox, results=None):
+    """
+    Encode features as a Mapbox vector tile, returns None when mapbox_vector_tile is not installed
+    """
+    if mapbox_vector_tile is None:
+        return None
+    results = results or {}
+    features = []
+    for i in ids:
+        feature = geometry.feature(i, results.get(i))
+        coords = feature['geometry']['coordinates']
+        if feature['geometry']['type'] == 'Point':
+            wkt = f"POINT({coords[0]} {coords[1]})"
+        else:
+            wkt = "LINESTRING(" + ', '.join(f"{c[0]} {c[1]}" for c in coords) + ")"
+        properties = {k: v for k, v in feature['properties'].items() if v is not None}
+        features.append({'geometry': wkt, 'properties': properties})
+    return mapbox_vector_tile.encode([{'name': geometry.circuit_id, 'features': features}],
+                                     default_options={'quantize_bounds': bbox})
@@ -0,0 +1,294 @@
+import numpy as np
+from sqlmodel import select
+
+from opendss_powerflow_service.models.components import Line, Transformer, Source
+from opendss_powerflow_service.utils.cache import VersionedCache
+
+DISABLED_VALUES = ('n', 'no', 'false', '0')
+
+
+class DisconnectedCircuitError(Exception):
+    pass
+
+
+def bus_key(bus):
+    """
+    OpenDSS bus references carry node suffixes (bus.1.2.3), the graph is keyed on the bare bus name
+    """
+    if bus is None:
+        return None
+    return bus.split('.')[0].lower()
+
+
+class TopologyGraph:
+    """
+    Bus/branch graph of a circuit with integer bus ids and CSR adjacency.
+    All traversals are linear in the number of buses plus branches.
+    """
+
+    def __init__(self, branches, root=None):
+        """
+        branches: iterable of (name, kind, bus1, bus2) tuples, root: name of the source bus
+        """
+        self.bus_names = []
+        self.bus_index = {}
+        names, kinds, frm, to = [], [], [], []
+        for name, kind, bus1, bus2 in branches:
+            if bus1 is None or bus2 is None:
+                continue
+            names.append(name)
+            kinds.append(kind)
+            frm.append(self._intern(bus_key(bus1)))
+            to.append(self._intern(bus_key(bus2)))
+        self.root = self._intern(bus_key(root)) if root is not None else (0 if self.bus_names else None)
+        self.branch_names = np.array(names, dtype=object)
+        self.branch_kinds = np.array(kinds, dtype=object)
+        self.branch_from = np.array(frm, dtype=np.int64)
+        self.branch_to = np.array(to, dtype=np.int64)
+        self._build_csr()
+        self._tree = None
+        self._islands = None
+
+    def _intern(self, bus):
+        i = self.bus_index.get(bus)
+        if i is None:
+            i = self.bus_index[bus] = len(self.bus_names)
+            self.bus_names.append(bus)
+        return i
+
+    def _build_csr(self):
+        n = len(self.bus_names)
+        m = len(self.branch_from)
+        src = np.concatenate([self.branch_from, self.branch_to])
+        dst = np.concatenate([self.branch_to, self.branch_from])
+        edge = np.concatenate([np.arange(m), np.arange(m)])
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.edge_ids = edge[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n)))).astype(np.int64)
+
+    @property
+    def n_buses(self):
+        return len(self.bus_names)
+
+    @property
+    def n_branches(self):
+        return len(self.branch_from)
+
+    @classmethod
+    def from_circuit(cls, circuit_model):
+        branches = []
+        for line in circuit_model.lines or []:
+            if str(line.enabled).lower() in DISABLED_VALUES:
+                continue
+            branches.append((line.name, 'line', line.bus1, line.bus2))
+        for xfmr in circuit_model.transformers or []:
+            branches.append((xfmr.name, 'transformer', xfmr.bus_primary, xfmr.bus_secondary))
+        root = circuit_model.sources[0].bus1 if circuit_model.sources else None
+        return cls(branches, root)
+
+    @classmethod
+    def from_columnar(cls, circuit):
+        """
+        Build from a ColumnarCircuit without materializing component objects
+        """
+        enabled = circuit.column('lines', 'enabled')
+        keep = np.array([str(e).lower() not in DISABLED_VALUES for e in enabled], dtype=bool)
+        lines = zip(circuit.column('lines', 'name')[keep], circuit.column('lines', 'bus1')[keep], circuit.column('lines', 'bus2')[keep])
+        branches = [(name, 'line', bus1, bus2) for name, bus1, bus2 in lines]
+        xfmrs = zip(circuit.column('transformers', 'name'), circuit.column('transformers', 'bus_primary'), circuit.column('transformers', 'bus_secondary'))
+        branches.extend((name, 'transformer', bus1, bus2) for name, bus1, bus2 in xfmrs)
+        sources = circuit.column('sources', 'bus1')
+        root = sources[0] if len(sources) else None
+        return cls(branches, root)
+
+    @classmethod
+    def from_db(cls, db, circuit_id):
+        branches = []
+        rows = db.execute(select(Line.name, Line.bus1, Line.bus2, Line.enabled).where(Line.circuit == circuit_id)).all()
+        for name, bus1, bus2, enabled in rows:
+            if str(enabled).lower() not in DISABLED_VALUES:
+                branches.append((name, 'line', bus1, bus2))
+        rows = db.execute(select(Transformer.name, Transformer.bus_primary, Transformer.bus_secondary).where(Transformer.circuit == circuit_id)).all()
+        branches.extend((name, 'transformer', bus1, bus2) for name, bus1, bus2 in rows)
+        root = db.execute(select(Source.bus1).where(Source.circuit == circuit_id).limit(1)).scalar_one_or_none()
+        return cls(branches, root)
+
+    def neighbors(self, bus_id):
+        return self.indices[self.indptr[bus_id]:self.indptr[bus_id + 1]]
+
+    def islands(self):
+        """
+        Connected component label per bus, returns (labels, number of islands)
+        """
+        if self._islands is None:
+            n = self.n_buses
+            indptr, indices = self.indptr.tolist(), self.indices.tolist()
+            labels = [-1] * n
+            n_islands = 0
+            # start from the source bus so that island 0 is always the energized one
+            starts = ([self.root] if self.root is not None else []) + list(range(n))
+            for start in starts:
+                if labels[start] != -1:
+                    continue
+                labels[start] = n_islands
+                stack = [start]
+                while stack:
+                    v = stack.pop()
+                    for w in indices[indptr[v]:indptr[v + 1]]:
+                        if labels[w] == -1:
+                            labels[w] = n_islands
+                            stack.append(w)
+                n_islands += 1
+            self._islands = (np.array(labels, dtype=np.int64), n_islands)
+        return self._islands
+
+    def is_connected(self):
+        return self.islands()[1] <= 1
+
+    def disconnected_buses(self):
+        labels, _ = self.islands()
+        return [self.bus_names[i] for i in np.flatnonzero(labels != 0)]
+
+    def _spanning_tree(self):
+        """
+        Depth first spanning tree from the source: parent bus, parent branch, preorder and subtree sizes
+        """
+        if self._tree is None:
+            n = self.n_buses
+            indptr, indices, edge_ids = self.indptr.tolist(), self.indices.tolist(), self.edge_ids.tolist()
+            parent = [-1] * n
+            parent_edge = [-1] * n
+            visited = [False] * n
+            preorder = []
+            if self.root is not None:
+                visited[self.root] = True
+                stack = [self.root]
+                while stack:
+                    v = stack.pop()
+                    preorder.append(v)
+                    for k in range(indptr[v], indptr[v + 1]):
+                        w = indices[k]
+                        if not visited[w]:
+                            visited[w] = True
+                            parent[w] = v
+                            parent_edge[w] = edge_ids[k]
+                            stack.append(w)
+            size = [1] * n
+            for v in reversed(preorder):
+                if parent[v] != -1:
+                    size[parent[v]] += size[v]
+            position = [-1] * n
+            for i, v in enumerate(preorder):
+                position[v] = i
+            self._tree = {
+                'parent': parent,
+                'parent_edge': parent_edge,
+                'preorder': preorder,
+                'position': position,
+                'size': size,
+            }
+        return self._tree
+
+    def upstream(self, bus):
+        """
+        Buses and branches on the path from bus back to the source
+        """
+        tree = self._spanning_tree()
+        v = self.bus_index[bus_key(bus)]
+        buses, branches = [], []
+        while v != -1:
+            buses.append(self.bus_names[v])
+            if tree['parent_edge'][v] != -1:
+                branches.append(self.branch_names[tree['parent_edge'][v]])
+            v = tree['parent'][v]
+        return buses, branches
+
+    def downstream(self, bus):
+        """
+        Buses fed through bus, including bus itself
+        """
+        tree = self._spanning_tree()
+        v = self.bus_index[bus_key(bus)]
+        start = tree['position'][v]
+        if start == -1:
+            return []
+        return [self.bus_names[i] for i in tree['preorder'][start:start + tree['size'][v]]]
+
+    def propagate(self, root_value, from_values=None, to_values=None):
+        """
+        Push a value from the source down the spanning tree. A branch may fix the value on its from or to side
+        (e.g. transformer winding kV), NaN inherits the parent bus value. Buses not reached stay NaN.
+        """
+        tree = self._spanning_tree()
+        ret = np.full(self.n_buses, np.nan)
+        if self.root is None:
+            return ret
+        branch_to = self.branch_to.tolist()
+        parent, parent_edge = tree['parent'], tree['parent_edge']
+        ret[self.root] = root_value
+        for v in tree['preorder'][1:]:
+            e = parent_edge[v]
+            side = to_values if branch_to[e] == v else from_values
+            value = side[e] if side is not None else np.nan
+            ret[v] = ret[parent[v]] if np.isnan(value) else value
+        return ret
+
+    def bus_values(self, buses, values):
+        """
+        Scatter per-component values (e.g. load kW) onto the buses they connect to
+        """
+        ret = np.zeros(self.n_buses)
+        ids = np.array([self.bus_index.get(bus_key(b), -1) for b in buses], dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        known = ids >= 0
+        np.add.at(ret, ids[known], np.nan_to_num(values[known]))
+        return ret
+
+    def sections(self, section_roots):
+        """
+        Section id per bus: index of the nearest upstream bus listed in section_roots, -1 above all of them
+        """
+        tree = self._spanning_tree()
+        roots = {self.bus_index[bus_key(b)]: i for i, b in enumerate(section_roots) if bus_key(b) in self.bus_index}
+        parent = tree['parent']
+        section = [-1] * self.n_buses
+        for v in tree['preorder']:
+            if v in roots:
+                section[v] = roots[v]
+            elif parent[v] != -1:
+                section[v] = section[parent[v]]
+        return np.array(section, dtype=np.int64)
+
+    def aggregate_by_section(self, section_roots, bus_values):
+        """
+        Sum per-bus values over each feeder section
+        """
+        section = self.sections(section_roots)
+        inside = section >= 0
+        return np.bincount(section[inside], weights=np.asarray(bus_values)[inside], minlength=len(section_roots))
+
+
+_topology_cache = VersionedCache(maxsize=32)
+
+def get_topology(circuit_id, version, circuit_model=None, db=None):
+    """
+    Topology graph of a circuit, built once per circuit version from the loaded model or the database
+    """
+    def build():
+        from opendss_powerflow_service.models.columnar import ColumnarCircuit
+        if isinstance(circuit_model, ColumnarCircuit):
+            return TopologyGraph.from_columnar(circuit_model)
+        if circuit_model is not None:
+            return TopologyGraph.from_circuit(circuit_model)
+        return TopologyGraph.from_db(db, circuit_id)
+    return _topology_cache.get(circuit_id, version, build)
+
+def check_connected(topology, circuit_id):
+    if topology.root is None:
+        raise DisconnectedCircuitError(f"Circuit {circuit_id} has no source bus")
+    if not topology.is_connected():
+        buses = topology.disconnected_buses()
+        raise DisconnectedCircuitError(
+            f"Circuit {circuit_id} has {topology.islands()[1] - 1} islands not connected to the source: "
+            + ', '.join(buses[:10]) + (' ...' if len(buses) > 10 else ''))
@@ -0,0 +1,274 @@
+import numpy as np
+from sqlmodel import select, func
+
+from opendss_powerflow_service.models.columnar import ColumnarCircuit
+from opendss_powerflow_service.models.components import LineCode, LoadShape
+from opendss_powerflow_service.models.topology import TopologyGraph
+from opendss_powerflow_service.utils.cache import VersionedCache
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Relative tolerance between a load or capacitor kV and the base kV propagated to its bus
+KV_TOLERANCE = 0.1
+
+# Offending names listed per issue, the count is always exact
+MAX_NAMES = 100
+
+
+class ModelValidationError(Exception):
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report
+
+
+class ValidationReport:
+    """
+    Issues grouped by check and component class, each carrying the offending component names
+    """
+
+    def __init__(self, circuit_id):
+        self.circuit_id = circuit_id
+        self.issues = []
+
+    def add(self, severity, code, component, names, message):
+        names = [str(i) for i in names]
+        if names:
+            self.issues.append({
+                'severity': severity,
+                'code': code,
+                'component': component,
+                'count': len(names),
+                'names': names[:MAX_NAMES],
+                'message': message,
+            })
+
+    @property
+    def errors(self):
+        return [i for i in self.issues if i['severity'] == ERROR]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {'circuit': self.circuit_id, 'ok': self.ok, 'issues': self.issues}
+
+
+def _strings(values):
+    values = np.asarray(values, dtype=object)
+    missing = np.array([v is None for v in values], dtype=bool)
+    return np.where(missing, '', values).astype(str), missing
+
+def bus_keys(values):
+    """
+    Vectorized topology.bus_key, missing buses map to ''
+    """
+    values, _ = _strings(values)
+    if len(values) == 0:
+        return values
+    return np.char.lower(np.char.partition(values, '.')[:, 0])
+
+def node_counts(values):
+    """
+    Number of node suffixes on each bus reference, 0 when the nodes are implied
+    """
+    values, _ = _strings(values)
+    return np.char.count(values, '.') if len(values) else np.zeros(0, dtype=np.int64)
+
+
+class CircuitValidator:
+    """
+    Checks a columnar circuit before it is compiled: references, phases, value ranges, connectivity and kV levels.
+    Every check works on whole columns, the cost is a few array passes per component class.
+    """
+
+    BUS_COLUMNS = {
+        'lines': ('bus1', 'bus2'),
+        'transformers': ('bus_primary', 'bus_secondary'),
+        'loads': ('bus',),
+        'capacitors': ('bus',),
+        'sources': ('bus1',),
+    }
+
+    RANGES = [
+        # component, column, lower bound, lower bound allowed, severity
+        ('lines', 'length', 0.0, False, ERROR),
+        ('loads', 'kv', 0.0, False, ERROR),
+        ('loads', 'kw', 0.0, True, WARNING),
+        ('transformers', 'kva', 0.0, False, ERROR),
+        ('transformers', 'kv_primary', 0.0, False, ERROR),
+        ('transformers', 'kv_secondary', 0.0, False, ERROR),
+        ('capacitors', 'kv', 0.0, False, ERROR),
+        ('capacitors', 'kvar', 0.0, False, ERROR),
+        ('sources', 'basekv', 0.0, False, ERROR),
+    ]
+
+    def __init__(self, circuit, topology=None, stored=None):
+        """
+        stored: lower case names of the shared linecodes and loadshapes already in the database, by component class,
+        references to them resolve even when the circuit does not repeat them
+        """
+        self.circuit = circuit
+        self.topology = topology if topology is not None else TopologyGraph.from_columnar(circuit)
+        self.stored = stored or {}
+        self.report = ValidationReport(circuit.circuit_id)
+
+    def names(self, attr):
+        return self.circuit.column(attr, 'name')
+
+    def validate(self):
+        self.check_required()
+        self.check_references()
+        self.check_phases()
+        self.check_ranges()
+        self.check_connectivity()
+        self.check_kv()
+        return self.report
+
+    def check_required(self):
+        if len(self.circuit.tables['sources']) == 0:
+            self.report.add(ERROR, 'no_source', 'sources', [self.circuit.circuit_id], "Circuit has no source")
+        for attr, columns in self.BUS_COLUMNS.items():
+            for column in columns:
+                missing = self.circuit.codes(attr, column) < 0
+                self.report.add(ERROR, 'missing_bus', attr, self.names(attr)[missing], f"{column} is not set")
+
+    def known(self, attr):
+        names = np.char.lower(_strings(self.circuit.column(attr, 'name'))[0])
+        return np.union1d(names, np.array(sorted(self.stored.get(attr, ())), dtype=str))
+
+    def check_references(self):
+        linecodes = self.known('linecodes')
+        linecode, missing = _strings(self.circuit.column('lines', 'linecode'))
+        unresolved = ~missing & ~np.isin(np.char.lower(linecode), linecodes)
+        self.report.add(ERROR, 'unknown_linecode', 'lines', self.names('lines')[unresolved],
+                        "linecode does not match any LineCode")
+        shapes = self.known('loadshapes')
+        yearly, missing = _strings(self.circuit.column('loads', 'yearly'))
+        unresolved = ~missing & ~np.isin(np.char.lower(yearly), shapes)
+        self.report.add(ERROR, 'unknown_loadshape', 'loads', self.names('loads')[unresolved],
+                        "yearly does not match any LoadShape")
+        known = np.array(list(self.topology.bus_index), dtype=str)
+        for attr in ('loads', 'capacitors'):
+            buses = bus_keys(self.circuit.column(attr, 'bus'))
+            dangling = (buses != '') & ~np.isin(buses, known)
+            self.report.add(ERROR, 'dangling_bus', attr, self.names(attr)[dangling],
+                            "bus is not connected to any line or transformer")
+        if len(self.circuit.tables['buses']):
+            listed = bus_keys(self.circuit.column('buses', 'name'))
+            for attr, columns in self.BUS_COLUMNS.items():
+                for column in columns:
+                    buses = bus_keys(self.circuit.column(attr, column))
+                    unknown = (buses != '') & ~np.isin(buses, listed)
+                    self.report.add(WARNING, 'unlisted_bus', attr, self.names(attr)[unknown],
+                                    f"{column} is not in the bus list")
+
+    def check_phases(self):
+        for attr, columns in self.BUS_COLUMNS.items():
+            if attr == 'sources':
+                continue
+            phases = self.circuit.column(attr, 'phases')
+            invalid = (phases < 1) | (phases > 3)
+            self.report.add(ERROR, 'invalid_phases', attr, self.names(attr)[invalid], "phases must be 1, 2 or 3")
+            for column in columns:
+                nodes = node_counts(self.circuit.column(attr, column))
+                mismatch = ~invalid & (nodes > 0) & (nodes != phases) & ~((phases == 3) & (nodes == 4))
+                self.report.add(ERROR, 'phase_mismatch', attr, self.names(attr)[mismatch],
+                                f"{column} node count does not match phases")
+        nodes1 = node_counts(self.circuit.column('lines', 'bus1'))
+        nodes2 = node_counts(self.circuit.column('lines', 'bus2'))
+        mismatch = (nodes1 > 0) & (nodes2 > 0) & (nodes1 != nodes2)
+        self.report.add(ERROR, 'phase_mismatch', 'lines', self.names('lines')[mismatch],
+                        "bus1 and bus2 connect a different number of nodes")
+
+    def check_ranges(self):
+        for attr, column, lower, inclusive, severity in self.RANGES:
+            values = self.circuit.column(attr, column)
+            missing = np.isnan(values)
+            self.report.add(ERROR, 'missing_value', attr, self.names(attr)[missing], f"{column} is not set")
+            with np.errstate(invalid='ignore'):
+                out = ~missing & ((values < lower) if inclusive else (values <= lower))
+            bound = '>=' if inclusive else '>'
+            self.report.add(severity, 'out_of_range', attr, self.names(attr)[out], f"{column} must be {bound} {lower}")
+
+    def check_connectivity(self):
+        if self.topology.root is None:
+            return
+        if not self.topology.is_connected():
+            self.report.add(ERROR, 'disconnected', 'buses', self.topology.disconnected_buses(),
+                            "bus is not connected to the source")
+
+    def check_kv(self):
+        """
+        Compare load and capacitor kV against the base kV propagated from the source through the transformers.
+        Single phase ratings may be line to neutral, so either the base or base/sqrt(3) is accepted.
+        """
+        if self.topology.root is None or len(self.circuit.tables['sources']) == 0:
+            return
+        kv_from = np.full(self.topology.n_branches, np.nan)
+        kv_to = np.full(self.topology.n_branches, np.nan)
+        windings = dict(zip(self.names('transformers'), zip(self.circuit.column('transformers', 'kv_primary'),
+                                                              self.circuit.column('transformers', 'kv_secondary'))))
+        for e in np.flatnonzero(self.topology.branch_kinds == 'transformer'):
+            kv_from[e], kv_to[e] = windings.get(self.topology.branch_names[e], (np.nan, np.nan))
+        base = self.topology.propagate(self.circuit.column('sources', 'basekv')[0], kv_from, kv_to)
+        for attr in ('loads', 'capacitors'):
+            buses = bus_keys(self.circuit.column(attr, 'bus'))
+            ids = np.array([self.topology.bus_index.get(b, -1) for b in buses], dtype=np.int64)
+            kv = self.circuit.column(attr, 'kv')
+            bus_kv = np.where(ids >= 0, base[np.maximum(ids, 0)], np.nan)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                line_to_line = np.abs(kv / bus_kv - 1) <= KV_TOLERANCE
+                line_to_neutral = np.abs(kv * np.sqrt(3) / bus_kv - 1) <= KV_TOLERANCE
+            checked = ~np.isnan(kv) & ~np.isnan(bus_kv)
+            mismatch = checked & ~line_to_line & ~line_to_neutral
+            self.report.add(ERROR, 'kv_mismatch', attr, self.names(attr)[mismatch],
+                            "kv does not match the base kV of its bus")
+
+
+# Shared component classes a circuit references by name, with the referencing column
+SHARED_REFERENCES = {
+    'linecodes': (LineCode, 'lines', 'linecode'),
+    'loadshapes': (LoadShape, 'loads', 'yearly'),
+}
+
+def stored_references(db, circuit):
+    """
+    Lower case names of the shared linecodes and loadshapes referenced by the circuit that are stored in the database
+    """
+    ret = {}
+    for attr, (model, referencing, column) in SHARED_REFERENCES.items():
+        values, missing = _strings(circuit.column(referencing, column))
+        names = sorted(set(np.char.lower(values[~missing]).tolist()))
+        ret[attr] = set()
+        # batches keep the statement below the bind parameter limit
+        for i in range(0, len(names), 1000):
+            statement = select(func.lower(model.name)).where(func.lower(model.name).in_(names[i:i + 1000]))
+            ret[attr].update(db.execute(statement).scalars())
+    return ret
+
+def validate_circuit(circuit, topology=None, db=None):
+    """
+    Validate a Circuit or ColumnarCircuit, returns a ValidationReport. With db, linecode and loadshape references
+    also resolve against the stored shared tables, as needed for submitted payloads.
+    """
+    if not isinstance(circuit, ColumnarCircuit):
+        circuit = ColumnarCircuit.from_circuit(circuit)
+    stored = stored_references(db, circuit) if db is not None else None
+    return CircuitValidator(circuit, topology, stored).validate()
+
+
+_report_cache = VersionedCache(maxsize=64)
+
+def get_validation(circuit_id, version, circuit, topology=None):
+    """
+    Validation report of a circuit version, models are only checked again after an update
+    """
+    return _report_cache.get(circuit_id, version, lambda: validate_circuit(circuit, topology))
+
+def check_valid(report):
+    if not report.ok:
+        summary = '; '.join(f"{i['count']} {i['component']} {i['code']}" for i in report.errors)
+        raise ModelValidationError(f"Circuit {report.circuit_id} failed validation: {summary}", report)
@@ -0,0 +1,66 @@
+import sys
+import time
+import logging
+
+from opendss_powerflow_service.database.engine import get_db
+from opendss_powerflow_service.models.circuit import Circuit
+from opendss_powerflow_service.models.columnar import ColumnarCircuit
+from opendss_powerflow_service.models.modelCRUD import SqlCircuitModelCRUD
+from opendss_powerflow_service.models.validation import validate_circuit
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def synthetic_circuit(n_buses):
+    """
+    Radial feeder JSON with one line and one load per bus below the source bus
+    """
+    buses = [f'b{i}' for i in range(n_buses + 1)]
+    return {
+        'fields': {'substation': 'benchmark', 'feeder': 'benchmark'},
+        'sources': [{'name': 'source', 'bus1': buses[0], 'pu': '1.0', 'basekv': 12.47}],
+        'buses': [{'name': b, 'x': float(i), 'y': 0.0} for i, b in enumerate(buses)],
+        'lines': [{'name': f'l{i}', 'bus1': f'{buses[i - 1]}.1.2.3', 'bus2': f'{buses[i]}.1.2.3', 'length': 0.1,
+                   'units': 'km', 'phases': 3} for i in range(1, n_buses + 1)],
+        'loads': [{'name': f'ld{i}', 'bus': f'{buses[i]}.1.2.3', 'kw': 10.0, 'kvar': 2.0, 'kv': 12.47,
+                   'conn': 'wye', 'phases': 3} for i in range(1, n_buses + 1)],
+    }
+
+def _elements(json_data):
+    return sum(len(v) for k, v in json_data.items() if k != 'fields')
+
+def bench_legacy(db, circuit_id, json_data):
+    start = time.perf_counter()
+    circuit_model = Circuit.model_construct()
+    circuit_model.from_json(json_data)
+    SqlCircuitModelCRUD(db).create(circuit_model, circuit_id)
+    db.commit()
+    return time.perf_counter() - start
+
+def bench_bulk(db, circuit_id, json_data):
+    start = time.perf_counter()
+    circuit = ColumnarCircuit.from_json(circuit_id, json_data)
+    validate_circuit(circuit)
+    SqlCircuitModelCRUD(db).create_bulk(circuit, circuit_id)
+    db.commit()
+    return time.perf_counter() - start
+
+def main(n_buses=10000) -> None:
+    db = next(get_db())
+    modelcrud = SqlCircuitModelCRUD(db)
+    json_data = synthetic_circuit(n_buses)
+    elements = _elements(json_data)
+    for label, bench in (('legacy', bench_legacy), ('bulk', bench_bulk)):
+        circuit_id = f'benchmark_{label}'
+        try:
+            seconds = bench(db, circuit_id, json_data)
+            logger.info(f"{label}: {elements} elements in {seconds:.2f}s, {elements / seconds:.0f} elements/s")
+        finally:
+            db.rollback()
+            modelcrud.delete(Circuit.model_construct(), circuit_id)
+            db.commit()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,45 @@
+import argparse
+import logging
+
+from opendss_powerflow_service.database.engine import get_db
+from opendss_powerflow_service.models.modelCRUD import SqlModelCRUD, SqlCircuitModelCRUD
+from opendss_powerflow_service.models.circuit import Circuits
+from opendss_powerflow_service.simulation.dss_export import export_circuits
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def resolve_circuits(circuits, substation=None, all_circuits=False):
+    db = next(get_db())
+    circuit_ids = list(circuits or [])
+    if substation is not None:
+        circuit_ids += [i for i in SqlCircuitModelCRUD(db).list_substation_circuits(substation) if i not in circuit_ids]
+    if all_circuits:
+        circuit_ids += [i.circuit for i in SqlModelCRUD(db).read(Circuits) if i.circuit not in circuit_ids]
+    db.close()
+    return circuit_ids
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Export stored circuits as OpenDSS files')
+    parser.add_argument('circuits', nargs='*', help='Circuit ids to export')
+    parser.add_argument('--substation', help='Export every circuit under this substation')
+    parser.add_argument('--all', action='store_true', help='Export every stored circuit')
+    parser.add_argument('--out', default=None, help='Export root, defaults to EXPORT_DIR')
+    parser.add_argument('--source', choices=('db', 'columnar'), default='db', help='Stream rows from the database or build the columnar circuit first')
+    parser.add_argument('--processes', type=int, default=None, help='Export processes, defaults to the cpu count')
+    parser.add_argument('--force', action='store_true', help='Export circuits whose version was already exported')
+    args = parser.parse_args()
+    circuit_ids = resolve_circuits(args.circuits, args.substation, args.all)
+    logger.info(f"Exporting {len(circuit_ids)} circuits")
+    for result in export_circuits(circuit_ids, args.out, args.source, args.force, args.processes):
+        if 'error' in result:
+            logger.error(f"{result['circuit']}: {result['error']}")
+        elif result['skipped']:
+            logger.info(f"{result['circuit']}: unchanged, {result['path']}")
+        else:
+            logger.info(f"{result['circuit']}: {sum(result['counts'].values())} elements in {result['seconds']:.2f}s, {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
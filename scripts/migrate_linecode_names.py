@@ -0,0 +1,37 @@
+import logging
+
+from sqlalchemy.sql import text
+
+from opendss_powerflow_service.database.engine import engine
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Name SQLModel gives the unique constraint of LineCode.name when it creates the table
+CONSTRAINT = 'linecode_name_key'
+
+def migrate(connection):
+    """
+    Turn the per-circuit linecode rows of databases created before linecodes became a shared library into one row per
+    name: duplicates keep the row inserted first, then the unique constraint used by the upserts is added
+    """
+    exists = connection.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {'name': CONSTRAINT}).first()
+    if exists is not None:
+        logger.info(f"{CONSTRAINT} already exists")
+        return 0
+    removed = connection.execute(text("""
+        DELETE FROM linecode a USING linecode b
+        WHERE a.name = b.name AND a.id > b.id
+    """)).rowcount
+    connection.execute(text(f"ALTER TABLE linecode ADD CONSTRAINT {CONSTRAINT} UNIQUE (name)"))
+    return removed
+
+def main() -> None:
+    with engine.begin() as connection:
+        removed = migrate(connection)
+    logger.info(f"Removed {removed} duplicate linecodes")
+
+
+if __name__ == "__main__":
+    main()
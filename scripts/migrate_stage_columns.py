@@ -0,0 +1,25 @@
+import logging
+
+from sqlalchemy.sql import text
+
+from opendss_powerflow_service.database.engine import engine
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# PfResult stage timing columns added after the first release of the stage timers
+COLUMNS = ('cache_lookup_time', 'topology_time', 'validate_time', 'summary_time')
+
+def migrate(connection):
+    for column in COLUMNS:
+        connection.execute(text(f"ALTER TABLE pfresult ADD COLUMN IF NOT EXISTS {column} double precision"))
+
+def main() -> None:
+    with engine.begin() as connection:
+        migrate(connection)
+    logger.info(f"pfresult has the stage columns {', '.join(COLUMNS)}")
+
+
+if __name__ == "__main__":
+    main()
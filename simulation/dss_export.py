@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlmodel import select
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.models.circuit import Circuits
+from opendss_powerflow_service.models.columnar import COMPONENTS, ColumnarCircuit, column_types, component_query
+from opendss_powerflow_service.simulation.loadshape_store import loadshape_store
+
+# Rows fetched per round trip when streaming a component table from the database
+STREAM_ROWS = 10000
+
+INDEX_FILE = 'current.json'
+LOADSHAPE_DIR = 'loadshapes'
+
+
+def source_command(circuit_id, i):
+    return f"New circuit.{circuit_id} bus1={i.bus1} pu={i.pu} basekv={i.basekv} r1={i.r1} x1={i.x1} r0={i.r1} x0={i.x1}"
+
+def linecode_command(i):
+    return f"New Linecode.{i.name} units={i.units} nphases={i.nphases} Faultrate={i.faultrate} Rmatrix=({i.rmatrix}) Xmatrix=({i.xmatrix}) Cmatrix=({i.cmatrix}) normamps={i.normamps}"
+
+def line_command(i):
+    return f"New Line.{i.name} units={i.units} Length={i.length} bus1={i.bus1} bus2={i.bus2} switch={i.switch} enabled={i.enabled} phases={i.phases} Linecode={i.linecode}"
+
+def transformer_command(i):
+    return f"New Transformer.{i.name} phases={i.phases} windings=2 wdg=1 conn=delta Kv={i.kv_primary} kva={i.kva} bus={i.bus_primary} wdg=2 conn=delta Kv={i.kv_secondary} kva={i.kva} bus={i.bus_secondary}"
+
+def capacitor_command(i):
+    return f"New Capacitor.{i.name} bus1={i.bus} Kv={i.kv} Kvar={i.kvar} conn={i.conn} phases={i.phases}"
+
+def load_command(i):
+    yearly = f" yearly={i.yearly}" if getattr(i, 'yearly', None) else ""
+    return f"New Load.{i.name} conn={i.conn} bus1={i.bus} kV={i.kv} kW={i.kw} kvar={i.kvar} Phases={i.phases}{yearly}"
+
+# Component classes after the circuit definition, in definition order, with the file they are exported to
+CLASS_COMMANDS = (
+    ('linecodes', 'LineCodes.dss', linecode_command),
+    ('lines', 'Lines.dss', line_command),
+    ('transformers', 'Transformers.dss', transformer_command),
+    ('capacitors', 'Capacitors.dss', capacitor_command),
+    ('loadshapes', 'LoadShapes.dss', loadshape_store.command),
+    ('loads', 'Loads.dss', load_command),
+)
+
+
+class _HashingWriter:
+    """
+    Writes lines to a file and feeds them into the export digest
+    """
+
+    def __init__(self, path, digest):
+        self.digest = digest
+        self.count = 0
+        self._file = open(path, 'w', newline='\n')
+        self.digest.update(os.path.basename(path).encode() + b'\0')
+
+    def write(self, line):
+        data = line + '\n'
+        self._file.write(data)
+        self.digest.update(data.encode())
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def db_rows(db, circuit_id, attr):
+    """
+    Rows of a component class streamed from a server side cursor, the rows have attribute access
+    """
+    return db.execute(component_query(attr, circuit_id).execution_options(yield_per=STREAM_ROWS))
+
+def columnar_rows(circuit, attr):
+    names = [name for name, _ in column_types(COMPONENTS[attr])]
+    row = namedtuple(attr, names)
+    return map(row._make, circuit.records(attr, names))
+
+def _write_model(path, circuit_id, rows):
+    """
+    Write the per-class files and Master.dss into path, returns the content digest and the element counts
+    """
+    digest = hashlib.sha256()
+    counts = {}
+    redirects = []
+    for attr, filename, command in CLASS_COMMANDS:
+        writer = _HashingWriter(os.path.join(path, filename), digest)
+        try:
+            for i in rows(attr):
+                if attr == 'loadshapes':
+                    os.makedirs(os.path.join(path, LOADSHAPE_DIR), exist_ok=True)
+                    shutil.copyfile(loadshape_store.path(i.hash), os.path.join(path, LOADSHAPE_DIR, f'{i.hash}.sng'))
+                    writer.write(command(i, f'{LOADSHAPE_DIR}/{i.hash}.sng'))
+                else:
+                    writer.write(command(i))
+        finally:
+            writer.close()
+        counts[attr] = writer.count
+        if writer.count:
+            redirects.append(f'Redirect {filename}')
+        else:
+            os.remove(os.path.join(path, filename))
+    coords = _HashingWriter(os.path.join(path, 'BusCoords.dss'), digest)
+    try:
+        for i in rows('buses'):
+            if i.x is not None and i.y is not None:
+                coords.write(f'{i.name}, {i.x}, {i.y}')
+    finally:
+        coords.close()
+    counts['buses'] = coords.count
+    master = _HashingWriter(os.path.join(path, 'Master.dss'), digest)
+    try:
+        master.write('Clear')
+        circuit_source = next(iter(rows('sources')), None)
+        if circuit_source is not None:
+            master.write(source_command(circuit_id, circuit_source))
+        for line in redirects:
+            master.write(line)
+        if coords.count:
+            master.write('Buscoords BusCoords.dss')
+        else:
+            os.remove(os.path.join(path, 'BusCoords.dss'))
+    finally:
+        master.close()
+    return digest.hexdigest(), counts
+
+def _read_index(circuit_root):
+    try:
+        with open(os.path.join(circuit_root, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_index(circuit_root, index):
+    tmp = os.path.join(circuit_root, f'{INDEX_FILE}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(circuit_root, INDEX_FILE))
+
+def export_circuit(db, circuit_id, root=None, source='db', force=False):
+    """
+    Write the stored circuit as OpenDSS files under root/<circuit_id>/<content digest>/, without the engine.
+    A circuit whose stored version was already exported is skipped, re-exports with identical content reuse the
+    existing directory. Load it with `compile Master.dss`.
+    """
+    start = time.perf_counter()
+    root = root or settings.EXPORT_DIR
+    fields = db.execute(select(Circuits).where(Circuits.circuit == circuit_id)).scalar_one()
+    circuit_root = os.path.join(root, circuit_id)
+    index = _read_index(circuit_root)
+    if (not force and index is not None and index.get('version') == fields.version
+            and os.path.isdir(os.path.join(circuit_root, index['digest']))):
+        return dict(index, circuit=circuit_id, path=os.path.join(circuit_root, index['digest']), skipped=True,
+                    seconds=time.perf_counter() - start)
+    if source == 'columnar':
+        circuit = ColumnarCircuit.from_db(db, circuit_id)
+        rows = lambda attr: columnar_rows(circuit, attr)
+    else:
+        rows = lambda attr: db_rows(db, circuit_id, attr)
+    os.makedirs(circuit_root, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.export_', dir=circuit_root)
+    os.chmod(tmp, 0o755)
+    try:
+        digest, counts = _write_model(tmp, circuit_id, rows)
+        digest = digest[:16]
+        path = os.path.join(circuit_root, digest)
+        if os.path.isdir(path):
+            shutil.rmtree(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    index = {'version': fields.version, 'digest': digest, 'counts': counts}
+    _write_index(circuit_root, index)
+    return dict(index, circuit=circuit_id, path=path, skipped=False, seconds=time.perf_counter() - start)
+
+def _export_member(circuit_id, root, source, force):
+    # imported here so that spawned pool processes open their own database session
+    from opendss_powerflow_service.database.engine import get_db
+    db = next(get_db())
+    try:
+        return export_circuit(db, circuit_id, root, source, force)
+    except Exception as e:
+        return {'circuit': circuit_id, 'error': str(e)}
+    finally:
+        db.close()
+
+def export_circuits(circuit_ids, root=None, source='db', force=False, processes=None):
+    """
+    Export many circuits, one circuit per task over a pool of processes
+    """
+    processes = max(1, min(processes or os.cpu_count() or 1, len(circuit_ids) or 1))
+    if processes == 1:
+        return [_export_member(i, root, source, force) for i in circuit_ids]
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [pool.submit(_export_member, i, root, source, force) for i in circuit_ids]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return results
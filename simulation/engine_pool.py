@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.utils.cache import VersionedCache
+from opendss_powerflow_service.utils.lazy import lazy_import
+
+dss = lazy_import('opendssdirect')
+
+
+class WarmEngine:
+    """
+    An OpenDSS engine instance with one circuit version already compiled into it
+    """
+
+    def __init__(self, engine, circuit_id, version, n_components=None):
+        self.engine = engine
+        self.circuit_id = circuit_id
+        self.version = version
+        self.n_components = n_components
+        self.solves = 0
+        # iterations of the last solve from the zero-load start, the baseline for warm-started solves
+        self.cold_iterations = None
+
+
+class EnginePool:
+    """
+    Keeps the most recently used circuits loaded in separate OpenDSS contexts so repeat solves skip the model load.
+    Falls back to the single global engine when the installed opendssdirect has no context support.
+    """
+
+    def __init__(self, maxsize=4):
+        self._maxsize = maxsize
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        # checked on use so that building the pool does not import the engine
+        return self._maxsize if hasattr(dss, 'NewContext') else 1
+
+    def get(self, circuit_id, version):
+        with self._lock:
+            entry = self._engines.get(circuit_id)
+            if entry is None or entry.version != version:
+                return None
+            self._engines.move_to_end(circuit_id)
+            return entry
+
+    def load(self, circuit_id, version, commands, n_components=None):
+        with self._lock:
+            entry = self._engines.pop(circuit_id, None)
+            if entry is not None:
+                engine = entry.engine
+            elif len(self._engines) >= self.maxsize:
+                # reuse the context of the least recently used circuit
+                engine = self._engines.popitem(last=False)[1].engine
+            else:
+                engine = dss.NewContext() if hasattr(dss, 'NewContext') else dss
+            for command in commands:
+                engine.Text.Command(command)
+            entry = WarmEngine(engine, circuit_id, version, n_components)
+            self._engines[circuit_id] = entry
+            return entry
+
+    def discard(self, circuit_id):
+        with self._lock:
+            self._engines.pop(circuit_id, None)
+
+    def loaded(self):
+        with self._lock:
+            return [(e.circuit_id, e.version) for e in self._engines.values()]
+
+
+engine_pool = EnginePool(settings.WARM_ENGINES)
+
+# OpenDSS command lists per circuit version, cheap to replay into a fresh engine
+compiled_models = VersionedCache(maxsize=64)
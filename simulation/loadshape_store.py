@@ -0,0 +1,63 @@
+import os
+import hashlib
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.models.components import LoadShape
+
+DTYPE = np.float32
+
+
+def shape_name(digest):
+    return f"ls_{digest[:16]}"
+
+
+class LoadShapeStore:
+    """
+    Multiplier series as raw float32 files named by their content hash, identical shapes are stored once.
+    The files use the OpenDSS sngfile layout so the engine memory-maps them itself.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.LOADSHAPE_STORE_DIR
+
+    def path(self, digest):
+        return os.path.abspath(os.path.join(self.root, f"{digest}.sng"))
+
+    def put(self, values):
+        data = np.ascontiguousarray(values, dtype=DTYPE)
+        digest = hashlib.sha256(data.tobytes()).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(self.root, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            data.tofile(tmp)
+            os.replace(tmp, path)
+        return digest
+
+    def load(self, digest):
+        return np.memmap(self.path(digest), dtype=DTYPE, mode='r')
+
+    def register(self, db, values, interval=1.0):
+        """
+        Store the series and its LoadShape row, returns the shape name to reference from Load.yearly
+        """
+        digest = self.put(values)
+        name = shape_name(digest)
+        statement = (insert(LoadShape.__table__)
+                     .values(name=name, hash=digest, npts=len(values), interval=interval)
+                     .on_conflict_do_nothing(index_elements=['hash']))
+        db.execute(statement)
+        return name
+
+    def command(self, loadshape, path=None):
+        """
+        OpenDSS definition of a stored shape, path overrides the store file (e.g. a copy next to an exported model)
+        """
+        return (f"New LoadShape.{loadshape.name} npts={loadshape.npts} interval={loadshape.interval} "
+                f"mult=(sngfile={path or self.path(loadshape.hash)}) MemoryMapping=Yes")
+
+
+loadshape_store = LoadShapeStore()
@@ -0,0 +1,42 @@
+import numpy as np
+from sqlmodel import select
+
+from opendss_powerflow_service.models.result import PfResultLoss
+
+
+def loss_totals(classes, kw, kvar):
+    """
+    Feeder totals and totals per element class of per-element loss arrays
+    """
+    classes = np.asarray(classes, dtype=str)
+    kw = np.asarray(kw, dtype=np.float64)
+    kvar = np.asarray(kvar, dtype=np.float64)
+    labels, index = np.unique(classes, return_inverse=True)
+    kw_by_class = np.bincount(index, weights=kw, minlength=len(labels))
+    kvar_by_class = np.bincount(index, weights=kvar, minlength=len(labels))
+    return {
+        'kw': float(kw.sum()),
+        'kvar': float(kvar.sum()),
+        'by_class': {str(c): {'elements': int(n), 'kw': float(p), 'kvar': float(q)}
+                     for c, n, p, q in zip(labels, np.bincount(index, minlength=len(labels)), kw_by_class, kvar_by_class)},
+    }
+
+def load_loss_arrays(db, run_id):
+    rows = db.execute(select(PfResultLoss.element_class, PfResultLoss.name, PfResultLoss.kw_losses, PfResultLoss.kvar_losses)
+                      .where(PfResultLoss.run_id == run_id)).all()
+    classes = np.array([row[0] for row in rows], dtype=object)
+    names = np.array([row[1] for row in rows], dtype=object)
+    values = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), 2)
+    return classes, names, values
+
+def loss_report(db, run_id, top_n=20):
+    classes, names, values = load_loss_arrays(db, run_id)
+    kw = np.nan_to_num(values[:, 0])
+    n = max(0, min(top_n, len(kw)))
+    top = np.argsort(-kw)[:n]
+    return {
+        'run_id': run_id,
+        'totals': loss_totals(classes, kw, np.nan_to_num(values[:, 1])),
+        'top': [{'element_class': str(classes[i]), 'name': str(names[i]), 'kw': float(values[i, 0]), 'kvar': float(values[i, 1])}
+                for i in top],
+    }
@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.simulation.simulation_manager import SimulationManager
+from opendss_powerflow_service.simulation.timeseries_store import TimeseriesWriter, TimeseriesReader, DTYPE, stitch
+
+
+def plan_chunks(steps, chunks):
+    """
+    Split steps into at most chunks contiguous [first, stop) ranges of near equal length
+    """
+    bounds = np.linspace(0, steps, min(chunks, steps) + 1).round().astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def run_chunk(circuit_id, simulation_params, commands, first, stop, warmup_steps, path, overlap_next):
+    """
+    Solve steps [first, stop) on the engine of this process and store them at path. The chunk starts warmup_steps
+    early so control states settle, those steps are solved but not stored. With overlap_next the first step of the
+    next chunk is solved as well and returned, continuing this chunk's state as a sequential run would.
+    """
+    simulation = SimulationManager(circuit_id, simulation_params)
+    if commands is None:
+        simulation.load_file()
+    else:
+        simulation.load_commands(commands)
+    start, timestep, _ = simulation.timeseries_steps()
+    lead = min(warmup_steps, first)
+    n_steps = stop - first
+    boundary = None
+    began = time.perf_counter()
+    with TimeseriesWriter(path, simulation.timeseries_quantities()) as writer:
+        chunk_start = start + datetime.timedelta(minutes=timestep * (first - lead))
+        for step, values in simulation.iter_timeseries(chunk_start, timestep, lead + n_steps + int(overlap_next)):
+            if step < lead:
+                continue
+            if step - lead == n_steps:
+                boundary = {q: np.asarray(v, dtype=DTYPE) for q, v in values.items()}
+            else:
+                writer.append(values)
+    return {'first': first, 'stop': stop, 'boundary': boundary, 'solve_seconds': time.perf_counter() - began}
+
+def boundary_deviation(chunk_results, part_paths):
+    """
+    Difference between the first stored step of each chunk and the same step solved by the previous chunk
+    """
+    ret = []
+    for previous, part_path in zip(chunk_results[:-1], part_paths[1:]):
+        reader = TimeseriesReader(part_path)
+        deviation = {'step': previous['stop']}
+        for quantity, sequential in previous['boundary'].items():
+            diff = np.abs(reader.window(quantity, 0, 1)[0] - sequential)
+            deviation[quantity] = {
+                'max_abs': float(diff.max()) if diff.size else 0.0,
+                'mean_abs': float(diff.mean()) if diff.size else 0.0,
+            }
+        ret.append(deviation)
+    return ret
+
+def run_parallel_qsts(circuit_id, simulation_params, commands, path, chunks, warmup_steps=24, max_workers=None,
+                      progress=None, **meta):
+    """
+    Time-series run split into chunks solved by separate processes, each with its own engine, then stitched at path.
+    commands is the compiled circuit, None loads the modelpath of the simulation parameters.
+    """
+    start, timestep, steps = SimulationManager(circuit_id, simulation_params).timeseries_steps()
+    plan = plan_chunks(steps, chunks)
+    max_workers = max_workers or min(len(plan), settings.QSTS_MAX_PROCESSES or os.cpu_count() or 1)
+    part_paths = [os.path.join(path, 'parts', str(i)) for i in range(len(plan))]
+    results = [None] * len(plan)
+    began = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = {}
+        for i, (first, stop) in enumerate(plan):
+            future = pool.submit(run_chunk, circuit_id, simulation_params, commands, first, stop, warmup_steps,
+                                 part_paths[i], i < len(plan) - 1)
+            futures[future] = i
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(done, len(plan))
+    wall_seconds = time.perf_counter() - began
+    stitch(path, part_paths, start=str(start), timestep=timestep, chunks=len(plan), warmup_steps=warmup_steps, **meta)
+    deviation = boundary_deviation(results, part_paths)
+    shutil.rmtree(os.path.join(path, 'parts'), ignore_errors=True)
+    solve_seconds = sum(r['solve_seconds'] for r in results)
+    return {
+        'steps': steps,
+        'chunks': len(plan),
+        'processes': max_workers,
+        'warmup_steps': warmup_steps,
+        'wall_seconds': wall_seconds,
+        'chunk_solve_seconds': solve_seconds,
+        # chunk solve time over wall time, how many chunks solved at once on average, not a speedup over a sequential run
+        'parallelism': solve_seconds / wall_seconds if wall_seconds > 0 else None,
+        'boundary_deviation': deviation,
+    }
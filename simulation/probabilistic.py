@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.utils.lazy import lazy_import
+
+dss = lazy_import('opendssdirect')
+
+# Samples solved between two statistics updates, bounds the memory of a sampling process
+BLOCK_SAMPLES = 100
+
+# Voltage range covered by the quantile histograms, values outside fall into an under/overflow bin
+HIST_RANGE = (0.8, 1.2)
+HIST_BINS = 200
+
+
+class StreamingStats:
+    """
+    Per-element running statistics over blocks of samples x elements: Welford mean/variance, min/max, a fixed-bin
+    histogram for quantiles and the count of values outside [vmin, vmax]. Memory depends on the element count only,
+    and two instances built from disjoint samples merge exactly.
+    """
+
+    def __init__(self, n_elements, vmin=0.95, vmax=1.05, hist_range=HIST_RANGE, bins=HIST_BINS):
+        self.count = 0
+        self.vmin = vmin
+        self.vmax = vmax
+        self.lo, self.hi = hist_range
+        self.bins = bins
+        self.mean = np.zeros(n_elements)
+        self.m2 = np.zeros(n_elements)
+        self.min = np.full(n_elements, np.inf)
+        self.max = np.full(n_elements, -np.inf)
+        self.hist = np.zeros((n_elements, bins + 2), dtype=np.int64)
+        self.violations = np.zeros(n_elements, dtype=np.int64)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if len(block) == 0:
+            return
+        mean = block.mean(axis=0)
+        self._combine(len(block), mean, ((block - mean) ** 2).sum(axis=0))
+        np.minimum(self.min, block.min(axis=0), out=self.min)
+        np.maximum(self.max, block.max(axis=0), out=self.max)
+        width = (self.hi - self.lo) / self.bins
+        idx = np.clip(np.floor((block - self.lo) / width).astype(np.int64) + 1, 0, self.bins + 1)
+        n_elements = block.shape[1]
+        flat = (idx + np.arange(n_elements) * (self.bins + 2)).ravel()
+        self.hist += np.bincount(flat, minlength=n_elements * (self.bins + 2)).reshape(n_elements, self.bins + 2)
+        self.violations += ((block < self.vmin) | (block > self.vmax)).sum(axis=0)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self._combine(other.count, other.mean, other.m2)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.hist += other.hist
+        self.violations += other.violations
+        return self
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def quantile(self, q):
+        """
+        Quantile estimate interpolated within the histogram bin, exact to a bin width inside the histogram range
+        """
+        cdf = self.hist.cumsum(axis=1)
+        target = q * self.count
+        b = (cdf < target).sum(axis=1)
+        rows = np.arange(len(b))
+        before = np.where(b > 0, cdf[rows, np.maximum(b - 1, 0)], 0)
+        inside = np.maximum(self.hist[rows, np.minimum(b, self.bins + 1)], 1)
+        width = (self.hi - self.lo) / self.bins
+        value = self.lo + (b - 1 + (target - before) / inside) * width
+        value = np.where(b == 0, self.min, np.where(b >= self.bins + 1, self.max, value))
+        return np.clip(value, self.min, self.max)
+
+    def violation_probability(self):
+        return self.violations / max(self.count, 1)
+
+
+def sample_multipliers(rng, n_samples, n_loads, load_std):
+    return np.clip(rng.normal(1.0, load_std, size=(n_samples, n_loads)), 0.0, None).astype(np.float32)
+
+def run_samples(commands, n_samples, seed, load_std, vmin, vmax):
+    """
+    Solve n_samples random load levels on the engine of this process and return the folded statistics.
+    Each load gets a private load shape holding its block of sampled multipliers, the engine then steps through the
+    block in yearly mode and applies all multipliers itself.
+    """
+    for command in commands:
+        dss.Text.Command(command)
+    loads = dss.Loads.AllNames()
+    nodes = dss.Circuit.AllNodeNames()
+    stats = StreamingStats(len(nodes), vmin, vmax)
+    rng = np.random.default_rng(seed)
+    shape_dir = tempfile.mkdtemp(prefix='montecarlo_')
+    failed = 0
+    try:
+        done = 0
+        while done < n_samples:
+            n = min(BLOCK_SAMPLES, n_samples - done)
+            multipliers = sample_multipliers(rng, n, len(loads), load_std)
+            for j, load in enumerate(loads):
+                path = os.path.join(shape_dir, f'{j}.sng')
+                np.ascontiguousarray(multipliers[:, j]).tofile(path)
+                verb = 'New' if done == 0 else 'Edit'
+                dss.Text.Command(f"{verb} LoadShape.mc_{j} npts={n} interval=1 mult=(sngfile={path})")
+                if done == 0:
+                    dss.Text.Command(f"Edit Load.{load} yearly=mc_{j}")
+            dss.Text.Command("set mode=yearly stepsize=1h number=1")
+            dss.Solution.Hour(0)
+            dss.Solution.Seconds(0)
+            block = np.empty((n, len(nodes)))
+            kept = 0
+            for _ in range(n):
+                dss.Solution.Solve()
+                if not dss.Solution.Converged():
+                    failed += 1
+                    continue
+                block[kept] = dss.Circuit.AllBusMagPu()
+                kept += 1
+            stats.update(block[:kept])
+            done += n
+    finally:
+        shutil.rmtree(shape_dir, ignore_errors=True)
+    return nodes, stats, failed
+
+def run_monte_carlo(commands, samples, load_std=0.1, seed=None, vmin=0.95, vmax=1.05, processes=None, progress=None):
+    """
+    Spread the samples over processes with independent random streams and merge their statistics. The process
+    count is capped at QSTS_MAX_PROCESSES, or the cpu count, whatever the caller asks for.
+    """
+    limit = settings.QSTS_MAX_PROCESSES or os.cpu_count() or 1
+    processes = max(1, min(processes or limit, limit, samples))
+    shares = [len(s) for s in np.array_split(np.arange(samples), processes)]
+    seeds = np.random.SeedSequence(seed).spawn(processes)
+    nodes, stats, failed = None, None, 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [pool.submit(run_samples, commands, n, s, load_std, vmin, vmax) for n, s in zip(shares, seeds)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            part_nodes, part_stats, part_failed = future.result()
+            if stats is None:
+                nodes, stats = part_nodes, part_stats
+            else:
+                stats.merge(part_stats)
+            failed += part_failed
+            if progress is not None:
+                progress(done, processes)
+    return nodes, stats, failed
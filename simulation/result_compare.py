@@ -0,0 +1,76 @@
+import numpy as np
+from sqlmodel import select
+
+from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfResultLine
+
+NODE_QUANTITIES = ('volta', 'voltb', 'voltc')
+LINE_QUANTITIES = ('imax', 'kw', 'kvar', 'loading_percent')
+
+
+def load_run_arrays(db, model, run_id, quantities):
+    """
+    Read the named columns of one run straight into arrays, without building SQLModel objects
+    """
+    columns = [getattr(model, q) for q in quantities]
+    rows = db.execute(select(model.name, *columns).where(model.run_id == run_id)).all()
+    names = np.array([row[0] for row in rows], dtype=object)
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(quantities))
+    return names, values
+
+def align(names_a, names_b):
+    """
+    Indices into a and b of the element names present in both runs, in sorted name order
+    """
+    common, ia, ib = np.intersect1d(names_a.astype(str), names_b.astype(str), assume_unique=True, return_indices=True)
+    return common, ia, ib
+
+def compare_arrays(names_a, values_a, names_b, values_b, quantities, top_n=20):
+    common, ia, ib = align(names_a, names_b)
+    delta = values_b[ib] - values_a[ia]
+    abs_delta = np.abs(delta)
+    score = np.where(np.isnan(abs_delta), -np.inf, abs_delta).max(axis=1) if len(quantities) else np.zeros(len(common))
+    n = max(0, min(top_n, len(common)))
+    if n:
+        top = np.argpartition(-score, n - 1)[:n]
+        top = top[np.argsort(-score[top])]
+    else:
+        top = np.array([], dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        max_abs = np.nanmax(abs_delta, axis=0) if len(common) else np.full(len(quantities), np.nan)
+        mean_abs = np.nanmean(abs_delta, axis=0) if len(common) else np.full(len(quantities), np.nan)
+    return {
+        'matched': int(len(common)),
+        'only_in_a': int(len(names_a) - len(common)),
+        'only_in_b': int(len(names_b) - len(common)),
+        'max_abs_delta': _to_dict(quantities, max_abs),
+        'mean_abs_delta': _to_dict(quantities, mean_abs),
+        'top': [
+            {'name': str(common[i]),
+             'a': _to_dict(quantities, values_a[ia[i]]),
+             'b': _to_dict(quantities, values_b[ib[i]]),
+             'delta': _to_dict(quantities, delta[i])}
+            for i in top
+        ],
+    }
+
+def _to_dict(quantities, values):
+    return {q: (None if np.isnan(v) else float(v)) for q, v in zip(quantities, values)}
+
+def compare_runs(db, run_a, run_b, top_n=20):
+    """
+    Element-wise differences between two runs, elements are matched by name. Runs of different circuits are compared
+    as well, the response says so in same_circuit.
+    """
+    circuits = dict(db.execute(select(PfResult.id, PfResult.circuit).where(PfResult.id.in_((run_a, run_b)))).all())
+    ret = {
+        'run_a': run_a,
+        'run_b': run_b,
+        'circuit_a': circuits.get(run_a),
+        'circuit_b': circuits.get(run_b),
+        'same_circuit': circuits.get(run_a) == circuits.get(run_b),
+    }
+    for key, model, quantities in (('nodes', PfResultNode, NODE_QUANTITIES), ('lines', PfResultLine, LINE_QUANTITIES)):
+        names_a, values_a = load_run_arrays(db, model, run_a, quantities)
+        names_b, values_b = load_run_arrays(db, model, run_b, quantities)
+        ret[key] = compare_arrays(names_a, values_a, names_b, values_b, quantities, top_n)
+    return ret
@@ -0,0 +1,38 @@
+import numpy as np
+
+from opendss_powerflow_service.models.result import PfRunSummary
+
+
+def summarize_run(run_id, pf_fields, node_names, node_voltages, lresults, losses, vmin=0.95, vmax=1.05):
+    """
+    Aggregates of one run for the dashboard, computed on the in-memory result arrays. Nodes at 0 pu are not
+    energized and are left out of the voltage extremes and violation counts.
+    """
+    names = np.asarray(node_names, dtype=object)
+    vpu = np.asarray(node_voltages, dtype=np.float64)
+    energized = vpu > 0
+    names, vpu = names[energized], vpu[energized]
+    loading = np.array([np.nan if l.loading_percent is None else l.loading_percent for l in lresults], dtype=np.float64)
+    loading[~np.isfinite(loading)] = np.nan
+    summary = PfRunSummary(
+        run_id=run_id,
+        circuit=pf_fields.get('circuit'),
+        run_timestamp=pf_fields.get('run_timestamp'),
+        converged=bool(pf_fields.get('converged')),
+        nodes=int(len(vpu)),
+        total_losses_kw=float(losses[0]),
+        total_losses_kvar=float(losses[1]),
+        vmin=vmin,
+        vmax=vmax,
+        undervoltage_nodes=int((vpu < vmin).sum()),
+        overvoltage_nodes=int((vpu > vmax).sum()),
+        overloaded_lines=int((np.nan_to_num(loading) > 1.0).sum()),
+    )
+    if len(vpu):
+        lo, hi = int(vpu.argmin()), int(vpu.argmax())
+        summary.min_pu_voltage, summary.min_pu_node = float(vpu[lo]), str(names[lo])
+        summary.max_pu_voltage, summary.max_pu_node = float(vpu[hi]), str(names[hi])
+    if len(loading) and not np.isnan(loading).all():
+        worst = int(np.nanargmax(loading))
+        summary.worst_line, summary.worst_line_loading = lresults[worst].name, float(loading[worst])
+    return summary
@@ -1,10 +1,20 @@
 import os
+import csv
 import json
+import tempfile
 from datetime import datetime
 
-import opendssdirect as dss
+import numpy as np
 
-from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfResultLine
+from opendss_powerflow_service.models.result import PfResult, PfResultNode, PfResultLine, PfFaultResult
+from opendss_powerflow_service.simulation.dss_export import CLASS_COMMANDS, source_command
+from opendss_powerflow_service.utils.log import get_logger
+from opendss_powerflow_service.utils.lazy import lazy_import
+
+# executed on first use, the API process imports this module without ever solving
+dss = lazy_import('opendssdirect')
+
+logger = get_logger('simulation_manager')
 
 
 class SimulationManager:
@@ -14,42 +24,42 @@ class SimulationManager:
     simulation_params = None
     circuit_id = None
     nominal_voltages = None
+    node_names = None
+    node_voltages = None
 
-    def __init__(self, circuit_id, simulation_params: dict):
-        self.dss = dss
+    def __init__(self, circuit_id, simulation_params: dict, engine=None):
+        self.dss = engine if engine is not None else dss
         self.circuit_id = circuit_id
         if isinstance(simulation_params, str):
             self.simulation_params = json.loads(simulation_params)
         else:
             self.simulation_params = simulation_params
 
-    def load_circuit_model(self, circuit_id, circuit_model):
-        self.dss.Text.Command('clear')
+    @staticmethod
+    def compile_circuit_model(circuit_id, circuit_model):
+        """
+        OpenDSS commands that build the circuit, cached per circuit version by the workers
+        """
+        commands = ['clear']
         for i in circuit_model.sources:
-            dss_string = f"New circuit.{circuit_id} bus1={i.bus1} pu={i.pu} basekv={i.basekv} r1={i.r1} x1={i.x1} r0={i.r1} x0={i.x1}"
-            self.dss.Text.Command(dss_string)
+            commands.append(source_command(circuit_id, i))
             break
-        for i in circuit_model.linecodes:
-            dss_string = f"New Linecode.{i.name} units={i.units} nphases={i.nphases} Faultrate={i.faultrate} Rmatrix=({i.rmatrix}) Xmatrix=({i.xmatrix}) Cmatrix=({i.cmatrix}) normamps={i.normamps}"
-            self.dss.Text.Command(dss_string)
-        for i in circuit_model.lines:
-            dss_string = f"New Line.{i.name} units={i.units} Length={i.length} bus1={i.bus1} bus2={i.bus2} switch={i.switch} enabled={i.enabled} phases={i.phases} Linecode={i.linecode}"
-            self.dss.Text.Command(dss_string)
-        for i in circuit_model.transformers:
-            dss_string = f"New Transformer.{i.name} phases={i.phases} windings=2 wdg=1 conn=delta Kv={i.kv_primary} kva={i.kva} bus={i.bus_primary} wdg=2 conn=delta Kv={i.kv_secondary} kva={i.kva} bus={i.bus_secondary}"
-            self.dss.Text.Command(dss_string)
-        for i in circuit_model.capacitors:
-            dss_string = f"New Capacitor.{i.name} bus1={i.bus} Kv={i.kv} Kvar={i.kvar} conn={i.conn} phases={i.phases}"
-            self.dss.Text.Command(dss_string)
-        for i in circuit_model.loads:
-            dss_string = f"New Load.{i.name} conn={i.conn} bus1={i.bus} kV={i.kv} kW={i.kw} kvar={i.kvar} Phases={i.phases}"
-            self.dss.Text.Command(dss_string)
+        for attr, _, command in CLASS_COMMANDS:
+            commands.extend(command(i) for i in getattr(circuit_model, attr, None) or [])
+        return commands
+
+    def load_commands(self, commands):
+        for command in commands:
+            self.dss.Text.Command(command)
+
+    def load_circuit_model(self, circuit_id, circuit_model):
+        self.load_commands(self.compile_circuit_model(circuit_id, circuit_model))
 
     def save_circuit_model_to_disk(self):
         tmp_model_dir = os.path.join(self.model_dir, self.circuit_id)
         if not os.path.exists(tmp_model_dir):
             os.makedirs(tmp_model_dir)
-        print(f"Saving circuit model to {tmp_model_dir}")
+        logger.info("Saving circuit model to %s", tmp_model_dir)
         self.dss.Text.Command(f'save circuit dir="{tmp_model_dir}"')
 
     def export_data(self, export_type='capacity'):
@@ -63,24 +73,25 @@ class SimulationManager:
 
     def set_load(self, scaling_factor=None):
         tot = 0.0
-        dss.Loads.First()
+        self.dss.Loads.First()
         while True:
-            dss.Circuit.SetActiveElement(dss.Loads.Name())
+            self.dss.Circuit.SetActiveElement(self.dss.Loads.Name())
             if scaling_factor is not None:
-                new_kw = dss.Loads.kW() * 2
-                dss.Loads.kW(new_kw)
+                new_kw = self.dss.Loads.kW() * 2
+                self.dss.Loads.kW(new_kw)
                 tot += new_kw
-            if not dss.Loads.Next() > 0:
+                logger.debug("Scaled load %s to %s kW", self.dss.Loads.Name(), new_kw, extra={'sampled': True})
+            if not self.dss.Loads.Next() > 0:
                 break
-        print(f"Total load after scaling: {tot} kW")
+        logger.info("Total load after scaling: %s kW", tot)
 
     def create_pf_result(self):
         return {
             "circuit": self.circuit_id,
             "run_timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             "converged": self.dss.Solution.Converged(),
-            "total_kw": dss.Circuit.TotalPower()[0],
-            "total_kvar": dss.Circuit.TotalPower()[1],
+            "total_kw": self.dss.Circuit.TotalPower()[0],
+            "total_kvar": self.dss.Circuit.TotalPower()[1],
             "process_time": self.dss.Solution.ProcessTime(),
             "total_time": self.dss.Solution.TotalTime(),
             "total_iterations": self.dss.Solution.TotalIterations(),
@@ -91,65 +102,175 @@ class SimulationManager:
             'mode': self.dss.Solution.Mode()
             }
         
-    def run_powerflow(self, scaling_factor=None):
+    def run_powerflow(self, scaling_factor=None, warm_start=None):
+        """
+        Snapshot solve. With warm_start the engine iterates from the voltages of its previous solution, otherwise
+        the solution is reset to the zero-load starting point first. OpenDSS does not accept an externally supplied
+        voltage vector, so the only warm state is the one kept by the engine itself.
+
+        Solution.InitSnap does not reset the voltages, the engine only solves from zero load while its solution is
+        uninitialized, so the cold start runs the zero-load solve of calcv. This also sets the bus voltage bases,
+        which every run then shares as the first solve on an engine is always cold.
+        """
+        if warm_start is None:
+            warm_start = bool(self.simulation_params.get('warm_start'))
         if scaling_factor: 
             self.set_load(scaling_factor=scaling_factor)
+        if not warm_start:
+            self.dss.Text.Command('calcv')
         self.dss.run_command("solve")
         self.get_nomina_voltages()
-        return self.create_pf_result()
+        fields = self.create_pf_result()
+        fields['warm_start'] = warm_start
+        return fields
     
+    def timeseries_steps(self):
+        """
+        Start time, step length in minutes and number of steps of a time-series run from the simulation parameters
+        """
+        start = datetime.strptime(self.simulation_params.get('starttime') or '2009-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        end = datetime.strptime(self.simulation_params.get('endtime') or str(start), '%Y-%m-%d %H:%M:%S')
+        timestep = int(self.simulation_params.get('timestep') or 60)
+        steps = max(1, int((end - start).total_seconds() // (timestep * 60)))
+        return start, timestep, steps
+
+    def timeseries_quantities(self):
+        """
+        Element names per quantity recorded at every time step, in the order the step values are returned
+        """
+        return {
+            'voltage_pu': self.dss.Circuit.AllNodeNames(),
+            'total_power': ['kw', 'kvar'],
+        }
+
+    def iter_timeseries(self, start, timestep, steps):
+        """
+        Solve one step at a time in yearly mode and yield the step values, nothing is kept between steps
+        """
+        hour = (start - start.replace(month=1, day=1, hour=0, minute=0, second=0)).total_seconds() / 3600
+        self.dss.Text.Command(f"set mode=yearly stepsize={timestep}m number=1")
+        self.dss.Solution.Hour(int(hour))
+        self.dss.Solution.Seconds((hour - int(hour)) * 3600)
+        try:
+            for step in range(steps):
+                self.dss.Solution.Solve()
+                yield step, {
+                    'voltage_pu': self.dss.Circuit.AllBusMagPu(),
+                    'total_power': self.dss.Circuit.TotalPower()[:2],
+                }
+        finally:
+            # the engine may be a warm one shared with snapshot runs
+            self.dss.Text.Command("set mode=snapshot")
+
+    def run_fault_study(self):
+        """
+        One fault-study solve covering every bus, the engine is put back in snapshot mode afterwards
+        """
+        self.dss.Text.Command("set mode=faultstudy")
+        try:
+            self.dss.Solution.Solve()
+            fields = self.create_pf_result()
+            fields['mode'] = 'faultstudy'
+            return fields
+        finally:
+            self.dss.Text.Command("set mode=snapshot")
+
+    def get_fault_results(self):
+        """
+        Three-phase, SLG and LL fault currents of all buses from the fault study export
+        """
+        ret = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'faultstudy.csv')
+            self.dss.Text.Command(f'export faultstudy "{path}"')
+            with open(path, newline='') as f:
+                rows = csv.reader(f)
+                next(rows, None)
+                for row in rows:
+                    if len(row) < 4:
+                        continue
+                    name, i3ph, islg, ill = (i.strip() for i in row[:4])
+                    ret.append(PfFaultResult(name=name, circuit=self.circuit_id,
+                                             i3ph=float(i3ph), islg=float(islg), ill=float(ill)))
+        return ret
+
     def get_nomina_voltages(self):
         self.nominal_voltages = {}
-        dss.Loads.First()
+        self.dss.Loads.First()
         while True:
-            if dss.Loads.kV() and dss.Loads.kV() > 0:
-                self.nominal_voltages['Load.'+dss.Loads.Name()] = dss.Loads.kV()
-            if not dss.Loads.Next() > 0:
+            if self.dss.Loads.kV() and self.dss.Loads.kV() > 0:
+                self.nominal_voltages['Load.'+self.dss.Loads.Name()] = self.dss.Loads.kV()
+            if not self.dss.Loads.Next() > 0:
                 break
     
     def get_pce_elements(self):
-        dss.Circuit.FirstPCElement()
+        self.dss.Circuit.FirstPCElement()
         while True:
-            if dss.ActiveClass.ActiveClassName() == 'Load':
-                volt_magnitudes = dss.CktElement.VoltagesMagAng()
-                for phase in dss.CktElement.NodeOrder():
+            if self.dss.ActiveClass.ActiveClassName() == 'Load':
+                volt_magnitudes = self.dss.CktElement.VoltagesMagAng()
+                for phase in self.dss.CktElement.NodeOrder():
                     volta = volt_magnitudes.pop(0) / 1000  # Convert to kV
                     angle = volt_magnitudes.pop(0)
-            if not dss.Circuit.NextPCElement() > 0:
+            if not self.dss.Circuit.NextPCElement() > 0:
                 break
     
+    def get_node_voltages(self):
+        """
+        Node names and per-unit voltage magnitudes of the whole circuit, two bulk calls in matching order
+        """
+        return self.dss.Circuit.AllNodeNames(), self.dss.Circuit.AllBusMagPu()
+
     def get_bus_results(self):
-        buses = dss.Circuit.AllBusNames()
-        node_results = []
-        for bus in buses:
-            nresult = PfResultNode(name=bus, circuit=self.circuit_id)
-            volt_magnitudes = dss.Bus.puVmagAngle()[::2]
-            for phase in dss.Bus.Nodes():
-                if phase == 1:
-                    nresult.volta = volt_magnitudes.pop(0)
-                elif phase == 2:
-                    nresult.voltb = volt_magnitudes.pop(0)
-                elif phase == 3:
-                    nresult.voltc = volt_magnitudes.pop(0)
-                else:
-                    print(f"Unexpected phase {phase} found in bus {bus}.")
-            node_results.append(nresult)
-        return node_results
+        """
+        One row per bus with the per-unit voltage of phases 1-3, node names have the form bus.phase
+        """
+        self.node_names, self.node_voltages = self.get_node_voltages()
+        phases = {'1': 'volta', '2': 'voltb', '3': 'voltc'}
+        node_results = {}
+        for node, vpu in zip(self.node_names, self.node_voltages):
+            bus, _, phase = node.rpartition('.')
+            nresult = node_results.get(bus)
+            if nresult is None:
+                nresult = node_results[bus] = PfResultNode(name=bus, circuit=self.circuit_id)
+            if phase in phases:
+                setattr(nresult, phases[phase], vpu)
+        return list(node_results.values())
+
+    def get_element_losses(self):
+        """
+        Losses of all power delivery elements as arrays (class, name, kW, kvar), taken from the circuit-wide loss
+        array in one call. Regulators are transformers in OpenDSS and are reported with them.
+        """
+        names = np.asarray(self.dss.Circuit.AllElementNames(), dtype=object)
+        losses = np.asarray(self.dss.Circuit.AllElementLosses())
+        if not np.iscomplexobj(losses):
+            losses = losses.reshape(-1, 2) @ np.array([1, 1j])
+        pd = np.isin(np.char.lower(names.astype(str)), np.char.lower(np.asarray(self.dss.PDElements.AllNames(), dtype=str)))
+        names, losses = names[pd].astype(str), losses[pd]
+        split = np.char.partition(names, '.').reshape(-1, 3)
+        return split[:, 0], split[:, 2], losses.real, losses.imag
+
+    def get_losses(self):
+        """
+        Total circuit losses in kW and kvar
+        """
+        watts, var_losses = self.dss.Circuit.Losses()[:2]
+        return watts / 1000, var_losses / 1000
 
     def get_line_results(self):
         ret = []
-        dss.Lines.First()
+        self.dss.Lines.First()
         while True:
-            dss.Circuit.SetActiveElement(dss.Lines.Name())
-            line = PfResultLine(name=dss.Lines.Name(),circuit=self.circuit_id, imax=-10000.0)
-            line.normal_rating=dss.CktElement.NormalAmps()
-            line.emergency_rating=dss.CktElement.EmergAmps()
-            currents_mags_angles = dss.CktElement.CurrentsMagAng()
-            powers = dss.CktElement.Powers()
+            self.dss.Circuit.SetActiveElement(self.dss.Lines.Name())
+            line = PfResultLine(name=self.dss.Lines.Name(),circuit=self.circuit_id, imax=-10000.0)
+            line.normal_rating=self.dss.CktElement.NormalAmps()
+            line.emergency_rating=self.dss.CktElement.EmergAmps()
+            currents_mags_angles = self.dss.CktElement.CurrentsMagAng()
+            powers = self.dss.CktElement.Powers()
             buses = {}
-            for i, bus in enumerate(dss.CktElement.BusNames()):
+            for i, bus in enumerate(self.dss.CktElement.BusNames()):
                 buses[bus] = {'kw': 0.0,'kvar': 0.0}
-                for phase in range(1,dss.CktElement.NumConductors()+1):
+                for phase in range(1,self.dss.CktElement.NumConductors()+1):
                     mag = currents_mags_angles.pop(0)
                     ang = currents_mags_angles.pop(0)
                     kw = powers.pop(0)
@@ -157,10 +278,10 @@ class SimulationManager:
                     line.imax = max(line.imax, mag)
                     buses[bus]['kw'] += kw
                     buses[bus]['kvar'] += kvar
-            line.loading_percent= line.imax / dss.CktElement.NormalAmps()
-            line.kw = buses[dss.CktElement.BusNames()[0]]['kw']
-            line.kvar = buses[dss.CktElement.BusNames()[0]]['kvar']
+            line.loading_percent= line.imax / self.dss.CktElement.NormalAmps()
+            line.kw = buses[self.dss.CktElement.BusNames()[0]]['kw']
+            line.kvar = buses[self.dss.CktElement.BusNames()[0]]['kvar']
             ret.append(line)
-            if not dss.Lines.Next() > 0:
+            if not self.dss.Lines.Next() > 0:
                 break
         return ret
\ No newline at end of file
@@ -0,0 +1,182 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+from opendss_powerflow_service.app.config.config import settings
+
+DTYPE = np.float32
+META_FILE = 'meta.json'
+
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+class TimeseriesWriter:
+    """
+    Appends one row per time step to a float32 file per quantity, rows are laid out time x element so a step is a
+    single sequential write and only the current step is held in memory
+    """
+
+    def __init__(self, path, quantities, flush_every=24, **meta):
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        self.meta = dict(meta, steps=0, complete=False, dtype=np.dtype(DTYPE).str, quantities={})
+        self._files = {}
+        for quantity, elements in quantities.items():
+            self.meta['quantities'][quantity] = {'file': f'{quantity}.f32', 'elements': list(elements)}
+            self._files[quantity] = open(os.path.join(path, f'{quantity}.f32'), 'wb')
+        _write_meta(path, self.meta)
+
+    def append(self, values):
+        for quantity, f in self._files.items():
+            row = np.asarray(values[quantity], dtype=DTYPE)
+            n_elements = len(self.meta['quantities'][quantity]['elements'])
+            if row.shape != (n_elements,):
+                raise ValueError(f"{quantity} step has {row.size} values, expected {n_elements}")
+            f.write(row.tobytes())
+        self.meta['steps'] += 1
+        if self.meta['steps'] % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+        # readers only trust the step count in the metadata, so it is written after the data
+        _write_meta(self.path, self.meta)
+
+    def close(self, complete=True):
+        self.meta['complete'] = complete
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+
+def stitch(path, part_paths, **meta):
+    """
+    Concatenate runs stored in part_paths, in order, into one run at path. The parts must record the same elements.
+    """
+    parts = [TimeseriesReader(p) for p in part_paths]
+    quantities = parts[0].meta['quantities']
+    for part in parts[1:]:
+        for quantity, info in quantities.items():
+            if part.elements(quantity) != info['elements']:
+                raise ValueError(f"{part.path} records different {quantity} elements than {parts[0].path}")
+    os.makedirs(path, exist_ok=True)
+    for quantity, info in quantities.items():
+        row_bytes = len(info['elements']) * np.dtype(DTYPE).itemsize
+        with open(os.path.join(path, info['file']), 'wb') as out:
+            for part in parts:
+                with open(os.path.join(part.path, info['file']), 'rb') as f:
+                    # copy only the rows the part committed in its metadata
+                    remaining = part.steps * row_bytes
+                    while remaining > 0:
+                        block = f.read(min(remaining, 1 << 24))
+                        if not block:
+                            raise ValueError(f"{part.path} is shorter than its metadata")
+                        out.write(block)
+                        remaining -= len(block)
+    meta = dict(meta, steps=sum(p.steps for p in parts), complete=all(p.meta['complete'] for p in parts),
+                dtype=np.dtype(DTYPE).str, quantities=quantities)
+    _write_meta(path, meta)
+    return TimeseriesReader(path)
+
+
+class TimeseriesReader:
+    """
+    Windowed reads over a stored run, the arrays are memory mapped so only the requested rows are paged in
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._element_index = {}
+
+    @property
+    def steps(self):
+        return self.meta['steps']
+
+    @property
+    def quantities(self):
+        return list(self.meta['quantities'])
+
+    def elements(self, quantity):
+        return self.meta['quantities'][quantity]['elements']
+
+    def element_ids(self, quantity, names):
+        index = self._element_index.get(quantity)
+        if index is None:
+            index = self._element_index[quantity] = {n: i for i, n in enumerate(self.elements(quantity))}
+        missing = [n for n in names if n not in index]
+        if missing:
+            raise KeyError(f"Unknown {quantity} elements: {', '.join(missing[:10])}")
+        return np.array([index[n] for n in names], dtype=np.int64)
+
+    def array(self, quantity):
+        info = self.meta['quantities'][quantity]
+        shape = (self.steps, len(info['elements']))
+        if self.steps == 0 or shape[1] == 0:
+            return np.zeros(shape, dtype=DTYPE)
+        return np.memmap(os.path.join(self.path, info['file']), dtype=DTYPE, mode='r', shape=shape)
+
+    def window(self, quantity, start=0, stop=None, elements=None):
+        """
+        Values for steps [start, stop) of the given elements (all when None), shape steps x elements
+        """
+        data = self.array(quantity)
+        start, stop, _ = slice(start, stop).indices(self.steps)
+        rows = data[start:stop]
+        if elements is not None:
+            rows = rows[:, self.element_ids(quantity, elements)]
+        return np.array(rows)
+
+
+class TimeseriesStore:
+    """
+    One directory per time-series run under the store root
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.TIMESERIES_STORE_DIR
+
+    def run_path(self, run_id):
+        return os.path.join(self.root, str(run_id))
+
+    def writer(self, run_id, quantities, **meta):
+        return TimeseriesWriter(self.run_path(run_id), quantities, run_id=run_id, **meta)
+
+    def reader(self, run_id):
+        path = self.run_path(run_id)
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        return TimeseriesReader(path)
+
+    def run_ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(i) for i in os.listdir(self.root) if i.isdigit())
+
+    def drop_before(self, run_id):
+        dropped = []
+        for i in self.run_ids():
+            if i < run_id:
+                shutil.rmtree(self.run_path(i), ignore_errors=True)
+                dropped.append(i)
+        return dropped
+
+
+timeseries_store = TimeseriesStore()
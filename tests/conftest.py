@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """
+    Session on the Postgres database in TEST_DATABASE_URL (postgresql+psycopg://...), rolled back after the test.
+    Tests using it are skipped when no database is configured.
+    """
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    from sqlmodel import SQLModel, Session, create_engine
+    import opendss_powerflow_service.models.circuit  # noqa: F401, registers the tables
+    import opendss_powerflow_service.models.result  # noqa: F401
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+        session.rollback()
+    engine.dispose()
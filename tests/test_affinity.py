@@ -0,0 +1,20 @@
+from opendss_powerflow_service.app.core.affinity import HashRing
+
+
+def test_lookup_is_deterministic():
+    ring = HashRing(['w1', 'w2', 'w3'])
+    other = HashRing(['w3', 'w1', 'w2'])
+    keys = [f'circuit_{i}' for i in range(200)]
+    assert [ring.lookup(k) for k in keys] == [other.lookup(k) for k in keys]
+    assert set(ring.lookup(k) for k in keys) == {'w1', 'w2', 'w3'}
+
+def test_empty_ring():
+    assert HashRing().lookup('circuit') is None
+
+def test_adding_a_member_only_moves_keys_to_it():
+    keys = [f'circuit_{i}' for i in range(1000)]
+    before = HashRing(['w1', 'w2', 'w3'])
+    after = HashRing(['w1', 'w2', 'w3', 'w4'])
+    moved = [k for k in keys if before.lookup(k) != after.lookup(k)]
+    assert all(after.lookup(k) == 'w4' for k in moved)
+    assert 0 < len(moved) < len(keys) / 2
@@ -0,0 +1,53 @@
+import pytest
+from sqlmodel import select, func
+
+from opendss_powerflow_service.models.columnar import ColumnarCircuit
+from opendss_powerflow_service.models.components import LineCode, Line
+from opendss_powerflow_service.models.modelCRUD import SqlCircuitModelCRUD, LineCodeConflictError
+
+
+def circuit_json(n_lines=3):
+    return {
+        'fields': {'substation': 'test'},
+        'sources': [{'name': 'source', 'bus1': 'b0', 'pu': '1.0', 'basekv': 12.47}],
+        'linecodes': [{'name': 'test_lc_a', 'units': 'km', 'nphases': '3'},
+                      {'name': 'test_lc_b', 'units': 'km', 'nphases': '1'}],
+        'lines': [{'name': f'l{i}', 'bus1': f'b{i - 1}', 'bus2': f'b{i}', 'linecode': 'test_lc_a', 'phases': 3}
+                  for i in range(1, n_lines + 1)],
+    }
+
+def _count(db, model, *where):
+    return db.execute(select(func.count()).select_from(model).where(*where)).scalar_one()
+
+def test_update_bulk_keeps_linecode_library(db):
+    crud = SqlCircuitModelCRUD(db)
+    crud.create_bulk(ColumnarCircuit.from_json('test_bulk', circuit_json()), 'test_bulk')
+    linecodes = _count(db, LineCode, LineCode.name.in_(['test_lc_a', 'test_lc_b']))
+    assert linecodes == 2
+    for _ in range(2):
+        crud.update_bulk(ColumnarCircuit.from_json('test_bulk', circuit_json()), 'test_bulk')
+    assert _count(db, LineCode, LineCode.name.in_(['test_lc_a', 'test_lc_b'])) == linecodes
+    assert _count(db, Line, Line.circuit == 'test_bulk') == 3
+    assert crud.read_version('test_bulk') == 3
+
+def test_linecodes_shared_between_circuits(db):
+    crud = SqlCircuitModelCRUD(db)
+    crud.create_bulk(ColumnarCircuit.from_json('test_bulk_a', circuit_json()), 'test_bulk_a')
+    crud.create_bulk(ColumnarCircuit.from_json('test_bulk_b', circuit_json()), 'test_bulk_b')
+    assert _count(db, LineCode, LineCode.name.in_(['test_lc_a', 'test_lc_b'])) == 2
+
+def test_changed_linecode_is_rejected(db):
+    crud = SqlCircuitModelCRUD(db)
+    crud.create_bulk(ColumnarCircuit.from_json('test_bulk_a', circuit_json()), 'test_bulk_a')
+    changed = circuit_json()
+    changed['linecodes'][0]['nphases'] = '1'
+    with pytest.raises(LineCodeConflictError) as e:
+        crud.create_bulk(ColumnarCircuit.from_json('test_bulk_b', changed), 'test_bulk_b')
+    assert e.value.names == ['test_lc_a']
+
+def test_circuit_reads_only_referenced_linecodes(db):
+    crud = SqlCircuitModelCRUD(db)
+    crud.create_bulk(ColumnarCircuit.from_json('test_bulk', circuit_json()), 'test_bulk')
+    circuit = ColumnarCircuit.from_db(db, 'test_bulk')
+    assert circuit.column('linecodes', 'name').tolist() == ['test_lc_a']
+    assert [i.name for i in crud.read('test_bulk', include=['linecodes']).linecodes] == ['test_lc_a']
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from opendss_powerflow_service.models.columnar import StringTable, ColumnarCircuit, CircuitSchemaError
+
+
+def test_string_table_interns_once():
+    strings = StringTable()
+    codes = [strings.intern(v) for v in ('b1', 'b2', 'b1', None, 3)]
+    assert codes == [0, 1, 0, -1, 2]
+    assert strings.values == ['b1', 'b2', '3']
+    assert strings.lookup(1) == 'b2' and strings.lookup(-1) is None
+    assert strings.decode(np.array(codes)).tolist() == ['b1', 'b2', 'b1', None, '3']
+
+def test_from_json_columns():
+    circuit = ColumnarCircuit.from_json('c1', {
+        'lines': [{'name': 'l1', 'bus1': 'b1', 'bus2': 'b2', 'length': '0.5', 'phases': 3},
+                  {'name': 'l2', 'bus1': 'b2', 'bus2': 'b3'}],
+    })
+    assert circuit.column('lines', 'bus1').tolist() == ['b1', 'b2']
+    np.testing.assert_array_equal(circuit.column('lines', 'length'), [0.5, np.nan])
+    assert circuit.column('lines', 'phases').tolist() == [3, -1]
+    assert circuit.column('lines', 'circuit').tolist() == ['c1', 'c1']
+    # the bus shared by both lines is stored once
+    assert circuit.strings.values.count('b2') == 1
+    assert list(circuit.records('lines', ['name', 'length'])) == [('l1', 0.5), ('l2', None)]
+
+def test_from_json_reports_every_error():
+    with pytest.raises(CircuitSchemaError) as e:
+        ColumnarCircuit.from_json('c1', {
+            'lines': [{'name': 'l1', 'length': 'long'}],
+            'generators': [],
+            'loads': {'name': 'ld1'},
+            'buses': [{'name': 'b1', 'colour': 'red'}],
+        })
+    errors = e.value.errors
+    assert len(errors) == 4
+    assert errors[0].startswith('lines.length:')
+    assert errors[1:] == ['generators: not a component class', 'loads: expected a list of objects',
+                          'buses: unknown attributes colour']
+    assert isinstance(e.value, ValueError)
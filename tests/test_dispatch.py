@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from celery import states
+
+from opendss_powerflow_service.app.config.config import settings
+from opendss_powerflow_service.app.core import dispatch
+
+
+class FakeResult:
+    state = states.PENDING
+
+    def __init__(self, task_id, app=None):
+        self.task_id = task_id
+
+
+@pytest.fixture
+def task_state(monkeypatch):
+    def set_state(state):
+        monkeypatch.setattr(FakeResult, 'state', state)
+    monkeypatch.setattr(dispatch, 'AsyncResult', FakeResult)
+    return set_state
+
+@pytest.mark.parametrize('state, live', [
+    (states.RECEIVED, True),
+    (states.STARTED, True),
+    (states.RETRY, True),
+    (states.SUCCESS, False),
+    (states.FAILURE, False),
+    (states.REVOKED, False),
+])
+def test_task_states(task_state, state, live):
+    task_state(state)
+    assert dispatch._is_live('t1', time.time(), ttl=600) is live
+
+def test_pending_is_live_within_the_grace_window(task_state):
+    task_state(states.PENDING)
+    grace = settings.INFLIGHT_PENDING_GRACE_SECONDS
+    assert dispatch._is_live('t1', time.time() - grace / 2, ttl=grace * 10)
+    assert not dispatch._is_live('t1', time.time() - grace * 2, ttl=grace * 10)
+
+def test_started_task_expires_with_the_entry(task_state):
+    task_state(states.STARTED)
+    assert not dispatch._is_live('t1', time.time() - 700, ttl=600)
+
+def test_local_registry_coalesces_live_tasks(task_state):
+    task_state(states.STARTED)
+    registry = dispatch.LocalInFlightRegistry(ttl=600)
+    assert registry.claim('key', 't1') is None
+    assert registry.claim('key', 't2') == 't1'
+    registry.release('t1')
+    assert registry.claim('key', 't3') is None
+    task_state(states.SUCCESS)
+    assert registry.claim('key', 't4') is None
@@ -0,0 +1,39 @@
+import os
+from collections import namedtuple
+
+from opendss_powerflow_service.simulation.dss_export import _write_model
+
+SourceRow = namedtuple('SourceRow', 'bus1 pu basekv r1 x1')
+LineRow = namedtuple('LineRow', 'name units length bus1 bus2 switch enabled phases linecode')
+BusRow = namedtuple('BusRow', 'name x y')
+
+
+def model_rows(length=0.1):
+    data = {
+        'sources': [SourceRow('b0', 1.0, 12.47, 0.1, 0.3)],
+        'lines': [LineRow('l1', 'km', length, 'b0', 'b1', 'n', 'y', 3, 'lc1')],
+        'buses': [BusRow('b0', 0.0, 0.0), BusRow('b1', 1.0, None)],
+    }
+    return lambda attr: iter(data.get(attr, []))
+
+def export(path, rows):
+    os.makedirs(path)
+    return _write_model(str(path), 'c1', rows)
+
+def test_write_model_files(tmp_path):
+    digest, counts = export(tmp_path / 'a', model_rows())
+    assert counts == {'linecodes': 0, 'lines': 1, 'transformers': 0, 'capacitors': 0, 'loadshapes': 0, 'loads': 0,
+                      'buses': 1}
+    assert sorted(os.listdir(tmp_path / 'a')) == ['BusCoords.dss', 'Lines.dss', 'Master.dss']
+    master = (tmp_path / 'a' / 'Master.dss').read_text().splitlines()
+    assert master[0] == 'Clear'
+    assert master[1].startswith('New circuit.c1 bus1=b0 ')
+    assert master[2:] == ['Redirect Lines.dss', 'Buscoords BusCoords.dss']
+    assert len(digest) == 64
+
+def test_digest_follows_content(tmp_path):
+    first, _ = export(tmp_path / 'a', model_rows())
+    same, _ = export(tmp_path / 'b', model_rows())
+    changed, _ = export(tmp_path / 'c', model_rows(length=0.2))
+    assert first == same
+    assert changed != first
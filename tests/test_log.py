@@ -0,0 +1,39 @@
+import json
+import queue
+import logging
+
+from opendss_powerflow_service.utils.log import RecordQueueHandler, JsonFormatter, ContextFilter, log_context
+
+
+def queued_logger(name):
+    records = queue.SimpleQueue()
+    handler = RecordQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    return logger, records
+
+def test_exception_survives_the_queue():
+    logger, records = queued_logger('test_log.exception')
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("solve %s failed", 'c1')
+    entry = json.loads(JsonFormatter().format(records.get_nowait()))
+    assert entry['message'] == 'solve c1 failed'
+    assert 'ZeroDivisionError' in entry['exception']
+    assert 'Traceback' not in entry['message']
+
+def test_context_is_reset():
+    logger, records = queued_logger('test_log.context')
+    with log_context(circuit_id='c1', run_id=None):
+        with log_context(run_id=7):
+            logger.info('inner')
+        logger.info('outer')
+    logger.info('after')
+    entries = [json.loads(JsonFormatter().format(records.get_nowait())) for _ in range(3)]
+    assert (entries[0]['circuit_id'], entries[0]['run_id']) == ('c1', 7)
+    assert entries[1]['circuit_id'] == 'c1' and 'run_id' not in entries[1]
+    assert 'circuit_id' not in entries[2]
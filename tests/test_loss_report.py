@@ -0,0 +1,20 @@
+import pytest
+
+from opendss_powerflow_service.simulation.loss_report import loss_totals
+
+
+def test_totals_by_class():
+    classes = ['Line', 'Transformer', 'Line', 'Line', 'Capacitor']
+    kw = [1.5, 4.0, 0.5, 2.0, 0.0]
+    kvar = [0.3, 2.0, 0.1, 0.6, -50.0]
+    totals = loss_totals(classes, kw, kvar)
+    assert totals['kw'] == pytest.approx(8.0)
+    assert totals['kvar'] == pytest.approx(-47.0)
+    assert totals['by_class'] == {
+        'Capacitor': {'elements': 1, 'kw': 0.0, 'kvar': -50.0},
+        'Line': {'elements': 3, 'kw': pytest.approx(4.0), 'kvar': pytest.approx(1.0)},
+        'Transformer': {'elements': 1, 'kw': 4.0, 'kvar': 2.0},
+    }
+
+def test_no_elements():
+    assert loss_totals([], [], []) == {'kw': 0.0, 'kvar': 0.0, 'by_class': {}}
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from opendss_powerflow_service.simulation.parallel_qsts import plan_chunks, boundary_deviation
+from opendss_powerflow_service.simulation.timeseries_store import TimeseriesWriter
+
+
+@pytest.mark.parametrize('steps, chunks', [(8760, 4), (10, 3), (7, 7), (5, 8), (1, 2)])
+def test_plan_chunks_covers_the_horizon(steps, chunks):
+    plan = plan_chunks(steps, chunks)
+    assert len(plan) == min(steps, chunks)
+    assert plan[0][0] == 0 and plan[-1][1] == steps
+    assert all(a[1] == b[0] for a, b in zip(plan, plan[1:]))
+    lengths = [stop - first for first, stop in plan]
+    assert min(lengths) >= 1 and max(lengths) - min(lengths) <= 1
+
+def test_plan_chunks_without_steps():
+    assert plan_chunks(0, 4) == []
+
+def test_boundary_deviation(tmp_path):
+    quantities = {'voltage': ['b1.1', 'b2.1']}
+    part_paths = [str(tmp_path / str(i)) for i in range(3)]
+    first_rows = ([1.0, 1.0], [0.99, 1.01], [1.02, 0.98])
+    for path, row in zip(part_paths, first_rows):
+        with TimeseriesWriter(path, quantities) as writer:
+            writer.append({'voltage': row})
+            writer.append({'voltage': [0.0, 0.0]})
+    results = [
+        {'stop': 2, 'boundary': {'voltage': np.array([0.99, 1.0], dtype=np.float32)}},
+        {'stop': 4, 'boundary': {'voltage': np.array([1.02, 0.98], dtype=np.float32)}},
+        {'stop': 6, 'boundary': None},
+    ]
+    deviation = boundary_deviation(results, part_paths)
+    assert [d['step'] for d in deviation] == [2, 4]
+    assert deviation[0]['voltage']['max_abs'] == pytest.approx(0.01, abs=1e-6)
+    assert deviation[0]['voltage']['mean_abs'] == pytest.approx(0.005, abs=1e-6)
+    assert deviation[1]['voltage'] == {'max_abs': 0.0, 'mean_abs': 0.0}
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from opendss_powerflow_service.models.params import ProbabilisticParams
+from opendss_powerflow_service.simulation.probabilistic import StreamingStats
+
+
+def test_merge_matches_single_pass():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(1.0, 0.03, size=(250, 4))
+    single = StreamingStats(4)
+    for block in np.array_split(samples, 5):
+        single.update(block)
+    left, right = StreamingStats(4), StreamingStats(4)
+    left.update(samples[:90])
+    right.update(samples[90:170])
+    right.update(samples[170:])
+    merged = left.merge(right)
+    assert merged.count == single.count == 250
+    np.testing.assert_allclose(merged.mean, samples.mean(axis=0))
+    np.testing.assert_allclose(merged.std(), samples.std(axis=0, ddof=1))
+    np.testing.assert_array_equal(merged.min, samples.min(axis=0))
+    np.testing.assert_array_equal(merged.max, samples.max(axis=0))
+    np.testing.assert_array_equal(merged.hist, single.hist)
+    np.testing.assert_array_equal(merged.violations, ((samples < 0.95) | (samples > 1.05)).sum(axis=0))
+
+def test_merge_empty_is_identity():
+    stats = StreamingStats(2)
+    stats.update([[1.0, 1.02], [0.98, 0.9]])
+    mean = stats.mean.copy()
+    assert stats.merge(StreamingStats(2)) is stats
+    assert stats.count == 2
+    np.testing.assert_array_equal(stats.mean, mean)
+    empty = StreamingStats(2).merge(stats)
+    np.testing.assert_allclose(empty.mean, mean)
+
+def test_quantile_within_a_bin():
+    samples = np.linspace(0.9, 1.1, 1001)[:, None]
+    stats = StreamingStats(1)
+    stats.update(samples)
+    width = (stats.hi - stats.lo) / stats.bins
+    assert abs(stats.quantile(0.5)[0] - 1.0) <= width
+    assert abs(stats.quantile(0.1)[0] - np.quantile(samples, 0.1)) <= width
+
+@pytest.mark.parametrize('params', [{'samples': 0}, {'load_std': -0.1}, {'processes': 0}])
+def test_params_bounds(params):
+    with pytest.raises(ValidationError):
+        ProbabilisticParams(**params)
@@ -0,0 +1,33 @@
+import contextlib
+
+import pytest
+
+from opendss_powerflow_service.app.core.result_cache import ResultCache
+from opendss_powerflow_service.models.params import params_hash
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.added = []
+
+    def begin_nested(self):
+        return contextlib.nullcontext()
+
+    def add(self, entry):
+        self.added.append(entry)
+
+
+@pytest.mark.parametrize('converged', [False, 'False', 'false', '0', 0, None])
+def test_non_converged_runs_are_not_stored(converged):
+    db = FakeSession()
+    ResultCache(db).store('c1', 3, {'outputs': ['voltage']}, 42, converged)
+    assert db.added == []
+
+@pytest.mark.parametrize('converged', [True, 'True', 1])
+def test_converged_runs_are_stored(converged):
+    db = FakeSession()
+    ResultCache(db).store('c1', 3, {'outputs': ['voltage']}, 42, converged)
+    [entry] = db.added
+    assert (entry.circuit, entry.version, entry.run_id) == ('c1', 3, 42)
+    assert entry.params_hash == params_hash({'outputs': ['voltage']})
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from opendss_powerflow_service.simulation.result_compare import compare_arrays
+
+QUANTITIES = ('volta', 'voltb')
+
+
+def test_top_n_ranks_by_largest_delta():
+    names_a = np.array(['n1', 'n2', 'n3', 'n4', 'only_a'], dtype=object)
+    values_a = np.array([[1.0, 1.0], [1.0, 1.0], [1.0, 1.0], [1.0, 1.0], [1.0, 1.0]])
+    names_b = np.array(['n4', 'n3', 'n2', 'n1', 'only_b'], dtype=object)
+    values_b = np.array([[1.0, 0.97], [1.05, 1.0], [1.0, np.nan], [1.01, 1.0], [0.0, 0.0]])
+    ret = compare_arrays(names_a, values_a, names_b, values_b, QUANTITIES, top_n=2)
+    assert (ret['matched'], ret['only_in_a'], ret['only_in_b']) == (4, 1, 1)
+    assert [t['name'] for t in ret['top']] == ['n3', 'n4']
+    assert ret['top'][1]['delta']['voltb'] == pytest.approx(-0.03)
+    assert ret['max_abs_delta']['volta'] == pytest.approx(0.05)
+    assert ret['top'][0]['b'] == {'volta': 1.05, 'voltb': 1.0}
+
+def test_nan_deltas_rank_last():
+    names = np.array(['n1', 'n2'], dtype=object)
+    values_a = np.array([[1.0, 1.0], [1.0, 1.0]])
+    values_b = np.array([[np.nan, np.nan], [1.0, 1.0]])
+    ret = compare_arrays(names, values_a, names, values_b, QUANTITIES, top_n=5)
+    assert [t['name'] for t in ret['top']] == ['n2', 'n1']
+    assert ret['top'][1]['delta'] == {'volta': None, 'voltb': None}
+
+def test_no_common_elements():
+    ret = compare_arrays(np.array(['a'], dtype=object), np.ones((1, 2)), np.array(['b'], dtype=object), np.ones((1, 2)),
+                         QUANTITIES)
+    assert ret['matched'] == 0 and ret['top'] == []
+    assert ret['max_abs_delta'] == {'volta': None, 'voltb': None}
+
+def test_negative_top_n_lists_nothing():
+    names = np.array(['n1', 'n2'], dtype=object)
+    ret = compare_arrays(names, np.ones((2, 2)), names, np.zeros((2, 2)), QUANTITIES, top_n=-1)
+    assert ret['top'] == []
+    assert ret['matched'] == 2
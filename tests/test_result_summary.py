@@ -0,0 +1,33 @@
+import numpy as np
+
+from opendss_powerflow_service.models.result import PfResultLine
+from opendss_powerflow_service.simulation.result_summary import summarize_run
+
+
+def lines(loadings):
+    return [PfResultLine(name=f'l{i}', loading_percent=loading) for i, loading in enumerate(loadings)]
+
+def test_summary_of_synthetic_run():
+    pf_fields = {'circuit': 'c1', 'run_timestamp': '2026-01-01 00:00:00', 'converged': True}
+    names = ['b1.1', 'b1.2', 'b2.1', 'b3.1', 'off.1']
+    voltages = [1.02, 1.06, 0.93, 0.97, 0.0]
+    summary = summarize_run(7, pf_fields, names, voltages, lines([0.5, 1.2, None, np.inf, 1.01]), (12.5, 3.25))
+    assert (summary.run_id, summary.circuit, summary.converged) == (7, 'c1', True)
+    # the de-energized node is left out
+    assert summary.nodes == 4
+    assert (summary.min_pu_node, summary.min_pu_voltage) == ('b2.1', 0.93)
+    assert (summary.max_pu_node, summary.max_pu_voltage) == ('b1.2', 1.06)
+    assert (summary.undervoltage_nodes, summary.overvoltage_nodes) == (1, 1)
+    assert summary.overloaded_lines == 2
+    assert (summary.worst_line, summary.worst_line_loading) == ('l1', 1.2)
+    assert (summary.total_losses_kw, summary.total_losses_kvar) == (12.5, 3.25)
+
+def test_violation_limits_come_from_the_request():
+    summary = summarize_run(1, {}, ['b1.1', 'b2.1'], [0.96, 1.04], [], (0.0, 0.0), vmin=0.97, vmax=1.03)
+    assert (summary.undervoltage_nodes, summary.overvoltage_nodes) == (1, 1)
+    assert (summary.vmin, summary.vmax) == (0.97, 1.03)
+
+def test_empty_run():
+    summary = summarize_run(1, {}, [], [], lines([None]), (0.0, 0.0))
+    assert summary.nodes == 0
+    assert summary.min_pu_node is None and summary.worst_line is None
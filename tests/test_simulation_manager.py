@@ -0,0 +1,26 @@
+import pytest
+
+dss = pytest.importorskip('opendssdirect')
+
+from opendss_powerflow_service.simulation.simulation_manager import SimulationManager  # noqa: E402
+
+FEEDER = [
+    'clear',
+    'New circuit.test bus1=src pu=1.0 basekv=12.47 r1=0.1 x1=0.3 r0=0.1 x0=0.3',
+    'New Line.l1 bus1=src bus2=b1 length=3 units=km r1=0.4 x1=0.5 r0=0.6 x0=1.2 c1=0 c0=0',
+    'New Line.l2 bus1=b1 bus2=b2 length=3 units=km r1=0.4 x1=0.5 r0=0.6 x0=1.2 c1=0 c0=0',
+    'New Load.ld1 bus1=b1 kV=12.47 kW=2500 kvar=800 model=1',
+    'New Load.ld2 bus1=b2 kV=12.47 kW=2500 kvar=800 model=1',
+]
+
+
+def test_cold_solves_restart_from_zero_load():
+    simulation = SimulationManager('test', {})
+    simulation.load_commands(FEEDER)
+    cold = simulation.run_powerflow(warm_start=False)
+    warm = simulation.run_powerflow(warm_start=True)
+    cold_again = simulation.run_powerflow(warm_start=False)
+    assert cold['converged'] and warm['converged'] and cold_again['converged']
+    assert warm['total_iterations'] < cold['total_iterations']
+    assert cold_again['total_iterations'] == cold['total_iterations']
+    assert (cold['warm_start'], warm['warm_start']) == (False, True)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from opendss_powerflow_service.models.topology import TopologyGraph, bus_key
+
+# source - b1 - t1 - b2 - b3, b2 - b4, b5 - b6 is an island
+BRANCHES = [
+    ('l1', 'line', 'src.1.2.3', 'b1.1.2.3'),
+    ('t1', 'transformer', 'b1', 'b2'),
+    ('l2', 'line', 'b2.1', 'b3.1'),
+    ('l3', 'line', 'b4', 'B2'),
+    ('l4', 'line', 'b5', 'b6'),
+    ('open', 'line', 'b6', None),
+]
+
+
+def graph():
+    return TopologyGraph(BRANCHES, root='src')
+
+def test_bus_key():
+    assert bus_key('Bus1.1.2') == 'bus1'
+    assert bus_key(None) is None
+
+def test_csr_adjacency():
+    g = graph()
+    assert g.n_buses == 7
+    assert g.n_branches == 5
+    assert g.indptr[-1] == 2 * g.n_branches
+    b2 = g.bus_index['b2']
+    assert sorted(g.bus_names[i] for i in g.neighbors(b2)) == ['b1', 'b3', 'b4']
+    for v in range(g.n_buses):
+        for k in range(g.indptr[v], g.indptr[v + 1]):
+            e = g.edge_ids[k]
+            assert {g.branch_from[e], g.branch_to[e]} == {v, g.indices[k]}
+
+def test_connectivity():
+    g = graph()
+    assert not g.is_connected()
+    assert sorted(g.disconnected_buses()) == ['b5', 'b6']
+    assert TopologyGraph(BRANCHES[:4], root='src').is_connected()
+
+def test_upstream_and_downstream():
+    g = graph()
+    assert g.upstream('b3') == (['b3', 'b2', 'b1', 'src'], ['l2', 't1', 'l1'])
+    assert sorted(g.downstream('b2')) == ['b2', 'b3', 'b4']
+    assert g.downstream('b5') == []
+
+def test_propagate():
+    g = graph()
+    to_values = np.array([np.nan, 0.48, np.nan, np.nan, np.nan])
+    kv = g.propagate(12.47, to_values=to_values)
+    expected = {'src': 12.47, 'b1': 12.47, 'b2': 0.48, 'b3': 0.48, 'b4': 0.48}
+    for bus, value in expected.items():
+        assert kv[g.bus_index[bus]] == value
+    assert np.isnan(kv[g.bus_index['b5']])
+    # l3 is listed against the flow, its from side is the downstream bus
+    from_values = np.array([np.nan, np.nan, np.nan, 0.24, np.nan])
+    kv = g.propagate(12.47, from_values=from_values)
+    assert kv[g.bus_index['b4']] == 0.24
+    assert kv[g.bus_index['b3']] == 12.47
+
+def test_aggregate_by_section():
+    g = graph()
+    load = g.bus_values(['b3.1', 'b4', 'b1', 'unknown'], [10.0, 5.0, 2.0, 100.0])
+    np.testing.assert_array_equal(g.aggregate_by_section(['b2', 'src'], load), [15.0, 2.0])
@@ -0,0 +1,69 @@
+import copy
+
+import pytest
+
+from opendss_powerflow_service.models.columnar import ColumnarCircuit
+from opendss_powerflow_service.models.validation import CircuitValidator, ModelValidationError, check_valid
+
+# src -l1- b1 -l2- b2 -t1- b3 with a single phase load on the secondary
+CIRCUIT = {
+    'sources': [{'name': 'source', 'bus1': 'src', 'pu': '1.0', 'basekv': 12.47}],
+    'linecodes': [{'name': 'LC1', 'units': 'km', 'nphases': '3'}],
+    'lines': [{'name': 'l1', 'bus1': 'src.1.2.3', 'bus2': 'b1.1.2.3', 'length': 0.1, 'phases': 3, 'linecode': 'lc1'},
+              {'name': 'l2', 'bus1': 'b1.1', 'bus2': 'b2.1', 'length': 0.1, 'phases': 1}],
+    'transformers': [{'name': 't1', 'bus_primary': 'b2', 'bus_secondary': 'b3', 'kva': 25.0, 'kv_primary': 7.2,
+                      'kv_secondary': 0.24, 'phases': 1}],
+    'loads': [{'name': 'ld1', 'bus': 'b3.1', 'kv': 0.24, 'kw': 5.0, 'kvar': 1.0, 'phases': 1}],
+}
+
+
+def validate(change=None, stored=None):
+    data = copy.deepcopy(CIRCUIT)
+    if change is not None:
+        change(data)
+    return CircuitValidator(ColumnarCircuit.from_json('c1', data), stored=stored).validate()
+
+def issues(report):
+    return {(i['code'], i['component'], tuple(i['names'])) for i in report.issues}
+
+def test_valid_circuit():
+    report = validate()
+    assert report.ok
+    assert report.issues == []
+    check_valid(report)
+
+@pytest.mark.parametrize('change, issue', [
+    (lambda d: d['sources'].clear(), ('no_source', 'sources', ('c1',))),
+    (lambda d: d['loads'][0].update(bus=None), ('missing_bus', 'loads', ('ld1',))),
+    (lambda d: d['lines'][1].update(linecode='nope'), ('unknown_linecode', 'lines', ('l2',))),
+    (lambda d: d['loads'][0].update(yearly='ls_0123'), ('unknown_loadshape', 'loads', ('ld1',))),
+    (lambda d: d['loads'][0].update(bus='b9'), ('dangling_bus', 'loads', ('ld1',))),
+    (lambda d: d['transformers'][0].update(phases=4), ('invalid_phases', 'transformers', ('t1',))),
+    (lambda d: d['loads'][0].update(bus='b3.1.2'), ('phase_mismatch', 'loads', ('ld1',))),
+    (lambda d: d['lines'][0].update(length=0.0), ('out_of_range', 'lines', ('l1',))),
+    (lambda d: d['transformers'][0].update(kva=None), ('missing_value', 'transformers', ('t1',))),
+    (lambda d: d['lines'].append({'name': 'l9', 'bus1': 'b7', 'bus2': 'b8', 'length': 0.1, 'phases': 3}),
+     ('disconnected', 'buses', ('b7', 'b8'))),
+    (lambda d: d['loads'][0].update(kv=12.47), ('kv_mismatch', 'loads', ('ld1',))),
+])
+def test_check_codes(change, issue):
+    report = validate(change)
+    assert issue in issues(report)
+    assert not report.ok
+    with pytest.raises(ModelValidationError):
+        check_valid(report)
+
+def test_kw_below_zero_is_a_warning():
+    report = validate(lambda d: d['loads'][0].update(kw=-1.0))
+    assert issues(report) == {('out_of_range', 'loads', ('ld1',))}
+    assert report.ok
+
+def test_line_to_neutral_kv_is_accepted():
+    assert validate(lambda d: d['loads'][0].update(kv=0.24 / 3 ** 0.5)).ok
+
+def test_stored_shared_components_resolve():
+    def change(d):
+        d['linecodes'].clear()
+        d['loads'][0]['yearly'] = 'LS_0123'
+    assert {i[0] for i in issues(validate(change))} == {'unknown_linecode', 'unknown_loadshape'}
+    assert validate(change, stored={'linecodes': {'lc1'}, 'loadshapes': {'ls_0123'}}).ok
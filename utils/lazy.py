@@ -0,0 +1,36 @@
+import sys
+import time
+import importlib
+import importlib.util
+
+
+def lazy_import(name):
+    """
+    Module object that is only executed on first attribute access, so processes that never use it (the API) do
+    not pay for importing it
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def load_modules(names):
+    """
+    Import the modules now, including ones registered lazily, and return the seconds spent on each
+    """
+    timings = {}
+    for name in names:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        # touching an attribute executes a lazily registered module
+        getattr(module, '__file__', None)
+        timings[name] = time.perf_counter() - start
+    return timings
@@ -1,19 +1,166 @@
-import logging
 import os
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+from opendss_powerflow_service.app.config.config import settings
 
 LOGGING_DIR = os.path.join(os.path.expanduser('~'), 'opendss_powerflow_service', 'logs')
 
 if not os.path.exists(LOGGING_DIR):
     os.makedirs(LOGGING_DIR)
 
-def get_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+# Every service logger is a child of this one, the queue handler is attached here once
+ROOT_LOGGER = 'opendss_powerflow_service'
+
+# Run context stamped on every record emitted while it is set
+CONTEXT_FIELDS = ('circuit_id', 'task_id', 'run_id')
+_context = {field: contextvars.ContextVar(field, default=None) for field in CONTEXT_FIELDS}
+
+_lock = threading.Lock()
+_listener = None
+
+
+def set_context(**values):
+    """
+    Set context fields for the current thread or task, returns tokens for reset_context
+    """
+    return {field: _context[field].set(value) for field, value in values.items()}
+
+def reset_context(tokens):
+    for field, token in tokens.items():
+        _context[field].reset(token)
+
+@contextmanager
+def log_context(**values):
+    tokens = set_context(**values)
+    try:
+        yield
+    finally:
+        reset_context(tokens)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the run context onto the record, runs on the emitting thread where the context variables are visible
+    """
+
+    def filter(self, record):
+        for field, var in _context.items():
+            if not hasattr(record, field):
+                setattr(record, field, var.get())
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records logged with extra={'sampled': True}, meant for per-element debug messages
+    """
 
-    file_handler = logging.FileHandler(os.path.join(LOGGING_DIR, 'app.log'))
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare formats the record with a plain formatter and drops exc_info, so the JSON formatter on the
+    writer thread would never see the exception. The message is still merged here, the traceback is kept.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            # rendered on the emitting thread, the frames may change once it moves on
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+def _file_handler():
+    handler = logging.FileHandler(os.path.join(LOGGING_DIR, 'app.log'))
+    if settings.LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return handler
+
+def _start_listener():
+    """
+    Start the background writer thread. The queue is unbounded, so emitting a record never waits on the file.
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+    root.propagate = False
+    _listener = QueueListener(log_queue, _file_handler(), respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork():
+    # the writer thread does not survive a fork (prefork celery workers), the child starts its own
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        _start_listener()
+
+def stop_logging():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def get_logger(name):
+    """
+    Logger below the service root, the handlers are set up once per process however often this is called
+    """
+    with _lock:
+        if _listener is None:
+            _start_listener()
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
 
-    logger.addHandler(file_handler)
 
-    return logger
\ No newline at end of file
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
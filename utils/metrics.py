@@ -0,0 +1,237 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Component count upper bounds for the circuit size class label
+SIZE_CLASSES = (
+    ('small', 1000),
+    ('medium', 10000),
+    ('large', 100000),
+)
+
+
+def size_class(n_components):
+    """
+    Map a circuit component count onto a coarse size class label
+    """
+    if n_components is None:
+        return 'unknown'
+    for label, limit in SIZE_CLASSES:
+        if n_components < limit:
+            return label
+    return 'xlarge'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram with a fixed label set
+    """
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((k, str(labels.get(k, ''))) for k in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series['counts']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {series["sum"]}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {series["count"]}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """
+    Prometheus-style monotonically increasing counter with a fixed label set
+    """
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((k, str(labels.get(k, ''))) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple((k, str(labels.get(k, ''))) for k in self.labelnames)
+        return self._values.get(key, 0)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return '\n'.join(lines)
+
+
+class Gauge:
+    """
+    Prometheus-style gauge, either set directly or read from a collect callback returning {labels tuple: value}
+    """
+
+    def __init__(self, name, description, labelnames=(), collect=None):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple((k, str(labels.get(k, ''))) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge']
+        if self.collect is not None:
+            try:
+                for labels, value in self.collect().items():
+                    self.set(value, **dict(zip(self.labelnames, labels)))
+            except Exception:
+                # a failing collector (e.g. broker down) must not break the whole exposition
+                pass
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, labelnames, buckets)
+            return self._metrics[name]
+
+    def counter(self, name, description, labelnames=()):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, description, labelnames)
+            return self._metrics[name]
+
+    def gauge(self, name, description, labelnames=(), collect=None):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, description, labelnames, collect)
+            return self._metrics[name]
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(m.expose() for m in metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+powerflow_stage_seconds = registry.histogram(
+    'powerflow_stage_duration_seconds', 'Wall-clock duration of each powerflow pipeline stage',
+    labelnames=('stage', 'size_class'))
+
+crud_seconds = registry.histogram(
+    'crud_duration_seconds', 'Wall-clock duration of database CRUD operations',
+    labelnames=('operation',))
+
+
+class StageTimer:
+    """
+    Collects the wall-clock duration of the named stages of a single pipeline run
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def observe(self, n_components=None):
+        label = size_class(n_components)
+        for name, duration in self.durations.items():
+            powerflow_stage_seconds.observe(duration, stage=name, size_class=label)
+
+
+def timed(operation):
+    """
+    Decorator recording the duration of a CRUD call in the crud_duration_seconds histogram
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                crud_seconds.observe(time.perf_counter() - start, operation=operation)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.expose().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, addr='0.0.0.0'):
+    """
+    Serve /metrics from a daemon thread, used by the celery workers which have no HTTP server of their own
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server